@@ -2,17 +2,23 @@ import webbrowser
 from http.server import ThreadingHTTPServer
 
 from src.bootstrap import get_settings
+from src.index.footprints import load_footprint_index
 from src.seed import create_db_tables
 from src.server.api_routes import ApiRoutes
+from src.server.async_server import AsyncApiServer
 
 if __name__ == "__main__":
   settings = get_settings()
   create_db_tables()
+  load_footprint_index()
 
   print(f"Serving {settings.HOST}:{settings.PORT}")
 
   if settings.APP_MODE == "production":
     webbrowser.open(f"http://localhost:{settings.PORT}")
 
-  server = ThreadingHTTPServer((settings.HOST, settings.PORT), ApiRoutes)
-  server.serve_forever()
+  if settings.SERVER == "asyncio":
+    AsyncApiServer(ApiRoutes, settings.HOST, settings.PORT).serve_forever()
+  else:
+    server = ThreadingHTTPServer((settings.HOST, settings.PORT), ApiRoutes)
+    server.serve_forever()
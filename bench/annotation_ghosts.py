@@ -0,0 +1,172 @@
+import random
+import sys
+import tempfile
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+from src.bootstrap import load_env
+from src.index.images import ImageIndexTable
+from src.models.equipment_annotation import (
+  equipment_annotation_models,
+  fill_image_datetimes,
+)
+from src.sqlite.connect import SqliteDatabase
+from src.timeutils import datetime_to_unix
+from tests.harness import (
+  START_TIME,
+  Checks,
+  annotation_values,
+  box_wkt,
+  fill_table,
+  grid_box,
+  image_id,
+  image_values,
+  open_database,
+  timed,
+)
+
+SIZES = (100_000, 1_000_000, 2_000_000)
+IMAGES = 10_000
+# Ghost searches are boxes of SEARCH_SIZE degrees around an image footprint
+SEARCH_SIZE = 5.0
+SEARCHES = 20
+# Annotations moved to another image, as by an update_annotations upsert
+MOVED_ANNOTATIONS = 2_000
+SEED = 19
+
+EquipmentPointTable = equipment_annotation_models("POINT").annotation
+
+STALE_SQL = (
+  f"SELECT COUNT(*) FROM {EquipmentPointTable.table_name()} ea "
+  f"INNER JOIN i.{ImageIndexTable.table_name()} img ON img.id = ea.image "
+  "WHERE ea.image_datetime IS NOT img.datetime_collected"
+)
+
+# The ghost filter as it was before image_datetime: the acquisition time is
+# joined from the image index and every annotation is tested for intersection
+FULL_SCAN_SQL = (
+  "WITH poly AS (SELECT ST_GeomFromText(?, 4326) AS geom) "
+  f"SELECT ea.id FROM {EquipmentPointTable.table_name()} ea "
+  "CROSS JOIN poly "
+  f"INNER JOIN i.{ImageIndexTable.table_name()} img ON img.id = ea.image "
+  "WHERE img.datetime_collected < ? AND ST_Intersects(ea.geometry, poly.geom)"
+)
+INDEXED_SQL = (
+  "WITH poly AS (SELECT ST_GeomFromText(?, 4326) AS geom) "
+  f"SELECT ea.id FROM {EquipmentPointTable.table_name()} ea "
+  "CROSS JOIN poly "
+  "WHERE ea.image_datetime < ? AND "
+  + EquipmentPointTable.spatial_filter_sql(
+    "geometry", "(SELECT geom FROM poly)", alias="ea"
+  )
+  + " AND ST_Intersects(ea.geometry, poly.geom)"
+)
+
+
+def fill_images(db: SqliteDatabase):
+  catalog = uuid.uuid4()
+  rows = (
+    image_values(i, catalog, grid_box(i), START_TIME + timedelta(hours=i))
+    for i in range(IMAGES)
+  )
+  fill_table(db, ImageIndexTable, rows)
+
+
+def fill_annotations(db: SqliteDatabase, count: int, rng: random.Random) -> float:
+  attributes = [uuid.uuid4() for _ in range(6)]
+  rows = (
+    annotation_values(
+      i,
+      image_id(rng.randrange(IMAGES)),
+      f"POINT ({rng.uniform(-180, 180)} {rng.uniform(-85, 85)})",
+      attributes,
+    )
+    for i in range(count)
+  )
+  return fill_table(db, EquipmentPointTable, rows)
+
+
+def time_refresh(
+  db: SqliteDatabase, size: int, rng: random.Random
+) -> tuple[float, bool]:
+  ids = [uuid.UUID(int=i + 1) for i in rng.sample(range(size), MOVED_ANNOTATIONS)]
+  db.conn.executemany(
+    f"UPDATE {EquipmentPointTable.table_name()} SET image = ? WHERE id = ?",
+    ((image_id(rng.randrange(IMAGES)), id.bytes) for id in ids),
+  )
+
+  elapsed, _ = timed(fill_image_datetimes, db, EquipmentPointTable, ids)
+  db.conn.commit()
+
+  return elapsed, db.conn.execute(STALE_SQL).fetchone()[0] == 0
+
+
+def time_search(
+  db: SqliteDatabase, rng: random.Random
+) -> tuple[float, float, int, bool]:
+  searches = []
+  for _ in range(SEARCHES):
+    x = rng.uniform(-180, 180 - SEARCH_SIZE)
+    y = rng.uniform(-85, 85 - SEARCH_SIZE)
+    cutoff = START_TIME + timedelta(hours=rng.randrange(IMAGES))
+    searches.append((box_wkt(x, y, SEARCH_SIZE, SEARCH_SIZE), cutoff))
+
+  cursor = db.conn.cursor()
+  params = [(wkt, datetime_to_unix(cutoff)) for wkt, cutoff in searches]
+
+  def search(sql: str) -> list[list]:
+    return [sorted(cursor.execute(sql, p).fetchall()) for p in params]
+
+  full_scan, full = timed(search, FULL_SCAN_SQL)
+  index_scan, indexed = timed(search, INDEXED_SQL)
+
+  hits = sum(map(len, full)) // len(searches)
+  return full_scan / len(searches), index_scan / len(searches), hits, full == indexed
+
+
+if __name__ == "__main__":
+  load_env()
+
+  sizes = [int(size) for size in sys.argv[1:]] or SIZES
+  checks = Checks("Ghost search")
+
+  for size in sizes:
+    rng = random.Random(SEED)
+
+    with tempfile.TemporaryDirectory() as tmp:
+      index_db = Path(tmp) / "index.db"
+      with open_database(index_db, ImageIndexTable, spatial=True) as db:
+        fill_images(db)
+
+      with open_database(
+        Path(tmp) / "annotation.db",
+        EquipmentPointTable,
+        spatial=True,
+        attach={"i": index_db},
+      ) as db:
+        fill = fill_annotations(db, size, rng)
+
+        # The migration path: every annotation time copied from the index
+        backfill, _ = timed(fill_image_datetimes, db, EquipmentPointTable)
+        db.conn.commit()
+
+        refresh, fresh = time_refresh(db, size, rng)
+        full_scan, index_scan, hits, same = time_search(db, rng)
+
+    checks.record(f"stale image_datetime at {size}", fresh)
+    checks.record(f"ghosts at {size}", same)
+
+    print(f"{size} annotations (inserted in {fill:.1f} s)")
+    print(f"  image_datetime backfill: {backfill * 1e3:9.1f} ms")
+    print(
+      f"  refresh {MOVED_ANNOTATIONS} moved:   {refresh * 1e3:9.1f} ms"
+      f"{'' if fresh else '  STALE'}"
+    )
+    print(f"  ghosts, join and scan:   {full_scan * 1e3:9.2f} ms ({hits} hits)")
+    print(
+      f"  ghosts, R*Tree:          {index_scan * 1e3:9.2f} ms "
+      f"({full_scan / index_scan:.1f}x){'' if same else '  MISMATCH'}"
+    )
+
+  checks.exit()
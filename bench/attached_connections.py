@@ -0,0 +1,75 @@
+import sqlite3
+import tempfile
+from pathlib import Path
+
+from src.sqlite.connect import SqliteDatabase
+from tests.harness import Checks, timed
+
+REQUESTS = 2_000
+# Tables per database, attaching reloads the whole schema
+SCHEMA_TABLES = 30
+
+ATTACHED = ("i", "ed", "a")
+
+LOOKUP_SQL = (
+  "SELECT m.id, i.t0.value, ed.t0.value, a.t0.value FROM t0 m "
+  "JOIN i.t0 ON i.t0.id = m.id "
+  "JOIN ed.t0 ON ed.t0.id = m.id "
+  "JOIN a.t0 ON a.t0.id = m.id "
+  "WHERE m.id = ?"
+)
+
+
+def create_database(path: Path):
+  conn = sqlite3.connect(path)
+  for t in range(SCHEMA_TABLES):
+    conn.execute(f"CREATE TABLE t{t} (id INTEGER PRIMARY KEY, value TEXT, other REAL)")
+    conn.execute(f"CREATE INDEX t{t}_value ON t{t} (value)")
+
+  conn.executemany(
+    "INSERT INTO t0 VALUES (?, ?, ?)", ((i, f"value {i}", i / 2) for i in range(1000))
+  )
+  conn.commit()
+  conn.close()
+
+
+def per_request_attach(main: Path, paths: dict[str, Path]):
+  for i in range(REQUESTS):
+    with SqliteDatabase(main) as db:
+      cursor = db.conn.cursor()
+      for alias, path in paths.items():
+        cursor.execute(f"ATTACH DATABASE ? AS {alias}", (str(path),))
+      try:
+        cursor.execute(LOOKUP_SQL, (i % 1000,)).fetchall()
+      finally:
+        for alias in reversed(paths):
+          cursor.execute(f"DETACH DATABASE {alias}")
+
+
+def pre_attached(main: Path, paths: dict[str, Path]):
+  for i in range(REQUESTS):
+    with SqliteDatabase(main, attach=paths) as db:
+      db.conn.execute(LOOKUP_SQL, (i % 1000,)).fetchall()
+
+
+if __name__ == "__main__":
+  with tempfile.TemporaryDirectory() as tmp:
+    main = Path(tmp) / "annotation.db"
+    paths = {alias: Path(tmp) / f"{alias}.db" for alias in ATTACHED}
+    for path in (main, *paths.values()):
+      create_database(path)
+
+    # Warm up both pools before timing
+    per_request_attach(main, paths)
+    pre_attached(main, paths)
+
+    attach, _ = timed(per_request_attach, main, paths)
+    attached, _ = timed(pre_attached, main, paths)
+
+  print(f"{REQUESTS} cross-database lookups, {SCHEMA_TABLES} tables per database")
+  print(f"  attach per request: {attach * 1e3:9.1f} ms")
+  print(f"  pre-attached:       {attached * 1e3:9.1f} ms ({attach / attached:.1f}x)")
+
+  checks = Checks("Pre-attached connections")
+  checks.record("faster than attaching per request", attached < attach)
+  checks.exit()
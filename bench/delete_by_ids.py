@@ -0,0 +1,121 @@
+import uuid
+from typing import Callable
+
+from src.bootstrap import load_env
+from src.models.equipment_annotation import equipment_annotation_models
+from src.sqlite.connect import SqliteDatabase
+from tests.harness import (
+  Checks,
+  annotation_values,
+  fill_table,
+  grid_point,
+  temp_database,
+  timed,
+)
+
+ANNOTATIONS = 50_000
+# Junction rows per annotation in each attribute list table
+LIST_VALUES = 2
+# Runs per delete path, alternating, the best is reported
+REPEAT = 3
+# Ids per delete_by_ids call: all at once, and as many small requests
+CALL_SIZES = (ANNOTATIONS, 25)
+
+MODELS = equipment_annotation_models("POINT")
+
+
+def fill_annotations(db: SqliteDatabase) -> list[uuid.UUID]:
+  attributes = [uuid.uuid4() for _ in range(6)]
+  fill_table(
+    db,
+    MODELS.annotation,
+    (
+      annotation_values(i, (i % 1000).to_bytes(32, "big"), grid_point(i), attributes)
+      for i in range(ANNOTATIONS)
+    ),
+  )
+
+  ids = [uuid.UUID(int=i + 1) for i in range(ANNOTATIONS)]
+  values = [uuid.uuid4() for _ in range(LIST_VALUES)]
+  for junction in MODELS.junctions.values():
+    fill_table(db, junction, ((id, value) for id in ids for value in values))
+
+  return ids
+
+
+# delete_by_ids as it was before: the ids go through a temporary table and
+# the junction rows are removed by the ON DELETE CASCADE foreign keys
+def temp_table_delete(db: SqliteDatabase, ids: list[uuid.UUID]) -> int:
+  cursor = db.conn.cursor()
+  cursor.execute("CREATE TEMPORARY TABLE IF NOT EXISTS temp_delete_ids (id BLOB)")
+  cursor.execute("DELETE FROM temp_delete_ids")
+  cursor.executemany(
+    "INSERT INTO temp_delete_ids (id) VALUES (?)", ((i.bytes,) for i in ids)
+  )
+  cursor.execute(
+    f"DELETE FROM {MODELS.annotation.table_name()} "
+    "WHERE id IN (SELECT id FROM temp_delete_ids)"
+  )
+  rows_deleted = cursor.rowcount
+  cursor.execute("DROP TABLE temp_delete_ids")
+  return rows_deleted
+
+
+def set_based_delete(db: SqliteDatabase, ids: list[uuid.UUID]) -> int:
+  return db.delete_by_ids(MODELS.annotation, ids, tuple(MODELS.junctions.values()))
+
+
+def time_delete(
+  db: SqliteDatabase,
+  delete: Callable[[SqliteDatabase, list[uuid.UUID]], int],
+  call_size: int,
+) -> tuple[float, bool]:
+  ids = fill_annotations(db)
+
+  def delete_all() -> int:
+    deleted = 0
+    for i in range(0, len(ids), call_size):
+      deleted += delete(db, ids[i : i + call_size])
+      db.conn.commit()
+    return deleted
+
+  elapsed, deleted = timed(delete_all)
+
+  tables = [MODELS.annotation, *MODELS.junctions.values()]
+  remaining = sum(
+    db.conn.execute(f"SELECT COUNT(*) FROM {table.table_name()}").fetchone()[0]
+    for table in tables
+  )
+  return elapsed, deleted == len(ids) and remaining == 0
+
+
+if __name__ == "__main__":
+  load_env()
+
+  print(
+    f"Deleting {ANNOTATIONS} annotations with {LIST_VALUES} values in each of "
+    f"{len(MODELS.junctions)} list tables"
+  )
+
+  checks = Checks("Rows left behind by")
+  tables = (MODELS.annotation, *MODELS.junctions.values())
+  with temp_database(*tables, spatial=True) as db:
+    for call_size in CALL_SIZES:
+      print(f"  {call_size} ids per call")
+
+      timings: dict[str, list[float]] = {}
+      for _ in range(REPEAT):
+        for name, delete in (
+          ("temporary table", temp_table_delete),
+          ("set-based", set_based_delete),
+        ):
+          elapsed, passed = time_delete(db, delete, call_size)
+          checks.record(name, passed)
+          timings.setdefault(name, []).append(elapsed)
+
+      for name, elapsed in timings.items():
+        failed = name in checks.failures
+        status = "FAILED" if failed else f"{min(elapsed) * 1e3:7.1f} ms"
+        print(f"    {name:<16} {status}")
+
+  checks.exit()
@@ -0,0 +1,175 @@
+import dataclasses
+import http.client
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from typing import NamedTuple
+
+from src.server import static
+from src.server.api_handler import ApiHandler
+from src.server.async_server import AsyncApiServer
+from tests.harness import Checks, timed
+
+# Concurrent clients, each reading RANGE_SIZE bytes at random offsets of a
+# FILE_SIZE image, as OpenLayers does for COG tiles
+CLIENTS = (8, 64)
+REQUESTS_PER_CLIENT = 200
+FILE_SIZE = 16 * 1024 * 1024
+RANGE_SIZE = 16 * 1024
+# Requests still unanswered after this count as failed
+REQUEST_TIMEOUT = 10.0
+SEED = 6
+
+SERVERS = ("threading", "asyncio")
+
+
+def serve(kind: str, port: int, static_dir: Path):
+  # Runs in its own process, so that the clients do not share its GIL. The
+  # request log of the threading server is dropped, the asyncio one has none.
+  sys.stderr = open(os.devnull, "w")
+  static.app_settings = dataclasses.replace(static.app_settings, STATIC_DIR=static_dir)
+
+  if kind == "asyncio":
+    AsyncApiServer(ApiHandler, "127.0.0.1", port).serve_forever()
+  else:
+    ThreadingHTTPServer(("127.0.0.1", port), ApiHandler).serve_forever()
+
+
+def free_port() -> int:
+  with socket.socket() as sock:
+    sock.bind(("127.0.0.1", 0))
+    return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 10.0):
+  deadline = time.monotonic() + timeout
+  while time.monotonic() < deadline:
+    try:
+      socket.create_connection(("127.0.0.1", port), timeout=1).close()
+      return
+    except OSError:
+      time.sleep(0.05)
+
+  raise RuntimeError(f"Server on port {port} did not start")
+
+
+class ClientResult(NamedTuple):
+  latencies: list[float]
+  # Requests that timed out or lost their connection
+  errors: int
+  # Responses with a wrong status or body
+  mismatches: int
+
+
+def run_client(port: int, keep_alive: bool, data: bytes, seed: int) -> ClientResult:
+  rng = random.Random(seed)
+  conn = http.client.HTTPConnection("127.0.0.1", port, timeout=REQUEST_TIMEOUT)
+  latencies: list[float] = []
+  errors = 0
+  mismatches = 0
+
+  for _ in range(REQUESTS_PER_CLIENT):
+    start = rng.randrange(FILE_SIZE - RANGE_SIZE)
+    end = start + RANGE_SIZE - 1
+    headers = {"Range": f"bytes={start}-{end}"}
+    if not keep_alive:
+      headers["Connection"] = "close"
+
+    began = time.perf_counter()
+    try:
+      conn.request("GET", "/image.tif", headers=headers)
+      response = conn.getresponse()
+      body = response.read()
+    except (OSError, http.client.HTTPException):
+      errors += 1
+      conn.close()
+      continue
+
+    latencies.append(time.perf_counter() - began)
+    if response.status != 206 or body != data[start : end + 1]:
+      mismatches += 1
+    if not keep_alive:
+      conn.close()
+
+  conn.close()
+  return ClientResult(latencies, errors, mismatches)
+
+
+def run_load(
+  port: int, clients: int, keep_alive: bool, data: bytes
+) -> tuple[float, float, int, int]:
+  results: list[ClientResult] = []
+
+  def client(seed: int):
+    results.append(run_client(port, keep_alive, data, seed))
+
+  def run_all():
+    threads = [
+      threading.Thread(target=client, args=(SEED + i,)) for i in range(clients)
+    ]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+  elapsed, _ = timed(run_all)
+  latencies = sorted(t for result in results for t in result.latencies)
+  p95 = latencies[int(len(latencies) * 0.95)] if latencies else float("nan")
+  errors = sum(result.errors for result in results)
+  mismatches = sum(result.mismatches for result in results)
+  return len(latencies) / elapsed, p95, errors, mismatches
+
+
+if __name__ == "__main__":
+  checks = Checks("Range responses")
+
+  with tempfile.TemporaryDirectory() as tmp:
+    static_dir = Path(tmp)
+    data = os.urandom(FILE_SIZE)
+    (static_dir / "image.tif").write_bytes(data)
+
+    ports = {kind: free_port() for kind in SERVERS}
+    processes = [
+      multiprocessing.Process(
+        target=serve, args=(kind, ports[kind], static_dir), daemon=True
+      )
+      for kind in SERVERS
+    ]
+    for process in processes:
+      process.start()
+
+    try:
+      for port in ports.values():
+        wait_for_port(port)
+
+      print(f"{REQUESTS_PER_CLIENT} range reads of {RANGE_SIZE // 1024} KiB per client")
+      for keep_alive in (False, True):
+        for clients in CLIENTS:
+          label = f"{clients} clients, {'keep-alive' if keep_alive else 'close'}"
+          print(f"  {label}")
+
+          rates = {}
+          for kind, port in ports.items():
+            rate, p95, errors, mismatches = run_load(port, clients, keep_alive, data)
+            checks.record(f"{kind}, {label}", mismatches == 0)
+            rates[kind] = rate
+            print(
+              f"    {kind:<10} {rate:8.0f} req/s  p95 {p95 * 1e3:7.2f} ms"
+              f"{f'  {errors} failed requests' if errors else ''}"
+              f"{f'  {mismatches} MISMATCHES' if mismatches else ''}"
+            )
+
+          print(f"    asyncio/threading {rates['asyncio'] / rates['threading']:.2f}x")
+    finally:
+      for process in processes:
+        process.terminate()
+        process.join()
+
+  checks.exit()
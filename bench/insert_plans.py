@@ -0,0 +1,167 @@
+import uuid
+from typing import Callable, Optional, Sequence
+
+from src.bootstrap import load_env
+from src.index.images import ImageIndexTable
+from src.models.equipment_annotation import equipment_annotation_models
+from src.sqlite.connect import SqliteDatabase
+from src.sqlite.insert_plan import compile_row_encoder
+from src.sqlite.query_builder import InsertQuery, UpdateQuery
+from src.sqlite.table import RowBatch, Table
+from tests.harness import (
+  Checks,
+  annotation_values,
+  grid_box,
+  grid_point,
+  image_values,
+  temp_database,
+  timed,
+)
+
+ROWS = 100_000
+# Rows per insert_models call, as index_images writes in batches
+BATCH_SIZE = 256
+
+EquipmentPointTable = equipment_annotation_models("POINT").annotation
+
+
+def image_rows(count: int) -> list[Table]:
+  catalog = uuid.uuid4()
+  return [ImageIndexTable(*image_values(i, catalog, grid_box(i))) for i in range(count)]
+
+
+def equipment_rows(count: int) -> list[Table]:
+  attributes = [uuid.uuid4() for _ in range(6)]
+  return [
+    EquipmentPointTable(
+      *annotation_values(i, (i % 1000).to_bytes(32, "big"), grid_point(i), attributes)
+    )
+    for i in range(count)
+  ]
+
+
+def upsert_query(table: type[Table]) -> UpdateQuery:
+  columns = [name for name in table._fields if name != "id"]
+  return UpdateQuery().set_excluded(*columns)
+
+
+# insert_models as it was before insert plans: the statement is rebuilt and
+# the rows are copied into a RowBatch on every call
+def legacy_insert_models(
+  db: SqliteDatabase,
+  models: Sequence[Table],
+  conflict_index: Optional[str] = None,
+  update_query: Optional[UpdateQuery] = None,
+):
+  batch = RowBatch(type(models[0]))
+  batch.extend(models)
+
+  table = batch.table
+  geometry_fields = table.geometry_fields()
+  columns = list(batch.columns)
+  placeholders = [
+    f"GeomFromText(?, {geometry_fields[col].srid})" if col in geometry_fields else "?"
+    for col in columns
+  ]
+
+  query = (
+    InsertQuery()
+    .into(table.table_name())
+    .columns(*columns)
+    .values_placeholders(*placeholders)
+  )
+  if conflict_index is not None:
+    query.on_conflict(conflict_index)
+    if update_query is None:
+      query.do_nothing()
+    else:
+      query.do_update(update_query)
+
+  sql, _ = query.build()
+  db.conn.cursor().executemany(sql, batch.sql_rows())
+
+
+def insert_models(
+  db: SqliteDatabase,
+  models: Sequence[Table],
+  conflict_index: Optional[str] = None,
+  update_query: Optional[UpdateQuery] = None,
+):
+  db.insert_models(models, conflict_index, update_query)
+
+
+InsertFunction = Callable[
+  [SqliteDatabase, Sequence[Table], Optional[str], Optional[UpdateQuery]], None
+]
+
+
+def time_upserts(
+  db: SqliteDatabase, rows: list[Table], insert: InsertFunction
+) -> float:
+  table = type(rows[0])
+  update_query = upsert_query(table)
+  db.conn.execute(f"DELETE FROM {table.table_name()}")
+  db.conn.commit()
+
+  # The second pass updates every row through ON CONFLICT
+  def upsert_twice():
+    for _ in range(2):
+      for i in range(0, len(rows), BATCH_SIZE):
+        insert(db, rows[i : i + BATCH_SIZE], "id", update_query)
+      db.conn.commit()
+
+  elapsed, _ = timed(upsert_twice)
+  return elapsed
+
+
+def time_encoding(rows: list[Table]) -> tuple[float, float]:
+  # Python side only: the rows serialized into statement parameters
+  def encode_batches():
+    for i in range(0, len(rows), BATCH_SIZE):
+      batch = RowBatch(type(rows[0]))
+      batch.extend(rows[i : i + BATCH_SIZE])
+      for _ in batch.sql_rows():
+        pass
+
+  def encode_planned():
+    encode_rows = compile_row_encoder(type(rows[0]))
+    for i in range(0, len(rows), BATCH_SIZE):
+      for _ in encode_rows(rows[i : i + BATCH_SIZE]):
+        pass
+
+  legacy, _ = timed(encode_batches)
+  planned, _ = timed(encode_planned)
+  return legacy, planned
+
+
+if __name__ == "__main__":
+  load_env()
+
+  print(f"{ROWS} rows upserted twice in batches of {BATCH_SIZE}")
+
+  checks = Checks("Insert plans")
+  # Only the spatial indexes, so that index upkeep does not hide the encoding
+  tables = (ImageIndexTable, EquipmentPointTable)
+  with temp_database(*tables, spatial=True, indexes=False) as db:
+    for table, rows in (
+      (ImageIndexTable, image_rows(ROWS)),
+      (EquipmentPointTable, equipment_rows(ROWS)),
+    ):
+      legacy_encoding, planned_encoding = time_encoding(rows)
+      legacy = time_upserts(db, rows, legacy_insert_models)
+      planned = time_upserts(db, rows, insert_models)
+      count = db.conn.execute(f"SELECT COUNT(*) FROM {table.table_name()}")
+      checks.record(f"rows in {table.table_name()}", count.fetchone()[0] == ROWS)
+
+      print(f"  {table.table_name()}")
+      print(f"    encode, row batch:  {legacy_encoding * 1e3:9.1f} ms")
+      print(
+        f"    encode, plan:       {planned_encoding * 1e3:9.1f} ms "
+        f"({legacy_encoding / planned_encoding:.2f}x)"
+      )
+      print(f"    rebuilt statements: {legacy * 1e3:9.1f} ms")
+      print(
+        f"    insert plans:       {planned * 1e3:9.1f} ms ({legacy / planned:.2f}x)"
+      )
+
+  checks.exit()
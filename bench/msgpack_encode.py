@@ -0,0 +1,155 @@
+import struct
+import sys
+from functools import partial
+from typing import Any
+
+from src.msgpack import decode_msgpack, encode_msgpack
+from tests.harness import Checks, best_time
+
+
+# The recursive encoder that encode_msgpack replaced, kept for comparison
+def recursive_pack_int(n: int) -> bytes:
+  if 0 <= n <= 127:
+    return bytes([n])
+  if -32 <= n < 0:
+    return struct.pack("b", n)
+  if -32768 <= n <= 32767:
+    return b"\xd1" + struct.pack(">h", n)
+  if -2147483648 <= n <= 2147483647:
+    return b"\xd2" + struct.pack(">i", n)
+  return b"\xd3" + struct.pack(">q", n)
+
+
+def recursive_pack_str(s: str) -> bytes:
+  b = s.encode()
+  length = len(b)
+  if length < 32:
+    return bytes([0xA0 | length]) + b
+
+  if length < 256:
+    return b"\xd9" + struct.pack("B", length) + b
+
+  return b"\xda" + struct.pack(">H", length) + b
+
+
+def recursive_pack_bin(b: bytes) -> bytes:
+  length = len(b)
+  if length < 256:
+    return b"\xc4" + struct.pack("B", length) + b
+  return b"\xc5" + struct.pack(">H", length) + b
+
+
+def recursive_pack_array(arr: list) -> bytes:
+  out: list[bytes] = []
+  length = len(arr)
+  if length < 16:
+    out.append(bytes([0x90 | length]))
+  else:
+    out.append(b"\xdc" + struct.pack(">H", length))
+
+  for item in arr:
+    out.append(recursive_encode(item))
+
+  return b"".join(out)
+
+
+def recursive_pack_map(m: dict) -> bytes:
+  out = []
+  length = len(m)
+  if length < 16:
+    out.append(bytes([0x80 | length]))
+  else:
+    out.append(b"\xde" + struct.pack(">H", length))
+
+  for k, v in m.items():
+    out.append(recursive_encode(k))
+    out.append(recursive_encode(v))
+
+  return b"".join(out)
+
+
+def recursive_encode(x: Any) -> bytes:
+  if x is None:
+    return b"\xc0"
+  if isinstance(x, int):
+    return recursive_pack_int(x)
+  if isinstance(x, float):
+    return b"\xcb" + struct.pack(">d", x)
+  if isinstance(x, str):
+    return recursive_pack_str(x)
+  if isinstance(x, bytes):
+    return recursive_pack_bin(x)
+  if isinstance(x, list):
+    return recursive_pack_array(x)
+  if isinstance(x, dict):
+    return recursive_pack_map(x)
+  raise TypeError(f"Unsupported type: {type(x).__name__}")
+
+
+def wide_payload(rows: int) -> list[dict]:
+  return [
+    {
+      "id": i,
+      "name": f"image {i}",
+      "gsd": i * 0.25,
+      "rating": None if i % 3 else -i,
+      "hash": bytes(32),
+      "bounds": [10.0, 59.0, 11.0, 60.0],
+    }
+    for i in range(rows)
+  ]
+
+
+def deep_payload(depth: int) -> Any:
+  value: Any = "leaf"
+  for i in range(depth):
+    value = {"level": i, "child": [value]}
+  return value
+
+
+# Payloads within the recursion limit of the old encoder, so both can be timed
+PAYLOADS: dict[str, Any] = {
+  "wide (10k rows)": wide_payload(10_000),
+  "wide (100 rows)": wide_payload(100),
+  "deep (200 levels)": deep_payload(200),
+}
+
+
+def compare_encoders(checks: Checks):
+  for name, payload in PAYLOADS.items():
+    same = decode_msgpack(encode_msgpack(payload)) == decode_msgpack(
+      recursive_encode(payload)
+    )
+    if not checks.record(name, same):
+      print(f"{'MISMATCH':>9}  {name}")
+      continue
+
+    recursive = best_time(partial(recursive_encode, payload))
+    iterative = best_time(partial(encode_msgpack, payload))
+    print(
+      f"{recursive / iterative:>8.2f}x  {name}: recursive {recursive * 1e3:.3f} ms, "
+      f"iterative {iterative * 1e3:.3f} ms"
+    )
+
+  # Nesting beyond the recursion limit only works with the iterative encoder
+  name = "deep (beyond the recursion limit)"
+  payload = deep_payload(sys.getrecursionlimit())
+  try:
+    recursive_encode(payload)
+    print(f"{'ok':>9}  {name}: recursive encoder did not overflow")
+  except RecursionError:
+    print(f"{'ok':>9}  {name}: recursive encoder overflowed")
+
+  # Comparing the decoded payload would recurse as well, so re-encode it
+  encoded = encode_msgpack(payload)
+  if not checks.record(name, encode_msgpack(decode_msgpack(encoded)) == encoded):
+    print(f"{'MISMATCH':>9}  {name}")
+  else:
+    iterative = best_time(partial(encode_msgpack, payload))
+    print(f"{'ok':>9}  {name}: iterative {iterative * 1e3:.3f} ms")
+
+
+if __name__ == "__main__":
+  checks = Checks("Encoder comparison")
+  compare_encoders(checks)
+  checks.exit()
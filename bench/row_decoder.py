@@ -0,0 +1,171 @@
+import json
+import re
+import uuid
+from functools import partial
+from typing import Any, Union
+
+from src.index.image_table import ImageIndexTable
+from src.index.images import search_columns
+from src.models.equipment_annotation import equipment_annotation_models
+from src.sqlite.query_builder import SelectQuery
+from src.sqlite.row_decoder import Column, compile_row_decoder
+from src.sqlite.table import Field, GeometryField, RowBatch, SqliteValue, Table
+from tests.harness import (
+  Checks,
+  annotation_values,
+  best_time,
+  grid_box,
+  grid_point,
+  image_id,
+  image_values,
+)
+
+# As many rows as a search page or an image's annotations usually return
+ROWS = 1_000
+
+GEO_REGEX = re.compile("^As(GeoJSON|Text)")
+
+
+def decode_per_row(
+  table: type[Table],
+  columns: tuple[Column, ...],
+  rows: list[tuple],
+  to_json: bool,
+) -> list[dict[str, SqliteValue]]:
+  # select_model_records before compile_row_decoder: the conversions of every
+  # column are looked up and dispatched for each value
+  column_info: list[tuple[str, Union[Field, GeometryField, None], bool, str]] = []
+  for name, alias in columns:
+    col = alias or name
+    field = table._fields.get(col)
+    is_geo = isinstance(field, GeometryField)
+    geo_format = ""
+    if not is_geo:
+      column_info.append((col, field, is_geo, geo_format))
+      continue
+
+    regex_match = GEO_REGEX.search(name)
+    if regex_match is not None:
+      geo_format = regex_match.group()
+
+    column_info.append((col, field, is_geo, geo_format))
+
+  result: list[dict[str, SqliteValue]] = []
+  for row in rows:
+    result_row = {}
+    for i, (col, field, is_geo, geo_format) in enumerate(column_info):
+      raw = row[i]
+      if field is None:
+        result_row[col] = raw
+        continue
+
+      if is_geo:
+        value = json.loads(raw) if geo_format == "AsGeoJSON" else raw
+      else:
+        value = field.deserialize_from_sql(raw)
+
+      result_row[col] = field.serialize_to_json(value) if to_json else value
+
+    result.append(result_row)
+
+  return result
+
+
+def geojson(wkt: str) -> str:
+  # The AsGeoJSON text of a grid_box or grid_point WKT
+  numbers = [float(n) for n in re.findall(r"-?[\d.]+", wkt)]
+  points = [numbers[i : i + 2] for i in range(0, len(numbers), 2)]
+  if wkt.startswith("POINT"):
+    return json.dumps({"type": "Point", "coordinates": points[0]})
+
+  return json.dumps({"type": "Polygon", "coordinates": [points]})
+
+
+def fetched_rows(
+  table: type[Table], columns: tuple[Column, ...], batch: RowBatch
+) -> list[tuple]:
+  # Rows as sqlite3 returns them for the selected columns, with the geometry
+  # columns read back as GeoJSON
+  names = tuple(table._fields)
+  rows = []
+  for values in batch.sql_rows():
+    stored = dict(zip(names, values))
+    row: list[Any] = []
+    for name, alias in columns:
+      key = alias or name
+      value = stored[key]
+      row.append(geojson(value) if GEO_REGEX.search(name) else value)
+    rows.append(tuple(row))
+
+  return rows
+
+
+def select_columns(*columns: str) -> tuple[Column, ...]:
+  return tuple(SelectQuery().select(*columns).columns)
+
+
+def image_rows() -> tuple[tuple[Column, ...], list[tuple]]:
+  columns = select_columns(*search_columns({}))
+  batch = RowBatch(ImageIndexTable)
+  catalog = uuid.uuid4()
+  for i in range(ROWS):
+    batch.append_row(*image_values(i, catalog, grid_box(i)))
+
+  return columns, fetched_rows(ImageIndexTable, columns, batch)
+
+
+def annotation_rows(
+  geometry_type: str,
+) -> tuple[type[Table], tuple[Column, ...], list[tuple]]:
+  table = equipment_annotation_models(geometry_type).annotation
+  columns = select_columns(
+    *(
+      f"AsGeoJSON({name}) AS {name}" if isinstance(field, GeometryField) else name
+      for name, field in table._fields.items()
+    )
+  )
+
+  batch = RowBatch(table)
+  attributes = [uuid.uuid4() for _ in range(6)]
+  for i in range(ROWS):
+    geometry = grid_point(i) if geometry_type == "POINT" else grid_box(i, 0.01)
+    batch.append_row(*annotation_values(i, image_id(i), geometry, attributes))
+
+  return table, columns, fetched_rows(table, columns, batch)
+
+
+def compare(
+  checks: Checks,
+  label: str,
+  table: type[Table],
+  columns: tuple[Column, ...],
+  rows: list[tuple],
+):
+  print(f"  {label}, {len(columns)} columns")
+  for to_json in (False, True):
+    decode_rows = compile_row_decoder(table, columns, to_json)
+    per_row = best_time(partial(decode_per_row, table, columns, rows, to_json))
+    compiled = best_time(partial(decode_rows, rows))
+
+    mode = "to_json" if to_json else "python"
+    print(
+      f"    {mode:<7} per row {per_row * 1e3:7.2f} ms"
+      f"  compiled {compiled * 1e3:7.2f} ms  {per_row / compiled:5.2f}x"
+    )
+
+    same = decode_rows(rows) == decode_per_row(table, columns, rows, to_json)
+    checks.record(f"{label}, {mode}", same)
+
+
+if __name__ == "__main__":
+  checks = Checks("Row decoders")
+  print(f"{ROWS} fetched rows")
+
+  columns, rows = image_rows()
+  compare(checks, "image search rows", ImageIndexTable, columns, rows)
+
+  for geometry_type in ("POINT", "POLYGON"):
+    table, columns, rows = annotation_rows(geometry_type)
+    compare(checks, f"{geometry_type.lower()} annotation rows", table, columns, rows)
+
+  checks.exit()
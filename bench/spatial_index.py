@@ -0,0 +1,146 @@
+import random
+import sys
+import tempfile
+import uuid
+from pathlib import Path
+
+from src.bootstrap import load_env
+from src.index.area_coverage import (
+  AREA_DB_ALIAS,
+  AreaImageCoverageTable,
+  refresh_image_coverage,
+)
+from src.index.images import ImageIndexTable
+from src.models.areas import AreasTable
+from src.sqlite.connect import SqliteDatabase
+from tests.harness import (
+  START_TIME,
+  Checks,
+  fill_table,
+  image_id,
+  image_values,
+  open_database,
+  random_box,
+  timed,
+)
+
+SIZES = (10_000, 100_000, 1_000_000)
+AREAS = 50
+# Footprints are boxes of up to FOOTPRINT_SIZE degrees, searched with a box
+# of SEARCH_SIZE degrees
+FOOTPRINT_SIZE = 0.5
+SEARCH_SIZE = 20.0
+# Images whose coverage is refreshed, as after an indexing batch
+REFRESHED_IMAGES = 500
+SEED = 11
+
+FULL_SCAN_SQL = (
+  f"SELECT id FROM {ImageIndexTable.table_name()} "
+  "WHERE ST_Intersects(footprint, ST_GeomFromText(?, 4326))"
+)
+INDEXED_SQL = (
+  f"SELECT id FROM {ImageIndexTable.table_name()} WHERE "
+  + ImageIndexTable.spatial_filter_sql("footprint", "ST_GeomFromText(?, 4326)")
+  + " AND ST_Intersects(footprint, ST_GeomFromText(?, 4326))"
+)
+COVERAGE_SQL = (
+  f"SELECT COUNT(*) FROM {ImageIndexTable.table_name()} i "
+  f"CROSS JOIN {AREA_DB_ALIAS}.{AreasTable.table_name()} a "
+  "WHERE ST_Area(a.geometry) > 0 AND ST_Intersects(i.footprint, a.geometry) "
+  "AND i.id IN "
+)
+
+
+def fill_images(db: SqliteDatabase, count: int, rng: random.Random) -> float:
+  catalog = uuid.uuid4()
+  rows = (
+    image_values(i, catalog, random_box(rng, FOOTPRINT_SIZE), START_TIME)
+    for i in range(count)
+  )
+  return fill_table(db, ImageIndexTable, rows)
+
+
+def fill_areas(db: SqliteDatabase, rng: random.Random):
+  rows = (
+    (uuid.uuid4(), f"area {i}", None, random_box(rng, 20), None, None, START_TIME, None)
+    for i in range(AREAS)
+  )
+  fill_table(db, AreasTable, rows)
+
+
+def time_search(
+  db: SqliteDatabase, rng: random.Random
+) -> tuple[float, float, int, bool]:
+  searches = [random_box(rng, SEARCH_SIZE) for _ in range(20)]
+  cursor = db.conn.cursor()
+
+  def search(sql: str, wkt_params: int) -> list[list]:
+    return [
+      sorted(cursor.execute(sql, (wkt,) * wkt_params).fetchall()) for wkt in searches
+    ]
+
+  full_scan, full = timed(search, FULL_SCAN_SQL, 1)
+  index_scan, indexed = timed(search, INDEXED_SQL, 2)
+
+  hits = sum(map(len, full)) // len(searches)
+  return full_scan / len(searches), index_scan / len(searches), hits, full == indexed
+
+
+def time_coverage(
+  db: SqliteDatabase, size: int, rng: random.Random
+) -> tuple[float, bool]:
+  # refresh_image_coverage looks areas up through the index of the attached
+  # location.db (f_table_name 'DB=loc.areas')
+  ids = [image_id(i) for i in rng.sample(range(size), REFRESHED_IMAGES)]
+  elapsed, _ = timed(refresh_image_coverage, db, ids)
+
+  table_name = AreaImageCoverageTable.table_name()
+  covered = db.conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+  expected = db.conn.execute(
+    f"{COVERAGE_SQL}({', '.join('?' * len(ids))})", ids
+  ).fetchone()[0]
+  return elapsed, covered == expected
+
+
+if __name__ == "__main__":
+  load_env()
+
+  sizes = [int(size) for size in sys.argv[1:]] or SIZES
+  checks = Checks("Indexed results differ from full scans")
+
+  for size in sizes:
+    rng = random.Random(SEED)
+
+    with tempfile.TemporaryDirectory() as tmp:
+      location_db = Path(tmp) / "location.db"
+      with open_database(location_db, AreasTable, spatial=True) as db:
+        fill_areas(db, rng)
+
+      # Only the spatial index, as the searches compare it to a full scan
+      with open_database(
+        Path(tmp) / "index.db",
+        ImageIndexTable,
+        AreaImageCoverageTable,
+        spatial=True,
+        attach={AREA_DB_ALIAS: location_db},
+        indexes=False,
+      ) as db:
+        fill = fill_images(db, size, rng)
+        full_scan, index_scan, hits, same_images = time_search(db, rng)
+        coverage, same_coverage = time_coverage(db, size, rng)
+
+    checks.record(f"search at {size}", same_images)
+    checks.record(f"coverage at {size}", same_coverage)
+
+    print(f"{size} footprints (inserted in {fill:.1f} s)")
+    print(f"  search, full scan:    {full_scan * 1e3:9.2f} ms ({hits} hits)")
+    print(
+      f"  search, R*Tree:       {index_scan * 1e3:9.2f} ms "
+      f"({full_scan / index_scan:.1f}x){'' if same_images else '  MISMATCH'}"
+    )
+    print(
+      f"  coverage of {REFRESHED_IMAGES} images: {coverage * 1e3:7.2f} ms"
+      f"{'' if same_coverage else '  MISMATCH'}"
+    )
+
+  checks.exit()
@@ -0,0 +1,117 @@
+import tracemalloc
+from typing import Any, Callable
+
+from src.sqlite.connect import SqliteDatabase
+from src.sqlite.table import Field, RowBatch, Table, hash_field
+from tests.harness import Checks, temp_database, timed
+
+ROWS = 100_000
+
+
+class ImageRowTable(Table):
+  _table_name = "image_rows"
+  id = hash_field(True)
+  catalog = hash_field(False)
+  relative_path = Field(str, nullable=False)
+  filename = Field(str, nullable=False)
+  filetype = Field(str, nullable=False)
+  datetime_collected = Field(int)
+  ground_sample_distance = Field(float)
+  interpretation_rating = Field(float)
+  azimuth_angle = Field(float)
+  look_angle = Field(float)
+  width = Field(int, nullable=False)
+  height = Field(int, nullable=False)
+
+
+# Rows as they were built before Table was slotted: __new__, then one setattr
+# per field into the instance __dict__
+class DictRow:
+  _fields = ImageRowTable._fields
+
+
+def row_values(i: int) -> tuple[Any, ...]:
+  return (
+    i.to_bytes(32, "big"),
+    bytes(16),
+    f"sar/{i // 1000}",
+    f"image_{i}",
+    ".tif",
+    1_700_000_000_000 + i,
+    0.5,
+    float(i % 9),
+    i % 360 * 1.0,
+    30.0,
+    10_000,
+    8_000,
+  )
+
+
+VALUES = [row_values(i) for i in range(ROWS)]
+NAMES = tuple(ImageRowTable._fields)
+
+
+def build_dict_rows() -> list[DictRow]:
+  rows = []
+  for values in VALUES:
+    row = DictRow.__new__(DictRow)
+    for name, value in zip(NAMES, values):
+      setattr(row, name, value)
+    rows.append(row)
+  return rows
+
+
+def build_slotted_rows() -> list[ImageRowTable]:
+  return [ImageRowTable(*values) for values in VALUES]
+
+
+def build_row_batch() -> RowBatch:
+  batch = RowBatch(ImageRowTable)
+  for values in VALUES:
+    batch.append_row(*values)
+  return batch
+
+
+def measure(build: Callable[[], Any]) -> tuple[float, int, Any]:
+  # Timed without tracing, which slows down allocations
+  elapsed, _ = timed(build)
+
+  tracemalloc.start()
+  rows = build()
+  size, _ = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  return elapsed, size, rows
+
+
+def time_insert(db: SqliteDatabase, rows: Any) -> float:
+  db.conn.execute(f"DELETE FROM {ImageRowTable.table_name()}")
+  elapsed, _ = timed(db.insert_models, rows)
+  return elapsed
+
+
+if __name__ == "__main__":
+  print(f"{ROWS} rows of {len(NAMES)} fields")
+
+  results = {}
+  for name, build in (
+    ("dict rows", build_dict_rows),
+    ("slotted rows", build_slotted_rows),
+    ("row batch", build_row_batch),
+  ):
+    elapsed, size, rows = measure(build)
+    results[name] = rows
+    print(f"  build {name:<13} {elapsed * 1e3:8.1f} ms  {size / 2**20:7.1f} MiB")
+
+  with temp_database(ImageRowTable) as db:
+    models = time_insert(db, results["slotted rows"])
+    batch = time_insert(db, results["row batch"])
+    count = db.conn.execute(
+      f"SELECT COUNT(*) FROM {ImageRowTable.table_name()}"
+    ).fetchone()[0]
+
+  print(f"  insert slotted rows {models * 1e3:8.1f} ms")
+  print(f"  insert row batch    {batch * 1e3:8.1f} ms")
+
+  checks = Checks("Row batch inserts")
+  checks.record(f"inserted {count} of {ROWS} rows", count == ROWS)
+  checks.exit()
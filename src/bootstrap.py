@@ -15,6 +15,8 @@ class Settings:
   SPATIALITE_PATH: Path
   HOST: str
   PORT: int
+  IMAGE_HASH: Literal["full", "fast"]
+  SERVER: Literal["threading", "asyncio"]
 
   @property
   def ANNOTATION_DB(self) -> Path:
@@ -40,6 +42,10 @@ class Settings:
   def LOG_DB(self) -> Path:
     return self.DB_DIR / "log.db"
 
+  @property
+  def TILE_CACHE_DIR(self) -> Path:
+    return self.DB_DIR / "tiles"
+
 
 def load_settings() -> Settings:
   return Settings(
@@ -49,6 +55,8 @@ def load_settings() -> Settings:
     SPATIALITE_PATH=Path(require_env("SPATIALITE")),
     HOST=os.getenv("HOST", "0.0.0.0"),
     PORT=int(os.getenv("PORT", "8080")),
+    IMAGE_HASH=os.getenv("IMAGE_HASH", "full"),
+    SERVER=os.getenv("SERVER", "threading"),
   )
 
 
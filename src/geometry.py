@@ -1,9 +1,14 @@
 from __future__ import annotations
 
+import re
 from dataclasses import dataclass
 from typing import Literal, Sequence, TypedDict, cast
 
 Point = tuple[float, float]
+Bounds = tuple[float, float, float, float]
+
+WKT_NUMBER_REGEX = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+WKT_RING_REGEX = re.compile(r"\(([^()]+)\)")
 
 
 class PolygonGeoJSON(TypedDict):
@@ -54,6 +59,60 @@ class Polygon:
 
     return cls(rings)
 
+  @classmethod
+  def parse_wkt(cls, wkt: str) -> Polygon:
+    # Assumes 2D coordinates; an EWKT SRID prefix is skipped
+    body = wkt.rpartition(";")[2].strip()
+    if not body.upper().startswith("POLYGON"):
+      raise ValueError(f"Unsupported WKT geometry: {body[:64]}")
+
+    rings: list[list[Point]] = []
+    for ring in WKT_RING_REGEX.findall(body):
+      values = [float(v) for v in WKT_NUMBER_REGEX.findall(ring)]
+      if len(values) % 2:
+        raise ValueError(f"Invalid WKT coordinates: {wkt[:64]}")
+
+      rings.append(list(zip(values[0::2], values[1::2])))
+
+    if not rings:
+      raise ValueError(f"Invalid WKT polygon: {wkt[:64]}")
+
+    return cls(rings)
+
+  @property
+  def area(self) -> float:
+    # Planar shoelace area in coordinate units, like ST_Area on lon/lat
+    shell, *holes = (abs(ring_signed_area(ring)) for ring in self.rings)
+    return shell - sum(holes)
+
+
+def ring_signed_area(ring: Sequence[Point]) -> float:
+  total = 0.0
+  for (x0, y0), (x1, y1) in zip(ring, ring[1:]):
+    total += x0 * y1 - x1 * y0
+
+  return total / 2
+
+
+def bounds_overlap_area(a: Bounds, b: Bounds) -> float:
+  width = min(a[2], b[2]) - max(a[0], b[0])
+  height = min(a[3], b[3]) - max(a[1], b[1])
+  if width <= 0 or height <= 0:
+    return 0.0
+
+  return width * height
+
 
 def format_point(point: Point) -> str:
   return " ".join(map(str, point))
+
+
+def wkt_bounds(wkt: str) -> Bounds:
+  # Assumes 2D coordinates; an EWKT SRID prefix is skipped
+  values = [float(v) for v in WKT_NUMBER_REGEX.findall(wkt.rpartition(";")[2])]
+  if len(values) < 2 or len(values) % 2:
+    raise ValueError(f"Invalid WKT coordinates: {wkt[:64]}")
+
+  xs = values[0::2]
+  ys = values[1::2]
+  return min(xs), min(ys), max(xs), max(ys)
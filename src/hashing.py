@@ -1,7 +1,16 @@
 import base64
 import hashlib
+import os
+import struct
 import uuid
 from pathlib import Path
+from typing import BinaryIO, Iterator
+
+FAST_HASH_VERSION = 1
+FAST_HASH_SAMPLES = 32
+FAST_HASH_BLOCK_SIZE = 64 * 1024
+FAST_HASH_MAX_IFDS = 64
+FAST_HASH_MAX_IFD_ENTRIES = 4096
 
 
 def encode_sha256_to_b64(decoded: bytes) -> str:
@@ -23,5 +32,73 @@ def hash_geotiff(image_path: Path) -> bytes:
   return hasher.digest()
 
 
+def read_tiff_structure(f: BinaryIO) -> Iterator[bytes]:
+  header = f.read(16)
+  yield header
+
+  if len(header) < 8 or header[:2] not in (b"II", b"MM"):
+    return
+
+  order = "<" if header[:2] == b"II" else ">"
+  (version,) = struct.unpack_from(f"{order}H", header, 2)
+
+  if version == 42:
+    (offset,) = struct.unpack_from(f"{order}I", header, 4)
+    count_format, count_size, entry_size, next_format, next_size = "H", 2, 12, "I", 4
+  elif version == 43 and len(header) == 16:
+    (offset,) = struct.unpack_from(f"{order}Q", header, 8)
+    count_format, count_size, entry_size, next_format, next_size = "Q", 8, 20, "Q", 8
+  else:
+    return
+
+  visited: set[int] = set()
+  while offset and offset not in visited and len(visited) < FAST_HASH_MAX_IFDS:
+    visited.add(offset)
+    f.seek(offset)
+
+    count_bytes = f.read(count_size)
+    if len(count_bytes) < count_size:
+      return
+
+    (count,) = struct.unpack(f"{order}{count_format}", count_bytes)
+    count = min(count, FAST_HASH_MAX_IFD_ENTRIES)
+
+    entries = f.read(count * entry_size)
+    next_bytes = f.read(next_size)
+    yield count_bytes + entries + next_bytes
+
+    if len(next_bytes) < next_size:
+      return
+
+    (offset,) = struct.unpack(f"{order}{next_format}", next_bytes)
+
+
+def sample_offsets(file_size: int) -> list[int]:
+  last = max(file_size - FAST_HASH_BLOCK_SIZE, 0)
+  if last == 0:
+    return [0]
+
+  steps = FAST_HASH_SAMPLES - 1
+  return sorted({last * i // steps for i in range(FAST_HASH_SAMPLES)})
+
+
+def hash_geotiff_fast(image_path: Path) -> bytes:
+  hasher = hashlib.sha256()
+  hasher.update(f"fast-identity-v{FAST_HASH_VERSION}".encode())
+
+  file_size = os.path.getsize(image_path)
+  hasher.update(file_size.to_bytes(8, "big"))
+
+  with open(image_path, "rb") as f:
+    for chunk in read_tiff_structure(f):
+      hasher.update(chunk)
+
+    for offset in sample_offsets(file_size):
+      f.seek(offset)
+      hasher.update(f.read(FAST_HASH_BLOCK_SIZE))
+
+  return hasher.digest()
+
+
 def uuid_bytes_to_str(b: bytes) -> str:
   return str(uuid.UUID(bytes=b))
@@ -0,0 +1,154 @@
+import uuid
+from typing import Literal, Optional
+
+from src.bootstrap import get_settings
+from src.index.image_table import ImageIndexTable
+from src.sqlite.connect import SqliteDatabase
+from src.sqlite.query_builder import DeleteQuery, InsertQuery, SelectQuery
+from src.sqlite.table import Field, Index, Table, hash_field, uuid_field
+
+app_settings = get_settings()
+
+AREA_DB_ALIAS = "loc"
+AREA_ATTACHMENTS = {AREA_DB_ALIAS: app_settings.LOCATION_DB}
+
+REFRESH_CHUNK_SIZE = 500
+
+
+# Materialized intersections between saved areas (location.db) and image
+# footprints; the bbox columns hold the image footprint bounds
+class AreaImageCoverageTable(Table):
+  _table_name = "area_image_coverage"
+  _without_rowid = True
+  area_id = uuid_field(True, False)
+  image_id = hash_field(True)
+  coverage = Field(float, nullable=False)
+  min_x = Field(float, nullable=False)
+  min_y = Field(float, nullable=False)
+  max_x = Field(float, nullable=False)
+  max_y = Field(float, nullable=False)
+
+  _indexes = [Index(("image_id",))]
+
+
+def create_area_coverage_table():
+  with SqliteDatabase(
+    app_settings.INDEX_DB, spatial=True, attach=AREA_ATTACHMENTS
+  ) as db:
+    created = db.create_table(AreaImageCoverageTable)
+    db.create_table_indexes(AreaImageCoverageTable)
+
+    if created:
+      refresh_image_coverage(db)
+
+
+def _coverage_select(outer: Literal["images", "areas"]) -> SelectQuery:
+  # SQLite keeps the left table of a CROSS JOIN as the outer loop, so the
+  # spatial index lookup of the inner table runs once per outer row
+  from src.models.areas import AreasTable
+
+  images = f"{ImageIndexTable.table_name()} i"
+  areas = f"{AREA_DB_ALIAS}.{AreasTable.table_name()} a"
+  if outer == "areas":
+    images, areas = areas, images
+
+  return (
+    SelectQuery()
+    .select(
+      "a.id",
+      "i.id",
+      "ST_Area(ST_Intersection(i.footprint, a.geometry)) / ST_Area(a.geometry)",
+      "MbrMinX(i.footprint)",
+      "MbrMinY(i.footprint)",
+      "MbrMaxX(i.footprint)",
+      "MbrMaxY(i.footprint)",
+    )
+    .from_(images)
+    .cross_join(areas)
+    .where("ST_Area(a.geometry) > 0")
+  )
+
+
+def _insert_coverage(db: SqliteDatabase, query: SelectQuery):
+  sql, params = (
+    InsertQuery()
+    .into(AreaImageCoverageTable.table_name())
+    .columns(*AreaImageCoverageTable._fields)
+    .from_select(query)
+    .build()
+  )
+  db.conn.execute(sql, params)
+
+
+def refresh_image_coverage(db: SqliteDatabase, image_ids: Optional[list[bytes]] = None):
+  # db must be an index.db connection with location.db attached. A full refresh
+  # looks up the images of every area, since there are far fewer areas than
+  # images; otherwise every image looks up its areas.
+  from src.models.areas import AreasTable
+
+  table_name = AreaImageCoverageTable.table_name()
+  area_filter = AreasTable.spatial_filter_sql(
+    "geometry", "i.footprint", alias="a", db_alias=AREA_DB_ALIAS
+  )
+
+  if image_ids is None:
+    db.conn.execute(f"DELETE FROM {table_name}")
+    _insert_coverage(
+      db,
+      _coverage_select("areas")
+      .where(ImageIndexTable.spatial_filter_sql("footprint", "a.geometry", alias="i"))
+      .where("ST_Intersects(i.footprint, a.geometry)"),
+    )
+    return
+
+  for start in range(0, len(image_ids), REFRESH_CHUNK_SIZE):
+    chunk = image_ids[start : start + REFRESH_CHUNK_SIZE]
+    placeholders = ", ".join("?" * len(chunk))
+
+    sql, params = (
+      DeleteQuery()
+      .from_(table_name)
+      .where(f"image_id IN ({placeholders})", *chunk)
+      .build()
+    )
+    db.conn.execute(sql, params)
+
+    _insert_coverage(
+      db,
+      _coverage_select("images")
+      .where(f"i.id IN ({placeholders})", *chunk)
+      .where(area_filter)
+      .where("ST_Intersects(i.footprint, a.geometry)"),
+    )
+
+
+def refresh_area_coverage(db: SqliteDatabase, area_id: uuid.UUID):
+  sql, params = (
+    DeleteQuery()
+    .from_(AreaImageCoverageTable.table_name())
+    .where("area_id = ?", area_id.bytes)
+    .build()
+  )
+  db.conn.execute(sql, params)
+
+  _insert_coverage(
+    db,
+    _coverage_select("areas")
+    .where("a.id = ?", area_id.bytes)
+    .where(ImageIndexTable.spatial_filter_sql("footprint", "a.geometry", alias="i"))
+    .where("ST_Intersects(i.footprint, a.geometry)"),
+  )
+
+
+def delete_area_coverage(db: SqliteDatabase, area_ids: list[uuid.UUID]):
+  table_name = AreaImageCoverageTable.table_name()
+
+  for start in range(0, len(area_ids), REFRESH_CHUNK_SIZE):
+    chunk = [area_id.bytes for area_id in area_ids[start : start + REFRESH_CHUNK_SIZE]]
+    sql, params = (
+      DeleteQuery()
+      .from_(table_name)
+      .where(f"area_id IN ({', '.join('?' * len(chunk))})", *chunk)
+      .build()
+    )
+    db.conn.execute(sql, params)
@@ -4,6 +4,8 @@ from pathlib import Path
 from typing import Optional, TypedDict, Union
 
 from src.bootstrap import get_settings
+from src.index.image_table import ImageIndexTable
+from src.index.search_cache import bump_index_generation
 from src.models.update import TableUpdate, update_table
 from src.path_utils import verify_dir
 from src.sqlite.connect import SqliteDatabase
@@ -115,7 +117,9 @@ def update_catalogs(payload: TableUpdate):
     name = excluded.name
   """
 
-  return update_table(app_settings.INDEX_DB, CatalogTable, payload, update_sql)
+  result = update_table(app_settings.INDEX_DB, CatalogTable, payload, update_sql)
+  bump_index_generation()
+  return result
 
 
 def parse_id_name_path_record(row: tuple[bytes, str, str]):
@@ -172,6 +176,7 @@ def update_catalog(payload: CatalogUpdate):
   with SqliteDatabase(app_settings.INDEX_DB) as db:
     result = db.insert_models([model], "id", update_query, returning_sql)
 
+  bump_index_generation()
   return parse_id_name_path_record(result[0])
 
 
@@ -184,8 +189,6 @@ def get_catalog_edit_data():
 
 
 def get_catalog_index_data():
-  from src.index.images import ImageIndexTable
-
   table_c = CatalogTable.table_name()
   table_c_as = table_c[0]
   table_i = ImageIndexTable.table_name()
@@ -0,0 +1,75 @@
+import os
+from pathlib import Path
+
+from src.bootstrap import get_settings
+from src.sqlite.connect import SqliteDatabase
+from src.sqlite.query_builder import SelectQuery, UpdateQuery
+from src.sqlite.table import Field, Table, hash_field
+
+app_settings = get_settings()
+
+
+class FileFingerprintTable(Table):
+  _table_name = "file_fingerprints"
+  path = Field(str, primary_key=True)
+  size = Field(int, nullable=False)
+  mtime_ns = Field(int, nullable=False)
+  inode = Field(int, nullable=False)
+  hash = hash_field(False)
+
+
+def create_fingerprint_table():
+  with SqliteDatabase(app_settings.INDEX_DB) as db:
+    db.create_table(FileFingerprintTable)
+
+
+def fingerprint_key(file: Path) -> str:
+  return str(file.resolve())
+
+
+def stat_fingerprint(file: Path) -> FileFingerprintTable:
+  stat = os.stat(file)
+
+  return FileFingerprintTable.from_dict(
+    {
+      "path": fingerprint_key(file),
+      "size": stat.st_size,
+      "mtime_ns": stat.st_mtime_ns,
+      "inode": stat.st_ino,
+    }
+  )
+
+
+def is_unchanged(cached: FileFingerprintTable, current: FileFingerprintTable) -> bool:
+  return (
+    cached.size == current.size
+    and cached.mtime_ns == current.mtime_ns
+    and cached.inode == current.inode
+  )
+
+
+def get_catalog_fingerprints(
+  db: SqliteDatabase, catalog_path: Path
+) -> dict[str, FileFingerprintTable]:
+  # Paths under the catalog directory form one range of the primary key, which
+  # also covers duplicate files whose hash is indexed in another catalog
+  prefix = os.path.join(fingerprint_key(catalog_path), "")
+  upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+  query = (
+    SelectQuery()
+    .select(*FileFingerprintTable.column_names())
+    .from_(FileFingerprintTable.table_name())
+    .where("path >= ?", prefix)
+    .where("path < ?", upper)
+  )
+
+  records = db.select_model_records(FileFingerprintTable, query)
+  return {
+    record["path"]: FileFingerprintTable.from_dict(record) for record in records
+  }
+
+
+def upsert_fingerprints(db: SqliteDatabase, fingerprints: list[FileFingerprintTable]):
+  update_query = UpdateQuery().set_excluded("size", "mtime_ns", "inode", "hash")
+  db.insert_models(fingerprints, "path", update_query)
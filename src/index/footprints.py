@@ -0,0 +1,279 @@
+import logging
+import math
+import sys
+import threading
+from array import array
+from typing import Iterable, Optional, TypedDict
+
+from src.bootstrap import get_settings
+from src.geometry import Bounds
+from src.index.image_table import ImageIndexTable
+from src.sqlite.connect import SqliteDatabase
+
+app_settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+NODE_CAPACITY = 16
+MIN_REBUILD_DELTA = 1024
+
+FOOTPRINT_BOUNDS_COLUMNS = (
+  "id",
+  "MbrMinX(footprint)",
+  "MbrMinY(footprint)",
+  "MbrMaxX(footprint)",
+  "MbrMaxY(footprint)",
+)
+
+FootprintBounds = tuple[bytes, float, float, float, float]
+
+
+class FootprintIndexStats(TypedDict):
+  loaded: bool
+  items: int
+  delta: int
+  levels: int
+  bytes: int
+
+
+class STRTree:
+  # Sort-Tile-Recursive packed R-tree. Level 0 holds the footprint boxes in
+  # packed order; the children of node i on level k + 1 are the entries
+  # [i * capacity, (i + 1) * capacity) on level k. Entries are keyed by image
+  # id, since rowids of the images table change on VACUUM.
+  def __init__(self, rows: list[FootprintBounds], capacity: int = NODE_CAPACITY):
+    self.capacity = capacity
+    self.ids: list[bytes] = []
+    self.levels: list[tuple[array, array, array, array]] = []
+
+    if not rows:
+      return
+
+    ordered = self._str_order(rows)
+    self.ids = [row[0] for row in ordered]
+
+    level = tuple(array("d", (row[i] for row in ordered)) for i in range(1, 5))
+    self.levels.append(level)
+
+    while len(level[0]) > 1:
+      level = self._parent_level(level)
+      self.levels.append(level)
+
+  def _str_order(self, rows: list[FootprintBounds]) -> list[FootprintBounds]:
+    leaf_count = math.ceil(len(rows) / self.capacity)
+    slice_count = math.ceil(math.sqrt(leaf_count))
+    slice_size = slice_count * self.capacity
+
+    by_x = sorted(rows, key=lambda r: r[1] + r[3])
+
+    ordered: list[FootprintBounds] = []
+    for start in range(0, len(by_x), slice_size):
+      ordered += sorted(by_x[start : start + slice_size], key=lambda r: r[2] + r[4])
+
+    return ordered
+
+  def _parent_level(
+    self, level: tuple[array, array, array, array]
+  ) -> tuple[array, array, array, array]:
+    minx, miny, maxx, maxy = level
+    parent = (array("d"), array("d"), array("d"), array("d"))
+
+    for start in range(0, len(minx), self.capacity):
+      end = start + self.capacity
+      parent[0].append(min(minx[start:end]))
+      parent[1].append(min(miny[start:end]))
+      parent[2].append(max(maxx[start:end]))
+      parent[3].append(max(maxy[start:end]))
+
+    return parent
+
+  def __len__(self) -> int:
+    return len(self.ids)
+
+  def search(self, bounds: Bounds) -> list[bytes]:
+    return [self.ids[i] for i in self._search_positions(bounds)]
+
+  def search_rows(self, bounds: Bounds) -> list[FootprintBounds]:
+    if not self.levels:
+      return []
+
+    minx, miny, maxx, maxy = self.levels[0]
+    return [
+      (self.ids[i], minx[i], miny[i], maxx[i], maxy[i])
+      for i in self._search_positions(bounds)
+    ]
+
+  def _search_positions(self, bounds: Bounds) -> list[int]:
+    if not self.levels:
+      return []
+
+    qminx, qminy, qmaxx, qmaxy = bounds
+    capacity = self.capacity
+    result: list[int] = []
+
+    top = len(self.levels) - 1
+    stack = [(top, i) for i in range(len(self.levels[top][0]))]
+
+    while stack:
+      depth, i = stack.pop()
+      minx, miny, maxx, maxy = self.levels[depth]
+
+      if minx[i] > qmaxx or maxx[i] < qminx or miny[i] > qmaxy or maxy[i] < qminy:
+        continue
+
+      if depth == 0:
+        result.append(i)
+        continue
+
+      start = i * capacity
+      end = min(start + capacity, len(self.levels[depth - 1][0]))
+      stack += [(depth - 1, j) for j in range(start, end)]
+
+    return result
+
+  def rows(self) -> Iterable[FootprintBounds]:
+    if not self.levels:
+      return
+
+    minx, miny, maxx, maxy = self.levels[0]
+    for i, image_id in enumerate(self.ids):
+      yield image_id, minx[i], miny[i], maxx[i], maxy[i]
+
+  def nbytes(self) -> int:
+    size = sys.getsizeof(self.ids) + sum(map(sys.getsizeof, self.ids))
+    for level in self.levels:
+      size += sum(column.itemsize * len(column) for column in level)
+
+    return size
+
+
+class FootprintIndex:
+  # Writes go to a small delta map that shadows the packed tree until the
+  # next rebuild; a None entry marks a removed footprint
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._tree = STRTree([])
+    self._delta: dict[bytes, Optional[Bounds]] = {}
+    self._loaded = False
+
+  @property
+  def loaded(self) -> bool:
+    return self._loaded
+
+  def load(self, rows: list[FootprintBounds]):
+    # The delta is kept since writes racing the load are at least as new
+    tree = STRTree(rows)
+    with self._lock:
+      self._tree = tree
+      self._loaded = True
+
+  def upsert(self, rows: Iterable[FootprintBounds]):
+    with self._lock:
+      for image_id, *bounds in rows:
+        self._delta[image_id] = tuple(bounds)
+      self._maybe_rebuild()
+
+  def remove(self, image_ids: Iterable[bytes]):
+    with self._lock:
+      for image_id in image_ids:
+        self._delta[image_id] = None
+      self._maybe_rebuild()
+
+  def _maybe_rebuild(self):
+    if len(self._delta) < max(MIN_REBUILD_DELTA, len(self._tree) // 10):
+      return
+
+    rows = [row for row in self._tree.rows() if row[0] not in self._delta]
+    rows += [
+      (image_id, *bounds)
+      for image_id, bounds in self._delta.items()
+      if bounds is not None
+    ]
+
+    self._tree = STRTree(rows)
+    self._delta.clear()
+
+  def search(self, bounds: Bounds) -> list[bytes]:
+    return [row[0] for row in self.search_rows(bounds)]
+
+  def search_rows(self, bounds: Bounds) -> list[FootprintBounds]:
+    qminx, qminy, qmaxx, qmaxy = bounds
+
+    with self._lock:
+      tree = self._tree
+      delta = dict(self._delta)
+
+    result = [row for row in tree.search_rows(bounds) if row[0] not in delta]
+    for image_id, box in delta.items():
+      if box is None:
+        continue
+
+      minx, miny, maxx, maxy = box
+      if minx <= qmaxx and maxx >= qminx and miny <= qmaxy and maxy >= qminy:
+        result.append((image_id, minx, miny, maxx, maxy))
+
+    return result
+
+  def stats(self) -> FootprintIndexStats:
+    with self._lock:
+      return FootprintIndexStats(
+        loaded=self._loaded,
+        items=len(self._tree),
+        delta=len(self._delta),
+        levels=len(self._tree.levels),
+        bytes=self._tree.nbytes(),
+      )
+
+
+_footprint_index = FootprintIndex()
+_load_lock = threading.Lock()
+
+
+def select_footprint_bounds(
+  db: SqliteDatabase, ids: Optional[list[bytes]] = None
+) -> list[FootprintBounds]:
+  sql = (
+    f"SELECT {', '.join(FOOTPRINT_BOUNDS_COLUMNS)} "
+    f"FROM {ImageIndexTable.table_name()} WHERE footprint IS NOT NULL"
+  )
+  params: list[bytes] = []
+  if ids is not None:
+    sql += f" AND id IN ({', '.join('?' * len(ids))})"
+    params = ids
+
+  cursor = db.conn.cursor()
+  return [tuple(row) for row in cursor.execute(sql, params)]
+
+
+def _load_footprint_index():
+  with SqliteDatabase(app_settings.INDEX_DB, spatial=True) as db:
+    rows = select_footprint_bounds(db)
+
+  _footprint_index.load(rows)
+
+  stats = _footprint_index.stats()
+  logger.info(
+    "Loaded %d image footprints into the footprint index (%d bytes)",
+    stats["items"],
+    stats["bytes"],
+  )
+
+
+def load_footprint_index() -> FootprintIndex:
+  with _load_lock:
+    _load_footprint_index()
+
+  return _footprint_index
+
+
+def get_footprint_index() -> FootprintIndex:
+  if not _footprint_index.loaded:
+    with _load_lock:
+      if not _footprint_index.loaded:
+        _load_footprint_index()
+
+  return _footprint_index
+
+
+def footprint_index_stats() -> FootprintIndexStats:
+  return _footprint_index.stats()
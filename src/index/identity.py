@@ -0,0 +1,278 @@
+import logging
+import threading
+from pathlib import Path
+from typing import NamedTuple, Optional
+from uuid import UUID
+
+from src.bootstrap import get_settings
+from src.hashing import FAST_HASH_VERSION, hash_geotiff, hash_geotiff_fast
+from src.index.area_coverage import AreaImageCoverageTable
+from src.index.catalog import CatalogTable
+from src.index.fingerprint import FileFingerprintTable
+from src.index.footprints import get_footprint_index
+from src.index.image_table import ImageIndexTable
+from src.index.radiometric import RadiometricParamsTable
+from src.index.search_cache import bump_index_generation
+from src.models.equipment_annotation import reassign_image_annotations
+from src.sqlite.connect import SqliteDatabase
+from src.sqlite.query_builder import SelectQuery, UpdateQuery
+from src.sqlite.table import Field, Index, Table, hash_field
+
+app_settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+
+class ImageIdentityTable(Table):
+  _table_name = "image_identity"
+  fast_hash = hash_field(True)
+  version = Field(int, nullable=False)
+  image_id = hash_field(False)
+  full_hash = hash_field(False)
+  collision = Field(int, nullable=False, default=0)
+
+  _indexes = [Index(("image_id",))]
+
+
+def create_identity_table():
+  with SqliteDatabase(app_settings.INDEX_DB) as db:
+    db.create_table(ImageIdentityTable)
+    db.create_table_indexes(ImageIdentityTable)
+
+
+def fast_identity_enabled() -> bool:
+  return app_settings.IMAGE_HASH == "fast"
+
+
+def make_identity(
+  fast_hash: bytes, image_id: bytes, full_hash: Optional[bytes]
+) -> ImageIdentityTable:
+  return ImageIdentityTable.from_dict(
+    {
+      "fast_hash": fast_hash,
+      "version": FAST_HASH_VERSION,
+      "image_id": image_id,
+      "full_hash": full_hash,
+    }
+  )
+
+
+def get_identities(db: SqliteDatabase) -> dict[bytes, ImageIdentityTable]:
+  query = (
+    SelectQuery()
+    .select(*ImageIdentityTable.column_names())
+    .from_(ImageIdentityTable.table_name())
+    .where("version = ?", FAST_HASH_VERSION)
+  )
+
+  records = db.select_model_records(ImageIdentityTable, query)
+  return {
+    record["fast_hash"]: ImageIdentityTable.from_dict(record) for record in records
+  }
+
+
+def upsert_identities(db: SqliteDatabase, identities: list[ImageIdentityTable]):
+  update_query = UpdateQuery().set_excluded(
+    "version", "image_id", "full_hash", "collision"
+  )
+  db.insert_models(identities, "fast_hash", update_query)
+
+
+class ResolvedIdentity(NamedTuple):
+  image_id: bytes
+  identity: Optional[ImageIdentityTable]
+  is_new: bool
+
+
+def resolve_image_id(
+  identities: dict[bytes, ImageIdentityTable], file: Path
+) -> ResolvedIdentity:
+  fast_hash = hash_geotiff_fast(file)
+  identity = identities.get(fast_hash)
+
+  if identity is None:
+    return ResolvedIdentity(fast_hash, make_identity(fast_hash, fast_hash, None), True)
+
+  if identity.collision:
+    # The file indexed first keeps its stored id, the others their full hash
+    full_hash = hash_geotiff(file)
+    image_id = identity.image_id if full_hash == identity.full_hash else full_hash
+    return ResolvedIdentity(image_id, None, False)
+
+  return ResolvedIdentity(identity.image_id, identity, False)
+
+
+def check_collision(
+  identity: ImageIdentityTable, file: Path, indexed_file: Optional[Path]
+) -> Optional[ResolvedIdentity]:
+  # indexed_file is the existing file indexed under the identity, if any. The
+  # returned identity replaces the shared one, which other workers may read.
+  full_hash = hash_geotiff(file)
+  stored_hash = identity.full_hash
+
+  if stored_hash is None:
+    if indexed_file is None:
+      # The indexed file was moved or renamed, this file takes its place
+      return ResolvedIdentity(
+        identity.image_id,
+        make_identity(identity.fast_hash, identity.image_id, full_hash),
+        True,
+      )
+
+    stored_hash = hash_geotiff(indexed_file)
+
+  if full_hash == stored_hash:
+    if identity.full_hash is not None:
+      return None
+
+    return ResolvedIdentity(
+      identity.image_id,
+      make_identity(identity.fast_hash, identity.image_id, stored_hash),
+      True,
+    )
+
+  logger.warning(
+    "Fast identity collision for %s, falling back to the full hash", str(file)
+  )
+  collided = make_identity(identity.fast_hash, identity.image_id, stored_hash)
+  collided.collision = 1
+  return ResolvedIdentity(full_hash, collided, True)
+
+
+def image_path(catalog_path: str, relative_path: str, filename: str, filetype: str):
+  return Path(catalog_path) / relative_path / f"{filename}{filetype}"
+
+
+def migrate_identities(db: SqliteDatabase, catalog_id: UUID) -> int:
+  identity_table = ImageIdentityTable.table_name()
+
+  query = (
+    SelectQuery()
+    .select(
+      "i.id AS id",
+      "c.path AS path",
+      "i.relative_path AS relative_path",
+      "i.filename AS filename",
+      "i.filetype AS filetype",
+      f"(SELECT o.full_hash FROM {identity_table} o "
+      "WHERE o.image_id = i.id AND o.full_hash IS NOT NULL LIMIT 1) AS full_hash",
+      f"EXISTS (SELECT 1 FROM {identity_table} o WHERE o.image_id = i.id) AS tracked",
+    )
+    .from_(f"{ImageIndexTable.table_name()} i")
+    .inner_join(f"{CatalogTable.table_name()} c", "c.id = i.catalog")
+    .left_join(
+      f"{identity_table} v",
+      "v.image_id = i.id AND v.version = ?",
+      FAST_HASH_VERSION,
+    )
+    .where("i.catalog = ?", catalog_id.bytes)
+    .where("v.fast_hash IS NULL")
+  )
+
+  identities: list[ImageIdentityTable] = []
+  for record in db.select_records(query):
+    path = image_path(
+      record["path"], record["relative_path"], record["filename"], record["filetype"]
+    )
+    if not path.exists():
+      continue
+
+    # Untracked rows were indexed with the full SHA-256 as their id
+    full_hash = record["full_hash"] if record["tracked"] else record["id"]
+    identities.append(make_identity(hash_geotiff_fast(path), record["id"], full_hash))
+
+  if identities:
+    upsert_identities(db, identities)
+
+  return len(identities)
+
+
+def merge_image_id(db: SqliteDatabase, image_id: bytes, full_hash: bytes):
+  # Points everything at full_hash and drops the images row of image_id
+  cursor = db.conn.cursor()
+  cursor.execute(
+    f"UPDATE {ImageIdentityTable.table_name()} SET image_id = ?, full_hash = ? "
+    "WHERE image_id = ?",
+    (full_hash, full_hash, image_id),
+  )
+  cursor.execute(
+    f"UPDATE {FileFingerprintTable.table_name()} SET hash = ? WHERE hash = ?",
+    (full_hash, image_id),
+  )
+  for table, column in (
+    (RadiometricParamsTable, "id"),
+    (AreaImageCoverageTable, "image_id"),
+    (ImageIndexTable, "id"),
+  ):
+    cursor.execute(f"DELETE FROM {table.table_name()} WHERE {column} = ?", (image_id,))
+
+
+_verify_lock = threading.Lock()
+
+
+def verify_identities():
+  if not _verify_lock.acquire(blocking=False):
+    return
+
+  try:
+    query = (
+      SelectQuery()
+      .select(
+        "v.fast_hash AS fast_hash",
+        "v.image_id AS image_id",
+        "c.path AS path",
+        "i.relative_path AS relative_path",
+        "i.filename AS filename",
+        "i.filetype AS filetype",
+      )
+      .from_(f"{ImageIdentityTable.table_name()} v")
+      .inner_join(f"{ImageIndexTable.table_name()} i", "i.id = v.image_id")
+      .inner_join(f"{CatalogTable.table_name()} c", "c.id = i.catalog")
+      .where("v.full_hash IS NULL")
+    )
+
+    with SqliteDatabase(app_settings.INDEX_DB) as db:
+      records = db.select_records(query)
+
+    for record in records:
+      path = image_path(
+        record["path"], record["relative_path"], record["filename"], record["filetype"]
+      )
+      if not path.exists():
+        continue
+
+      full_hash = hash_geotiff(path)
+
+      with SqliteDatabase(app_settings.INDEX_DB) as db:
+        cursor = db.conn.cursor()
+        cursor.execute(
+          f"SELECT 1 FROM {ImageIndexTable.table_name()} WHERE id = ? AND id != ?",
+          (full_hash, record["image_id"]),
+        )
+        if cursor.fetchone() is None:
+          cursor.execute(
+            f"UPDATE {ImageIdentityTable.table_name()} SET full_hash = ? "
+            "WHERE fast_hash = ?",
+            (full_hash, record["fast_hash"]),
+          )
+          continue
+
+        # The image is indexed twice, keep the row under its full hash
+        logger.info("Merging %s into its row indexed by full hash", str(path))
+        merge_image_id(db, record["image_id"], full_hash)
+
+      reassign_image_annotations(record["image_id"], full_hash)
+      get_footprint_index().remove([record["image_id"]])
+      bump_index_generation()
+
+  except Exception:
+    logger.exception("Failed to verify image identities")
+
+  finally:
+    _verify_lock.release()
+
+
+def start_identity_verification():
+  threading.Thread(
+    target=verify_identities, name="identity-verification", daemon=True
+  ).start()
@@ -0,0 +1,63 @@
+from enum import Enum
+
+from src.parse.image_metadata import BandStatistics
+from src.sqlite.table import (
+  ColumnType,
+  Field,
+  GeometryField,
+  Index,
+  Table,
+  datetime_field,
+  enum_field,
+  hash_field,
+  json_field,
+  path_field,
+  uuid_field,
+)
+
+# An image is only as fine as its coarser axis; filters and ordering share
+# this expression so both can use the same expression index
+GSD_EXPRESSION = "max(ground_sample_distance_row, ground_sample_distance_col)"
+
+
+class ImagerySensorType(Enum):
+  EO = "eo"
+  SAR = "sar"
+
+
+class ImageryType(str, Enum):
+  GRD = "grd"
+  PAN = "pan"
+  MS = "ms"
+  SLC = "slc"
+
+
+class ImageIndexTable(Table):
+  _table_name = "images"
+  id = hash_field(True)
+  catalog = uuid_field(False, False)
+  relative_path = path_field(False, False)
+  filename = Field(str, nullable=False)
+  filetype = Field(str, nullable=False)
+  classification = Field(str)
+  datetime_collected = datetime_field(False)
+  sensor_name = Field(str)
+  sensor_type = enum_field(ImagerySensorType, ColumnType.TEXT)
+  image_type = enum_field(ImageryType, ColumnType.TEXT)
+  footprint = GeometryField(str, geometry_type="POLYGON")
+  look_angle = Field(float)
+  azimuth_angle = Field(float)
+  ground_sample_distance_row = Field(float)
+  ground_sample_distance_col = Field(float)
+  interpretation_rating = Field(float)
+  band_statistics = json_field(list[BandStatistics], nullable=False)
+
+  _indexes = [
+    Index(("catalog", "relative_path", "filename")),
+    Index(("filename",)),
+    Index(("datetime_collected", "id")),
+    Index(("interpretation_rating", "id")),
+    Index(("azimuth_angle", "id")),
+    Index(("look_angle", "id")),
+    Index((GSD_EXPRESSION, "id"), name="ix_images_ground_sample_distance_id"),
+  ]
@@ -1,8 +1,22 @@
+import base64
+import os
 import warnings
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
 from enum import Enum
+from functools import partial
 from pathlib import Path
-from typing import Callable, Literal, Optional, TypeAlias, TypedDict, Union, cast
+from typing import (
+  Any,
+  Callable,
+  Literal,
+  NamedTuple,
+  Optional,
+  TypeAlias,
+  TypedDict,
+  Union,
+  cast,
+)
 from uuid import UUID
 
 from src.bootstrap import get_settings
@@ -14,10 +28,47 @@ from src.gdal_utils import (
   gdalwarp,
   parse_gdalinfo_json_field,
 )
-from src.hashing import hash_geotiff
+from src.hashing import decode_sha256_from_b64, hash_geotiff
+from src.geometry import Polygon, bounds_overlap_area, wkt_bounds
+from src.index.area_coverage import (
+  AREA_ATTACHMENTS,
+  AreaImageCoverageTable,
+  refresh_image_coverage,
+)
 from src.index.catalog import CatalogTable, get_catalog_edit_data, update_index_time
+from src.index.fingerprint import (
+  FileFingerprintTable,
+  get_catalog_fingerprints,
+  is_unchanged,
+  stat_fingerprint,
+  upsert_fingerprints,
+)
+from src.index.footprints import (
+  FootprintBounds,
+  get_footprint_index,
+  select_footprint_bounds,
+)
+from src.index.identity import (
+  ImageIdentityTable,
+  check_collision,
+  fast_identity_enabled,
+  get_identities,
+  migrate_identities,
+  resolve_image_id,
+  start_identity_verification,
+  upsert_identities,
+)
+from src.index.image_table import (
+  GSD_EXPRESSION,
+  ImageIndexTable,
+  ImagerySensorType,
+  ImageryType,
+)
+from src.index.pipeline import Pipeline, Stage
 from src.index.radiometric import RadiometricParamsTable, make_radiometric_row
+from src.index.search_cache import bump_index_generation, cached_search
 from src.models.areas import get_area_wkt
+from src.msgpack import decode_msgpack, encode_msgpack
 from src.parse.bj3_metadata import get_bj3_info
 from src.parse.capella_metadata import get_capella_info
 from src.parse.iceye_metadata import get_iceye_info
@@ -31,18 +82,7 @@ from src.parse.sicd_metadata import parse_sicd_info
 from src.parse.sicd_model import SicdObject
 from src.sqlite.connect import SqliteDatabase
 from src.sqlite.query_builder import SelectQuery, UpdateQuery
-from src.sqlite.table import (
-  ColumnType,
-  Field,
-  GeometryField,
-  Table,
-  datetime_field,
-  enum_field,
-  hash_field,
-  json_field,
-  path_field,
-  uuid_field,
-)
+from src.sqlite.table import RowBatch
 
 app_settings = get_settings()
 
@@ -56,42 +96,60 @@ OrderColumn: TypeAlias = Literal[
 ]
 
 
-class ImagerySensorType(Enum):
-  EO = "eo"
-  SAR = "sar"
+ORDER_EXPRESSIONS: dict[str, str] = {
+  "datetime_collected": "datetime_collected",
+  "coverage": "coverage",
+  "ground_sample_distance": GSD_EXPRESSION,
+  "interpretation_rating": "interpretation_rating",
+  "azimuth_angle": "azimuth_angle",
+  "look_angle": "look_angle",
+}
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+COUNT_ESTIMATE_LIMIT = 10_000
+CURSOR_KEY = "cursor_key"
+
+COVERAGE_EXPRESSION = "ST_Area(ST_Intersection(footprint, poly.geom)) / poly.area"
+# Slack for rounding differences between the bound and the exact area
+COVERAGE_EPSILON = 1e-9
+COVERAGE_CHUNK_SIZE = 500
+
+# Footprint index candidates are bound as one blob of SHA-256 image ids and
+# split again by a recursive CTE
+IMAGE_ID_SIZE = 32
+CANDIDATES_SQL = (
+  "WITH RECURSIVE candidate_offsets(n) AS "
+  "(SELECT 0 UNION ALL SELECT n + 1 FROM candidate_offsets WHERE n + 1 < ?) "
+  f"SELECT substr(?, n * {IMAGE_ID_SIZE} + 1, {IMAGE_ID_SIZE}) "
+  "FROM candidate_offsets"
+)
+
+CountMode: TypeAlias = Literal["exact", "estimate"]
+GeometryMode: TypeAlias = Literal["none", "bbox", "simplified", "full"]
 
+# Search results only need footprints for map previews, so simplified
+# outlines are reduced to roughly 10 m and 6 decimals (about 0.1 m)
+SIMPLIFY_TOLERANCE = 1e-4
+GEOJSON_PRECISION = 6
 
-class ImageryType(str, Enum):
-  GRD = "grd"
-  PAN = "pan"
-  MS = "ms"
-  SLC = "slc"
+BBOX_COLUMNS = (
+  ("bbox_minx", "MbrMinX(footprint)"),
+  ("bbox_miny", "MbrMinY(footprint)"),
+  ("bbox_maxx", "MbrMaxX(footprint)"),
+  ("bbox_maxy", "MbrMaxY(footprint)"),
+)
 
 
-class ImageIndexTable(Table):
-  _table_name = "images"
-  id = hash_field(True)
-  catalog = uuid_field(False, False)
-  relative_path = path_field(False, False)
-  filename = Field(str, nullable=False)
-  filetype = Field(str, nullable=False)
-  classification = Field(str)
-  datetime_collected = datetime_field(False)
-  sensor_name = Field(str)
-  sensor_type = enum_field(ImagerySensorType, ColumnType.TEXT)
-  image_type = enum_field(ImageryType, ColumnType.TEXT)
-  footprint = GeometryField(str, geometry_type="POLYGON")
-  look_angle = Field(float)
-  azimuth_angle = Field(float)
-  ground_sample_distance_row = Field(float)
-  ground_sample_distance_col = Field(float)
-  interpretation_rating = Field(float)
-  band_statistics = json_field(list[BandStatistics], nullable=False)
+# Projectable search fields; the footprint is controlled by the geometry mode
+SEARCH_FIELDS = (frozenset(ImageIndexTable._fields) - {"footprint"}) | {"coverage"}
 
 
 def create_index_table():
   with SqliteDatabase(app_settings.INDEX_DB, spatial=True) as db:
     db.create_table(ImageIndexTable)
+    db.create_table_indexes(ImageIndexTable)
+    db.create_spatial_indexes(ImageIndexTable)
 
 
 def detect_image_type(
@@ -114,11 +172,7 @@ def detect_image_type(
 
 
 def make_index_row(data: dict) -> ImageIndexTable:
-  row = ImageIndexTable()
-  for key, value in data.items():
-    setattr(row, key, value)
-
-  return row
+  return ImageIndexTable(**data)
 
 
 def parse_image_info(
@@ -237,9 +291,10 @@ class IndexAction(Enum):
   REINDEX_FILENAME = "reindex_filename"
   INDEXED = "indexed"
   DUPLICATE = "duplicate"
+  UNCHANGED = "unchanged"
 
 
-def check_image(image_path: Path, hash: bytes) -> tuple[IndexAction, Union[str, None]]:
+def indexed_image_path(hash: bytes) -> Optional[Path]:
   query = (
     SelectQuery()
     .select(
@@ -253,10 +308,13 @@ def check_image(image_path: Path, hash: bytes) -> tuple[IndexAction, Union[str,
   with SqliteDatabase(app_settings.INDEX_DB, spatial=True) as db:
     result = db.select_model_records(ImageIndexTable, query)
 
-  if not result:
-    return (IndexAction.NOT_INDEXED, None)
+  return Path(result[0]["path"]) if result else None
+
 
-  indexed_path = Path(result[0]["path"])
+def check_image(image_path: Path, hash: bytes) -> tuple[IndexAction, Union[str, None]]:
+  indexed_path = indexed_image_path(hash)
+  if indexed_path is None:
+    return (IndexAction.NOT_INDEXED, None)
 
   if not indexed_path.exists():
     if indexed_path.stem != image_path.stem:
@@ -319,39 +377,145 @@ def process_cog(
     generate_cog(image_file, cog_path)
 
 
-def index_image(
-  catalog_id: UUID, image_dir: Path, file: Path, thumbnail_minsize: tuple[int, int]
-):
-  image_hash = hash_geotiff(file)
-  action, old_stem = check_image(file, image_hash)
+@dataclass
+class IndexJob:
+  file: Path
+  fingerprint: Optional[FileFingerprintTable] = None
+  image_hash: Optional[bytes] = None
+  identity: Optional[ImageIdentityTable] = None
+  identity_changed: bool = False
+  action: Optional[IndexAction] = None
+  old_stem: Optional[str] = None
+  metadata: Optional[dict] = None
+  index_row: Optional[ImageIndexTable] = None
+  radiometric_row: Optional[RadiometricParamsTable] = None
+
+
+def default_workers(fraction: float, limit: Optional[int] = None) -> int:
+  workers = max(1, int((os.cpu_count() or 1) * fraction))
+  return workers if limit is None else min(workers, limit)
+
+
+@dataclass(frozen=True)
+class IndexConcurrency:
+  hash: int = field(default_factory=lambda: default_workers(0.25, 4))
+  metadata: int = field(default_factory=lambda: default_workers(1.0))
+  thumbnail: int = field(default_factory=lambda: default_workers(0.5))
+  cog: int = field(default_factory=lambda: default_workers(0.25))
+  queue_size: int = 32
+  write_batch_size: int = 256
+
+
+class IndexFailure(TypedDict):
+  file: str
+  error: str
+
+
+class IndexReport(TypedDict):
+  total: int
+  skipped: int
+  rehashed: int
+  indexed: int
+  failed: int
+  errors: list[IndexFailure]
+
+
+def hash_stage(
+  fingerprints: dict[str, FileFingerprintTable],
+  identities: Optional[dict[bytes, ImageIdentityTable]],
+  job: IndexJob,
+) -> bool:
+  job.fingerprint = stat_fingerprint(job.file)
+
+  cached = fingerprints.get(job.fingerprint.path)
+  if cached is not None and is_unchanged(cached, job.fingerprint):
+    job.image_hash = cached.hash
+    job.action = IndexAction.UNCHANGED
+    return False
+
+  if identities is None:
+    job.image_hash = hash_geotiff(job.file)
+  else:
+    job.image_hash, job.identity, job.identity_changed = resolve_image_id(
+      identities, job.file
+    )
+
+  job.fingerprint.hash = job.image_hash
+  return True
+
 
-  if action == IndexAction.INDEXED:
-    return None, None
+def metadata_stage(catalog_id: UUID, image_dir: Path, job: IndexJob) -> bool:
+  if job.image_hash is None:
+    raise ValueError(f"Missing hash for {str(job.file)}")
+
+  job.action, job.old_stem = check_image(job.file, job.image_hash)
+
+  unverified = (
+    IndexAction.DUPLICATE,
+    IndexAction.REINDEX_FILENAME,
+    IndexAction.REINDEX_PARENT,
+  )
+  if job.identity is not None and not job.identity_changed and job.action in unverified:
+    indexed_file = (
+      indexed_image_path(job.image_hash)
+      if job.action == IndexAction.DUPLICATE
+      else None
+    )
+    resolved = check_collision(job.identity, job.file, indexed_file)
+    if resolved is not None:
+      job.identity = resolved.identity
+      job.identity_changed = True
 
-  if action == IndexAction.DUPLICATE:
+    if resolved is not None and resolved.image_id != job.image_hash:
+      job.image_hash = resolved.image_id
+      if job.fingerprint is not None:
+        job.fingerprint.hash = resolved.image_id
+
+      job.action, job.old_stem = check_image(job.file, job.image_hash)
+
+  if job.action == IndexAction.INDEXED:
+    return False
+
+  if job.action == IndexAction.DUPLICATE:
     # TODO: handle duplicates
-    return None, None
+    return False
 
-  metadata = parse_image_metadata(file)
-  relative_directory = file.parent.relative_to(image_dir)
-  index_row, radiometric_row = parse_image_info(
-    metadata, image_hash, catalog_id, file, relative_directory
+  job.metadata = parse_image_metadata(job.file)
+  relative_directory = job.file.parent.relative_to(image_dir)
+  job.index_row, job.radiometric_row = parse_image_info(
+    job.metadata, job.image_hash, catalog_id, job.file, relative_directory
   )
 
-  if action == IndexAction.REINDEX_PARENT:
-    return index_row, radiometric_row
+  return job.action != IndexAction.REINDEX_PARENT
 
-  process_thumbnail(file, metadata, index_row, action, old_stem, thumbnail_minsize)
-  process_cog(file, action, old_stem)
 
-  return index_row, radiometric_row
+def thumbnail_stage(thumbnail_minsize: tuple[int, int], job: IndexJob) -> bool:
+  if job.metadata is None or job.index_row is None or job.action is None:
+    raise ValueError(f"Missing metadata for {str(job.file)}")
+
+  process_thumbnail(
+    job.file, job.metadata, job.index_row, job.action, job.old_stem, thumbnail_minsize
+  )
+  return True
+
+
+def cog_stage(job: IndexJob) -> bool:
+  if job.action is None:
+    raise ValueError(f"Missing index action for {str(job.file)}")
+
+  process_cog(job.file, job.action, job.old_stem)
+  return True
 
 
 def index_images(
   catalog_id: UUID,
   thumbnail_minsize: tuple[int, int] = (600, 400),
   progress_callback: Optional[Callable[[int, int, str], None]] = None,
-):
+  concurrency: Optional[IndexConcurrency] = None,
+) -> IndexReport:
+  if concurrency is None:
+    concurrency = IndexConcurrency()
+
   extensions = {".tif", ".tiff"}
   query = (
     SelectQuery()
@@ -360,7 +524,9 @@ def index_images(
     .where("id = ?", catalog_id.bytes)
   )
 
-  with SqliteDatabase(app_settings.INDEX_DB, spatial=True) as db:
+  with SqliteDatabase(
+    app_settings.INDEX_DB, spatial=True, attach=AREA_ATTACHMENTS
+  ) as db:
     catalog_record = db.select_model_records(CatalogTable, query)
     if not catalog_record:
       from pprint import pformat
@@ -379,35 +545,121 @@ def index_images(
       if f.suffix.lower() in extensions and not f.name.lower().endswith("_browser.tif")
     ]
     total = len(files)
+    report = IndexReport(
+      total=total, skipped=0, rehashed=0, indexed=0, failed=0, errors=[]
+    )
 
-    image_index: list[ImageIndexTable] = []
-    radiometric_index: list[RadiometricParamsTable] = []
+    fingerprints = get_catalog_fingerprints(db, image_dir)
+
+    identities = None
+    if fast_identity_enabled():
+      migrate_identities(db, catalog_id)
+      identities = get_identities(db)
+
+    pipeline = Pipeline(
+      (
+        Stage(
+          "hash", partial(hash_stage, fingerprints, identities), concurrency.hash
+        ),
+        Stage(
+          "metadata",
+          partial(metadata_stage, catalog_id, image_dir),
+          concurrency.metadata,
+        ),
+        Stage(
+          "thumbnail",
+          partial(thumbnail_stage, thumbnail_minsize),
+          concurrency.thumbnail,
+        ),
+        Stage("cog", cog_stage, concurrency.cog),
+      ),
+      queue_size=concurrency.queue_size,
+    )
 
-    for i, file in enumerate(files, start=1):
+    update_query = UpdateQuery().set_excluded(
+      "catalog", "relative_path", "filename", "filetype"
+    )
+
+    image_index = RowBatch(ImageIndexTable)
+    radiometric_index = RowBatch(RadiometricParamsTable)
+    fingerprint_index: list[FileFingerprintTable] = []
+    identity_index: list[ImageIdentityTable] = []
+
+    def flush():
+      # Every batch is committed, so the write lock on index.db is only held
+      # while a batch is written and an interrupted run keeps earlier batches
+      footprints: list[FootprintBounds] = []
+      indexed = len(image_index)
+
+      if image_index:
+        db.insert_models(image_index, "id", update_query)
+        image_ids = image_index.column("id")
+        footprints = select_footprint_bounds(db, image_ids)
+        refresh_image_coverage(db, image_ids)
+        image_index.clear()
+
+      if radiometric_index:
+        db.insert_models(radiometric_index, "id")
+        radiometric_index.clear()
+
+      if fingerprint_index:
+        upsert_fingerprints(db, fingerprint_index)
+        fingerprint_index.clear()
+
+      if identity_index:
+        upsert_identities(db, identity_index)
+        identity_index.clear()
+
+      db.conn.commit()
+
+      if indexed:
+        report["indexed"] += indexed
+        get_footprint_index().upsert(footprints)
+        bump_index_generation()
+
+    jobs = (IndexJob(file) for file in files)
+    for i, (job, error) in enumerate(pipeline.run(jobs), start=1):
+      relative_file = str(job.file.relative_to(image_dir))
       if progress_callback:
-        progress_callback(i, total, str(file.relative_to(image_dir)))
+        progress_callback(i, total, relative_file)
 
-      index_row, radiometric_row = index_image(
-        catalog_id, image_dir, file, thumbnail_minsize
-      )
+      if error is not None:
+        # Nothing of a failed file is written, so the next run retries it
+        warnings.warn(f"Failed to index {relative_file}: {error}")
+        report["failed"] += 1
+        report["errors"].append(IndexFailure(file=relative_file, error=str(error)))
+        continue
 
-      if index_row is not None:
-        image_index.append(index_row)
+      if job.action == IndexAction.UNCHANGED:
+        report["skipped"] += 1
+        continue
 
-      if radiometric_row is not None:
-        radiometric_index.append(radiometric_row)
+      report["rehashed"] += 1
 
-    update_query = UpdateQuery().set_excluded(
-      "catalog", "relative_path", "filename", "filetype"
-    )
+      if job.fingerprint is not None:
+        fingerprint_index.append(job.fingerprint)
 
-    db.insert_models(image_index, "id", update_query)
+      if job.identity is not None and job.identity_changed:
+        identity_index.append(job.identity)
+
+      if job.index_row is not None:
+        image_index.append(job.index_row)
+
+      if job.radiometric_row is not None:
+        radiometric_index.append(job.radiometric_row)
+
+      if len(fingerprint_index) >= concurrency.write_batch_size:
+        flush()
+
+    flush()
 
     current_timestamp = datetime.now(timezone.utc)
     update_index_time(db, catalog_id, current_timestamp)
 
-    if radiometric_index:
-      db.insert_models(radiometric_index, "id")
+  if identities is not None:
+    start_identity_verification()
+
+  return report
 
 
 class ImageQuery(TypedDict, total=False):
@@ -416,7 +668,7 @@ class ImageQuery(TypedDict, total=False):
   ordering: Optional[Literal["asc", "desc"]]
   order_by: Optional[OrderColumn]
   filename: Optional[str]
-  min_coverage: Optional[int]
+  min_coverage: Optional[float]
   min_iirs: Optional[float]
   max_gsd: Optional[float]
   date_start: Optional[int]
@@ -425,9 +677,51 @@ class ImageQuery(TypedDict, total=False):
   azimuth_end: Optional[float]
   lookangle_min: Optional[float]
   lookangle_max: Optional[float]
+  limit: Optional[int]
+  cursor: Optional[str]
+  count: Optional[CountMode]
+  fields: Optional[list[str]]
+  geometry: Optional[GeometryMode]
+
+
+class ImageSearchResult(TypedDict, total=False):
+  wkt: Optional[str]
+  images: list[dict]
+  next_cursor: Optional[str]
+  total: int
+  total_estimated: bool
+
+
+class SearchCursor(NamedTuple):
+  order_by: Optional[str]
+  ordering: str
+  value: Any
+  id: bytes
+
+
+def encode_search_cursor(cursor: SearchCursor) -> str:
+  token = base64.urlsafe_b64encode(encode_msgpack(list(cursor)))
+  return token.decode("ascii").rstrip("=")
+
+
+def decode_search_cursor(token: str) -> SearchCursor:
+  try:
+    data = decode_msgpack(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    cursor = SearchCursor(*data)
+  except (TypeError, ValueError) as e:
+    raise ValueError("Invalid search cursor") from e
+
+  if not isinstance(cursor.id, bytes):
+    raise ValueError("Invalid search cursor")
 
+  return cursor
 
-def search_images(payload: ImageQuery):
+
+def search_images(payload: ImageQuery) -> ImageSearchResult:
+  return cached_search(payload, partial(_search_images, payload))
+
+
+def _search_images(payload: ImageQuery) -> ImageSearchResult:
   wkt = payload.get("wkt")
   area_id = payload.get("area_id")
   if area_id is not None:
@@ -436,26 +730,314 @@ def search_images(payload: ImageQuery):
   return get_images_by_intersection(wkt, payload)
 
 
-def get_images_by_intersection(polygon_wkt: Optional[str], payload: ImageQuery):
-  columns = ImageIndexTable.column_sql()
+def get_images_by_intersection(
+  polygon_wkt: Optional[str], payload: ImageQuery
+) -> ImageSearchResult:
+  count_mode = payload.get("count")
+  if count_mode not in (None, "exact", "estimate"):
+    raise ValueError(f"Unsupported count mode: {count_mode}")
+
+  limit = payload.get("limit")
+  token = payload.get("cursor")
+  if limit is None and token is not None:
+    limit = DEFAULT_PAGE_SIZE
+
+  if limit is not None and (
+    not isinstance(limit, int) or not 0 < limit <= MAX_PAGE_SIZE
+  ):
+    raise ValueError(f"limit must be an integer between 1 and {MAX_PAGE_SIZE}")
+
+  cursor = decode_search_cursor(token) if token is not None else None
+
+  # Saved areas read their coverage from area_image_coverage instead of
+  # intersecting the footprints at search time
+  candidates = None
+  if polygon_wkt is not None and payload.get("area_id") is None:
+    footprints = get_footprint_index().search_rows(wkt_bounds(polygon_wkt))
+    threshold = coverage_threshold(payload)
+    if threshold is None:
+      candidates = [row[0] for row in footprints]
+    else:
+      candidates = coverage_candidates(footprints, polygon_wkt, threshold)
+
+    if not candidates:
+      result = ImageSearchResult(wkt=polygon_wkt, images=[], next_cursor=None)
+      if count_mode is not None:
+        result.update(total=0, total_estimated=False)
+      return result
+
+  with SqliteDatabase(app_settings.INDEX_DB, spatial=True) as db:
+    if limit is None:
+      query = build_image_query(polygon_wkt, payload, candidates)
+      images = db.select_model_records(ImageIndexTable, query, True)
+      next_cursor = None
+    else:
+      images, next_cursor = select_image_page(
+        db, polygon_wkt, payload, candidates, limit, cursor
+      )
+
+    pack_bboxes(images)
+
+    fields = payload.get("fields")
+    if (
+      polygon_wkt is not None
+      and payload.get("area_id") is None
+      and payload.get("order_by") != "coverage"
+      and (fields is None or "coverage" in fields)
+    ):
+      add_image_coverage(db, polygon_wkt, images)
+
+    result = ImageSearchResult(wkt=polygon_wkt, images=images, next_cursor=next_cursor)
+    if count_mode is not None:
+      total, estimated = count_images(db, polygon_wkt, payload, candidates, count_mode)
+      result.update(total=total, total_estimated=estimated)
+
+  return result
+
+
+def coverage_threshold(payload: ImageQuery) -> Optional[float]:
+  # min_coverage is given in percent of the search area
+  min_coverage = payload.get("min_coverage")
+  return min_coverage / 100 if min_coverage is not None else None
+
+
+def coverage_candidates(
+  footprints: list[FootprintBounds], polygon_wkt: str, threshold: float
+) -> list[bytes]:
+  # The part of the area a footprint covers lies within the overlap of their
+  # bounding boxes, so that overlap bounds the coverage from above. Only a
+  # POLYGON is parsed; other geometries keep every candidate and are left to
+  # the exact coverage filter.
+  try:
+    area = Polygon.parse_wkt(polygon_wkt).area
+  except ValueError:
+    return [row[0] for row in footprints]
+
+  if area <= 0:
+    return [row[0] for row in footprints]
+
+  area_bounds = wkt_bounds(polygon_wkt)
+  min_overlap = (threshold - COVERAGE_EPSILON) * area
+  return [
+    image_id
+    for image_id, minx, miny, maxx, maxy in footprints
+    if bounds_overlap_area((minx, miny, maxx, maxy), area_bounds) >= min_overlap
+  ]
+
+
+def add_image_coverage(db: SqliteDatabase, polygon_wkt: str, images: list[dict]):
+  ids = [decode_sha256_from_b64(image["id"]) for image in images]
+
+  coverage: dict[bytes, float] = {}
+  for start in range(0, len(ids), COVERAGE_CHUNK_SIZE):
+    chunk = ids[start : start + COVERAGE_CHUNK_SIZE]
+    query = (
+      SelectQuery()
+      .with_("poly", polygon_query(polygon_wkt))
+      .select("id", f"{COVERAGE_EXPRESSION} AS coverage")
+      .from_(ImageIndexTable.table_name())
+      .cross_join("poly")
+      .where(f"id IN ({', '.join('?' * len(chunk))})", *chunk)
+    )
+    sql, params = query.build()
+    coverage.update(db.conn.execute(sql, params).fetchall())
+
+  for image, image_id in zip(images, ids):
+    image["coverage"] = coverage.get(image_id)
+
+
+def _order_is_nullable(order_by: Optional[str]) -> bool:
+  if order_by is None or order_by == "coverage":
+    return False
+
+  field = ImageIndexTable._fields.get(order_by)
+  return field is None or field.nullable
+
+
+def keyset_conditions(
+  order_by: Optional[str], ordering: str, cursor: SearchCursor
+) -> list[tuple[str, list[Any]]]:
+  # Rows following the cursor, split into the segments SQLite sorts NULL
+  # order values into (first when ascending, last when descending) so that
+  # every segment stays a range seek on the (order column, id) index
+  id_column = f"{ImageIndexTable.table_name()}.id"
+  op = ">" if ordering == "asc" else "<"
+
+  if order_by is None:
+    return [(f"{id_column} {op} ?", [cursor.id])]
+
+  expression = ORDER_EXPRESSIONS[order_by]
+  if cursor.value is None:
+    conditions = [(f"{expression} IS NULL AND {id_column} {op} ?", [cursor.id])]
+    if ordering == "asc":
+      conditions.append((f"{expression} IS NOT NULL", []))
+    return conditions
+
+  conditions = [
+    (
+      f"{expression} {op}= ? AND ({expression}, {id_column}) {op} (?, ?)",
+      [cursor.value, cursor.value, cursor.id],
+    )
+  ]
+  if ordering == "desc" and _order_is_nullable(order_by):
+    conditions.append((f"{expression} IS NULL", []))
+
+  return conditions
+
+
+def select_image_page(
+  db: SqliteDatabase,
+  polygon_wkt: Optional[str],
+  payload: ImageQuery,
+  candidates: Optional[list[bytes]],
+  limit: int,
+  cursor: Optional[SearchCursor],
+) -> tuple[list[dict], Optional[str]]:
+  order_by = payload.get("order_by")
+  ordering = payload.get("ordering") or "asc"
+
+  if ordering not in ("asc", "desc"):
+    raise ValueError(f"Unsupported ordering: {ordering}")
+
+  if cursor is not None and cursor[:2] != (order_by, ordering):
+    raise ValueError("Search cursor does not match the requested ordering")
+
+  conditions: list[Optional[tuple[str, list[Any]]]] = [None]
+  if cursor is not None:
+    conditions = [*keyset_conditions(order_by, ordering, cursor)]
+
+  key_column = "coverage" if order_by == "coverage" else CURSOR_KEY
+
+  # One row past the page tells whether another page follows
+  images: list[dict] = []
+  for condition in conditions:
+    query = build_image_query(polygon_wkt, payload, candidates)
+    if order_by is None:
+      query.order_by(f"{ImageIndexTable.table_name()}.id", ordering)
+    elif key_column == CURSOR_KEY:
+      query.select(f"{ORDER_EXPRESSIONS[order_by]} AS {CURSOR_KEY}")
+
+    if condition is not None:
+      query.where(condition[0], *condition[1])
+
+    query.limit(limit + 1 - len(images))
+    images += db.select_model_records(ImageIndexTable, query, True)
+    if len(images) > limit:
+      break
+
+  next_cursor = None
+  if len(images) > limit:
+    del images[limit:]
+    last = images[-1]
+    next_cursor = encode_search_cursor(
+      SearchCursor(
+        order_by,
+        ordering,
+        last.get(key_column) if order_by is not None else None,
+        decode_sha256_from_b64(last["id"]),
+      )
+    )
+
+  for image in images:
+    image.pop(CURSOR_KEY, None)
+
+  return images, next_cursor
+
+
+def count_images(
+  db: SqliteDatabase,
+  polygon_wkt: Optional[str],
+  payload: ImageQuery,
+  candidates: Optional[list[bytes]],
+  mode: CountMode,
+) -> tuple[int, bool]:
+  filters = cast(
+    ImageQuery,
+    {k: v for k, v in payload.items() if k not in ("order_by", "ordering")},
+  )
+
+  if mode == "exact":
+    sql, params = build_image_query(polygon_wkt, filters, candidates).build()
+    row = db.conn.execute(f"SELECT count(*) FROM ({sql})", params).fetchone()
+    return row[0], False
+
+  # The estimate skips the exact footprint intersection and stops counting
+  # at COUNT_ESTIMATE_LIMIT, so a polygon search yields an upper bound from
+  # the footprint bounding boxes. Saved areas are counted exactly from
+  # area_image_coverage.
+  if candidates is not None:
+    polygon_wkt = None
+
+  query = build_image_query(polygon_wkt, filters, candidates)
+  sql, params = query.limit(COUNT_ESTIMATE_LIMIT).build()
+  total = db.conn.execute(f"SELECT count(*) FROM ({sql})", params).fetchone()[0]
+
+  return total, candidates is not None or total >= COUNT_ESTIMATE_LIMIT
+
+
+def search_columns(payload: ImageQuery) -> list[str]:
+  fields = payload.get("fields")
+  if fields is None:
+    columns = [name for name in ImageIndexTable._fields if name != "footprint"]
+  else:
+    unknown = set(fields) - SEARCH_FIELDS
+    if unknown:
+      raise ValueError(f"Unsupported search fields: {', '.join(sorted(unknown))}")
+
+    # id identifies the image for /api/image-info and keys the page cursor
+    columns = ["id"] + [
+      name for name in dict.fromkeys(fields) if name not in ("id", "coverage")
+    ]
+
+  geometry = payload.get("geometry") or "full"
+  if geometry == "full":
+    columns.append("AsGeoJSON(footprint) AS footprint")
+  elif geometry == "simplified":
+    columns.append(
+      f"AsGeoJSON(SimplifyPreserveTopology(footprint, {SIMPLIFY_TOLERANCE}), "
+      f"{GEOJSON_PRECISION}) AS footprint"
+    )
+  elif geometry == "bbox":
+    columns += [f"{expression} AS {alias}" for alias, expression in BBOX_COLUMNS]
+  elif geometry != "none":
+    raise ValueError(f"Unsupported geometry mode: {geometry}")
+
+  return columns
+
+
+def pack_bboxes(images: list[dict]):
+  for image in images:
+    if BBOX_COLUMNS[0][0] in image:
+      image["bbox"] = [image.pop(alias) for alias, _ in BBOX_COLUMNS]
+
+
+def polygon_query(polygon_wkt: str) -> SelectQuery:
+  return (
+    SelectQuery()
+    .select("geom", "ST_Area(geom) AS area")
+    .from_("(SELECT ST_GeomFromText(?, 4326) AS geom) AS tmp", polygon_wkt)
+  )
+
+
+def build_image_query(
+  polygon_wkt: Optional[str],
+  payload: ImageQuery,
+  candidates: Optional[list[bytes]] = None,
+) -> SelectQuery:
+  columns = search_columns(payload)
   query = SelectQuery().from_(ImageIndexTable.table_name()).select(*columns)
 
   filename = payload.get("filename")
   if filename is not None:
     query.where("filename = ?", filename)
 
-  min_coverage = payload.get("min_coverage")
-  if min_coverage is not None:
-    query.where("coverage >= ?", min_coverage)
-
   min_iirs = payload.get("min_iirs")
   if min_iirs is not None:
     query.where("interpretation_rating >= ?", min_iirs)
 
   max_gsd = payload.get("max_gsd")
   if max_gsd is not None:
-    query.where("ground_sample_distance_row <= ?", max_gsd)
-    query.where("ground_sample_distance_col <= ?", max_gsd)
+    query.where(f"{GSD_EXPRESSION} <= ?", max_gsd)
 
   date_start = payload.get("date_start")
   date_end = payload.get("date_end")
@@ -482,32 +1064,67 @@ def get_images_by_intersection(polygon_wkt: Optional[str], payload: ImageQuery):
 
   lookangle_min = payload.get("lookangle_min")
   if lookangle_min is not None:
-    query.where("azimuth_angle >= ?", lookangle_min)
+    query.where("look_angle >= ?", lookangle_min)
 
   lookangle_max = payload.get("lookangle_max")
   if lookangle_max is not None:
-    query.where("azimuth_angle <= ?", lookangle_max)
+    query.where("look_angle <= ?", lookangle_max)
 
-  if polygon_wkt is not None:
-    polygon_cte = (
-      SelectQuery()
-      .select("geom", "ST_Area(geom) AS area")
-      .from_("(SELECT ST_GeomFromText(?, 4326) AS geom) AS tmp", polygon_wkt)
+  if candidates is not None:
+    query.where(
+      f"{ImageIndexTable.table_name()}.id IN ({CANDIDATES_SQL})",
+      len(candidates),
+      b"".join(candidates),
     )
 
-    query.with_("poly", polygon_cte).cross_join("poly").where(
-      "ST_Intersects(footprint, poly.geom)"
-    ).select("ST_Area(ST_Intersection(footprint, poly.geom)) / poly.area AS coverage")
+  # Coverage is relative to the search polygon, so min_coverage is ignored
+  # without one
+  area_id = payload.get("area_id")
+  threshold = coverage_threshold(payload)
+  if area_id is not None:
+    query.inner_join(
+      f"{AreaImageCoverageTable.table_name()} ac",
+      f"ac.image_id = {ImageIndexTable.table_name()}.id AND ac.area_id = ?",
+      UUID(area_id).bytes,
+    )
+
+    fields = payload.get("fields")
+    if fields is None or "coverage" in fields or payload.get("order_by") == "coverage":
+      query.select("ac.coverage AS coverage")
+
+    if threshold is not None:
+      query.where("ac.coverage >= ?", threshold)
+  elif polygon_wkt is not None:
+    query.with_("poly", polygon_query(polygon_wkt)).cross_join("poly")
+    query.where("ST_Intersects(footprint, poly.geom)")
+
+    # The exact intersection area is the costliest term of the search. It is
+    # selected here only to order by; otherwise it is evaluated as a filter
+    # and computed for the returned page afterwards (add_image_coverage)
+    if payload.get("order_by") == "coverage":
+      query.select(f"{COVERAGE_EXPRESSION} AS coverage")
+      if threshold is not None:
+        query.where("coverage >= ?", threshold)
+    elif threshold is not None:
+      query.where(f"{COVERAGE_EXPRESSION} >= ?", threshold)
 
   order_by = payload.get("order_by")
   if order_by is not None:
+    order_expression = ORDER_EXPRESSIONS.get(order_by)
+    if order_expression is None or (
+      order_by == "coverage" and polygon_wkt is None and area_id is None
+    ):
+      raise ValueError(f"Unsupported order column: {order_by}")
+
     ordering = payload.get("ordering") or "asc"
-    query.order_by(order_by, ordering)
+    if ordering not in ("asc", "desc"):
+      raise ValueError(f"Unsupported ordering: {ordering}")
 
-  with SqliteDatabase(app_settings.INDEX_DB, spatial=True) as db:
-    results = db.select_model_records(ImageIndexTable, query, True)
+    # id breaks ties so that pages keyed on (order column, id) are stable
+    query.order_by(order_expression, ordering)
+    query.order_by(f"{ImageIndexTable.table_name()}.id", ordering)
 
-  return {"wkt": polygon_wkt, "images": results}
+  return query
 
 
 def get_image_info(id: bytes) -> dict:
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Callable, Generic, Iterable, Iterator, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+
+_SENTINEL = object()
+_POLL_INTERVAL = 0.1
+
+
+@dataclass(frozen=True)
+class Stage(Generic[T]):
+  # fn processes a job in place and returns False once the job needs no
+  # further stages
+  name: str
+  fn: Callable[[T], bool]
+  workers: int = 1
+
+
+class Pipeline(Generic[T]):
+  def __init__(self, stages: Sequence[Stage[T]], queue_size: int = 32):
+    if not stages:
+      raise ValueError("Pipeline requires at least one stage")
+
+    if queue_size < 1:
+      raise ValueError("queue_size must be a positive integer")
+
+    for stage in stages:
+      if stage.workers < 1:
+        raise ValueError(f"Stage '{stage.name}' requires at least one worker")
+
+    self.stages = tuple(stages)
+    self.queue_size = queue_size
+    self._stop = threading.Event()
+
+  def _put(self, q: queue.Queue, item) -> bool:
+    while not self._stop.is_set():
+      try:
+        q.put(item, timeout=_POLL_INTERVAL)
+        return True
+      except queue.Full:
+        continue
+
+    return False
+
+  def _get(self, q: queue.Queue):
+    while not self._stop.is_set():
+      try:
+        return q.get(timeout=_POLL_INTERVAL)
+      except queue.Empty:
+        continue
+
+    return _SENTINEL
+
+  def run(self, jobs: Iterable[T]) -> Iterator[tuple[T, Optional[BaseException]]]:
+    self._stop.clear()
+
+    inputs = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+    results: queue.Queue = queue.Queue(maxsize=self.queue_size)
+
+    remaining = [stage.workers for stage in self.stages]
+    remaining_lock = threading.Lock()
+
+    def finish_worker(index: int):
+      with remaining_lock:
+        remaining[index] -= 1
+        last = remaining[index] == 0
+
+      if not last:
+        return
+
+      if index + 1 < len(self.stages):
+        for _ in range(self.stages[index + 1].workers):
+          self._put(inputs[index + 1], _SENTINEL)
+      else:
+        self._put(results, _SENTINEL)
+
+    def work(index: int, stage: Stage[T]):
+      is_last = index + 1 == len(self.stages)
+
+      try:
+        while True:
+          job = self._get(inputs[index])
+          if job is _SENTINEL:
+            break
+
+          try:
+            forward = stage.fn(job)
+          except Exception as e:
+            self._put(results, (job, e))
+            continue
+
+          if forward and not is_last:
+            self._put(inputs[index + 1], job)
+          else:
+            self._put(results, (job, None))
+      finally:
+        finish_worker(index)
+
+    def feed():
+      try:
+        for job in jobs:
+          if not self._put(inputs[0], job):
+            return
+      finally:
+        for _ in range(self.stages[0].workers):
+          self._put(inputs[0], _SENTINEL)
+
+    threads = [threading.Thread(target=feed, name="pipeline-feed", daemon=True)]
+    for index, stage in enumerate(self.stages):
+      for n in range(stage.workers):
+        threads.append(
+          threading.Thread(
+            target=work,
+            args=(index, stage),
+            name=f"pipeline-{stage.name}-{n}",
+            daemon=True,
+          )
+        )
+
+    for thread in threads:
+      thread.start()
+
+    try:
+      while True:
+        item = self._get(results)
+        if item is _SENTINEL:
+          break
+
+        yield item
+    finally:
+      self._stop.set()
+      for thread in threads:
+        thread.join()
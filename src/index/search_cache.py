@@ -0,0 +1,219 @@
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Mapping, NamedTuple, Optional, TypedDict, TypeVar
+
+T = TypeVar("T")
+
+DEFAULT_CACHE_BYTES = int(os.getenv("SEARCH_CACHE_BYTES", str(64 * 1024 * 1024)))
+DEFAULT_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "600"))
+
+# A single result larger than this share of the budget would evict most of
+# the cache for one query, so it is not stored
+MAX_ENTRY_FRACTION = 0.25
+
+WKT_SPACING_REGEX = re.compile(r"\s*([(),])\s*")
+
+
+@dataclass
+class CacheCounters:
+  hits: int = 0
+  misses: int = 0
+  expired: int = 0
+  stale: int = 0
+  evictions: int = 0
+  oversized: int = 0
+
+
+class SearchCacheStats(TypedDict):
+  entries: int
+  bytes: int
+  max_bytes: int
+  ttl: float
+  generation: int
+  hit_ratio: float
+  hits: int
+  misses: int
+  expired: int
+  stale: int
+  evictions: int
+  oversized: int
+
+
+class CacheEntry(NamedTuple):
+  value: Any
+  size: int
+  generation: int
+  expires_at: float
+
+
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+def index_generation() -> int:
+  return _generation
+
+
+def bump_index_generation() -> int:
+  # Searches still running when the index changes finish under the old
+  # generation and are not stored
+  global _generation
+  with _generation_lock:
+    _generation += 1
+    generation = _generation
+
+  _search_cache.clear()
+  return generation
+
+
+def estimate_size(value: Any) -> int:
+  # Approximate deep size of decoded rows; dict keys are column names
+  # shared between rows, so only values are walked
+  size = 0
+  stack = [value]
+  while stack:
+    item = stack.pop()
+    size += sys.getsizeof(item)
+    if isinstance(item, dict):
+      stack.extend(item.values())
+    elif isinstance(item, (list, tuple)):
+      stack.extend(item)
+
+  return size
+
+
+def _canonical(value: Any) -> Any:
+  if isinstance(value, float) and value.is_integer():
+    return int(value)
+
+  if isinstance(value, (list, tuple)):
+    return [_canonical(v) for v in value]
+
+  return value
+
+
+def search_cache_key(payload: Mapping[str, Any]) -> str:
+  # Unset and null parameters are equivalent, as are spacing and case in the
+  # WKT and the order of projected fields
+  canonical: dict[str, Any] = {}
+  for name, value in payload.items():
+    if value is None:
+      continue
+
+    if name == "wkt":
+      value = WKT_SPACING_REGEX.sub(r"\1", " ".join(value.split())).upper()
+    elif name == "area_id":
+      value = value.lower()
+    elif name == "fields":
+      value = sorted(set(value))
+
+    canonical[name] = _canonical(value)
+
+  return json.dumps(canonical, sort_keys=True, separators=(",", ":"), default=repr)
+
+
+class SearchCache:
+  def __init__(
+    self, max_bytes: int = DEFAULT_CACHE_BYTES, ttl: float = DEFAULT_CACHE_TTL
+  ):
+    if max_bytes < 0:
+      raise ValueError("max_bytes must be a non-negative integer")
+
+    self.max_bytes = max_bytes
+    self.ttl = ttl
+    self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+    self._bytes = 0
+    self._lock = threading.Lock()
+    self._counters = CacheCounters()
+
+  def _remove(self, key: str):
+    entry = self._entries.pop(key)
+    self._bytes -= entry.size
+
+  def get(self, key: str) -> Optional[Any]:
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        self._counters.misses += 1
+        return None
+
+      if entry.generation != _generation:
+        self._counters.stale += 1
+      elif entry.expires_at <= time.monotonic():
+        self._counters.expired += 1
+      else:
+        self._entries.move_to_end(key)
+        self._counters.hits += 1
+        return entry.value
+
+      self._remove(key)
+      self._counters.misses += 1
+      return None
+
+  def put(self, key: str, value: Any, generation: int):
+    size = len(key) + estimate_size(value)
+
+    with self._lock:
+      if generation != _generation:
+        self._counters.stale += 1
+        return
+
+      if size > self.max_bytes * MAX_ENTRY_FRACTION:
+        self._counters.oversized += 1
+        return
+
+      if key in self._entries:
+        self._remove(key)
+
+      self._entries[key] = CacheEntry(
+        value, size, generation, time.monotonic() + self.ttl
+      )
+      self._bytes += size
+
+      while self._bytes > self.max_bytes:
+        self._remove(next(iter(self._entries)))
+        self._counters.evictions += 1
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self._bytes = 0
+
+  def stats(self) -> SearchCacheStats:
+    with self._lock:
+      lookups = self._counters.hits + self._counters.misses
+      return SearchCacheStats(
+        entries=len(self._entries),
+        bytes=self._bytes,
+        max_bytes=self.max_bytes,
+        ttl=self.ttl,
+        generation=_generation,
+        hit_ratio=self._counters.hits / lookups if lookups else 0.0,
+        **asdict(self._counters),
+      )
+
+
+_search_cache = SearchCache()
+
+
+def cached_search(payload: Mapping[str, Any], search: Callable[[], T]) -> T:
+  # Cached results are shared between callers and must not be mutated
+  key = search_cache_key(payload)
+  result = _search_cache.get(key)
+  if result is not None:
+    return result
+
+  generation = index_generation()
+  result = search()
+  _search_cache.put(key, result, generation)
+  return result
+
+
+def search_cache_stats() -> SearchCacheStats:
+  return _search_cache.stats()
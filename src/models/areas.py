@@ -2,6 +2,15 @@ import uuid
 from typing import Optional, TypedDict
 
 from src.bootstrap import get_settings
+from src.index.area_coverage import (
+  AREA_ATTACHMENTS,
+  AREA_DB_ALIAS,
+  AreaImageCoverageTable,
+  delete_area_coverage,
+  refresh_area_coverage,
+)
+from src.index.search_cache import bump_index_generation
+from src.models.tile_cache import AREA_TILE_LAYER, invalidate_tiles
 from src.sqlite.connect import SqliteDatabase
 from src.sqlite.query_builder import SelectQuery, UpdateQuery
 from src.sqlite.table import (
@@ -30,6 +39,14 @@ class AreasTable(Table):
 def create_areas_tables():
   with SqliteDatabase(app_settings.LOCATION_DB, spatial=True) as db:
     db.create_table(AreasTable)
+    db.create_spatial_indexes(AreasTable)
+
+
+def area_coverage_database() -> SqliteDatabase:
+  # Areas are written through index.db with location.db attached, so that a
+  # failed area_image_coverage refresh rolls back the area change with it.
+  # The unqualified areas table resolves to the attached location.db.
+  return SqliteDatabase(app_settings.INDEX_DB, spatial=True, attach=AREA_ATTACHMENTS)
 
 
 class AreaUpdate(TypedDict):
@@ -55,7 +72,7 @@ def update_area(payload: AreaUpdate):
     .where("id != ?", uuid.UUID(payload["id"]).bytes)
   )
 
-  with SqliteDatabase(app_settings.LOCATION_DB, spatial=True) as db:
+  with area_coverage_database() as db:
     found_name = db.select_model_records(AreasTable, query)
 
     if found_name:
@@ -63,6 +80,10 @@ def update_area(payload: AreaUpdate):
 
     model = AreasTable.from_dict(payload, json=True)
     db.insert_models((model,), "id", update_query)
+    refresh_area_coverage(db, uuid.UUID(payload["id"]))
+
+  bump_index_generation()
+  invalidate_tiles(AREA_TILE_LAYER)
 
 
 class AreaId(TypedDict):
@@ -113,8 +134,8 @@ def get_areas(polygon_wkt: Optional[str] = None):
       .from_("(SELECT ST_GeomFromText(?, 4326) AS geom) AS tmp", polygon_wkt)
     )
     query.with_("poly", polygon_cte).cross_join("poly").where(
-      "ST_Intersects(geometry, poly.geom)"
-    )
+      AreasTable.spatial_filter_sql("geometry", "(SELECT geom FROM poly)")
+    ).where("ST_Intersects(geometry, poly.geom)")
 
   with SqliteDatabase(app_settings.LOCATION_DB, spatial=True) as db:
     areas = db.select_model_records(AreasTable, query, True)
@@ -122,23 +143,18 @@ def get_areas(polygon_wkt: Optional[str] = None):
 
 
 def get_areas_by_image(image_id: bytes) -> list[dict]:
-  with SqliteDatabase(app_settings.INDEX_DB, spatial=True) as idx_db:
-    cursor = idx_db.conn.cursor()
-    cursor.execute("SELECT footprint FROM images WHERE id = ?", (image_id,))
-    row = cursor.fetchone()
-    if row is None:
-      return []
-    footprint = row[0]
-
   query, params = (
     SelectQuery()
-    .select("name, AsGeoJSON(geometry) AS geometry")
-    .from_("areas")
-    .where("ST_Intersects(geometry, ?)", footprint)
+    .select("a.name, AsGeoJSON(a.geometry) AS geometry")
+    .from_(f"{AreaImageCoverageTable.table_name()} ac")
+    .inner_join(f"{AREA_DB_ALIAS}.{AreasTable.table_name()} a", "a.id = ac.area_id")
+    .where("ac.image_id = ?", image_id)
   ).build()
 
-  with SqliteDatabase(app_settings.LOCATION_DB, spatial=True) as loc_db:
-    cursor = loc_db.conn.cursor()
+  with SqliteDatabase(
+    app_settings.INDEX_DB, spatial=True, attach=AREA_ATTACHMENTS
+  ) as db:
+    cursor = db.conn.cursor()
     cursor.execute(query, params)
     rows = cursor.fetchall()
 
@@ -152,5 +168,9 @@ class AreaDelete(TypedDict):
 def delete_areas(payload: AreaDelete):
   delete_ids = [uuid.UUID(u) for u in payload["delete"]]
 
-  with SqliteDatabase(app_settings.LOCATION_DB, spatial=True) as db:
+  with area_coverage_database() as db:
     db.delete_by_ids(AreasTable, delete_ids)
+    delete_area_coverage(db, delete_ids)
+
+  bump_index_generation()
+  invalidate_tiles(AREA_TILE_LAYER)
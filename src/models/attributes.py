@@ -1,4 +1,5 @@
 import uuid
+from functools import lru_cache
 from typing import Optional, TypedDict
 
 from src.bootstrap import get_settings
@@ -36,6 +37,9 @@ class AttributeTableList(Table):
   label = Field(str, nullable=False, unique=True)
 
 
+# Models are built once per table so that the row decoders compiled for them
+# are reused
+@lru_cache(maxsize=None)
 def make_attribute_model(table_name: str) -> type[Table]:
   class AttributeTable(Table):
     _table_name = table_name
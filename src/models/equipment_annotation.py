@@ -1,11 +1,13 @@
 import json
 import re
 import uuid
+from functools import lru_cache
 from sqlite3 import Row
-from typing import Literal, NamedTuple, TypedDict, Union, cast
+from typing import Literal, NamedTuple, Optional, TypedDict, Union, cast
 
 from src.bootstrap import get_settings
 from src.hashing import encode_sha256_to_b64
+from src.models.tile_cache import ANNOTATION_TILE_LAYER, invalidate_tiles
 from src.sqlite.connect import SqliteDatabase
 from src.sqlite.query_builder import (
   DeleteQuery,
@@ -16,6 +18,8 @@ from src.sqlite.query_builder import (
 from src.sqlite.table import (
   Field,
   GeometryField,
+  Index,
+  RowBatch,
   Table,
   datetime_field,
   hash_field,
@@ -36,6 +40,14 @@ SINGLE_ATTRIBUTE_FIELDS = (
 )
 MULTI_ATTRIBUTE_FIELDS = ("modification", "camoflage", "alternatives")
 NUMERIC_FIELDS = ("heading", "speed")
+ANNOTATION_TYPES = ("equipment", "activity")
+FILL_CHUNK_SIZE = 500
+
+ANNOTATION_ATTACHMENTS = {
+  "i": app_settings.INDEX_DB,
+  "ed": app_settings.EQUIPMENT_DB,
+  "a": app_settings.ATTRIBUTE_DB,
+}
 
 
 class AnnotationModels(NamedTuple):
@@ -43,6 +55,7 @@ class AnnotationModels(NamedTuple):
   junctions: dict[str, type[Table]]
 
 
+@lru_cache(maxsize=None)
 def equipment_annotation_models(geometry_type: EquipmentGeometry) -> AnnotationModels:
   table_name = f"equipment_{geometry_type.lower()}"
 
@@ -50,6 +63,9 @@ def equipment_annotation_models(geometry_type: EquipmentGeometry) -> AnnotationM
     _table_name = table_name
     id = uuid_field(True, False)
     image = hash_field(False)
+    # Acquisition time of the image, copied from the image index so that
+    # ghost searches filter on time without joining the images table
+    image_datetime = datetime_field(True)
     geometry = GeometryField(str, geometry_type=geometry_type)
     equipment = uuid_field(False, False)
     confidence = uuid_field(False, False)
@@ -64,6 +80,8 @@ def equipment_annotation_models(geometry_type: EquipmentGeometry) -> AnnotationM
     createdAtTimestamp = datetime_field(False)
     modifiedAtTimestamp = datetime_field(True)
 
+    _indexes = [Index(("image_datetime",))]
+
   EquipmentAnnotation.__name__ = f"{table_name.title().replace('_', '')}Table"
 
   junctions = {
@@ -76,16 +94,79 @@ def equipment_annotation_models(geometry_type: EquipmentGeometry) -> AnnotationM
 
 def create_annotation_tables():
   geometries = ("POINT", "POLYGON")
-  with SqliteDatabase(app_settings.ANNOTATION_DB, spatial=True) as db:
+  with SqliteDatabase(
+    app_settings.ANNOTATION_DB, spatial=True, attach=ANNOTATION_ATTACHMENTS
+  ) as db:
     for g in geometries:
       models = equipment_annotation_models(g)
 
-      db.create_table(models.annotation)
+      if not db.create_table(models.annotation):
+        add_image_datetime_column(db, models.annotation)
+
+      db.create_spatial_indexes(models.annotation)
+      db.create_table_indexes(models.annotation)
+      fill_image_datetimes(db, models.annotation)
+
       for junction in models.junctions.values():
         db.create_table(junction)
         db.create_table_indexes(junction)
 
 
+def add_image_datetime_column(db: SqliteDatabase, annotation_table: type[Table]):
+  table_name = annotation_table.table_name()
+  columns = {row[1] for row in db.conn.execute(f"PRAGMA table_info({table_name})")}
+  if "image_datetime" not in columns:
+    db.conn.execute(f"ALTER TABLE {table_name} ADD COLUMN image_datetime INTEGER")
+
+
+def fill_image_datetimes(
+  db: SqliteDatabase,
+  annotation_table: type[Table],
+  ids: Optional[list[uuid.UUID]] = None,
+):
+  # db must have the image index attached as "i". Without ids, rows whose image
+  # is not indexed yet keep a NULL time and are retried on the next call; with
+  # ids, the time of those rows is recomputed.
+  table_name = annotation_table.table_name()
+
+  def fill_query() -> UpdateQuery:
+    return (
+      UpdateQuery()
+      .table(table_name)
+      .set_raw(
+        "image_datetime = "
+        f"(SELECT datetime_collected FROM i.images WHERE id = {table_name}.image)"
+      )
+    )
+
+  if ids is None:
+    sql, params = fill_query().where("image_datetime IS NULL").build()
+    db.conn.execute(sql, params)
+    return
+
+  for start in range(0, len(ids), FILL_CHUNK_SIZE):
+    chunk = [i.bytes for i in ids[start : start + FILL_CHUNK_SIZE]]
+    sql, params = (
+      fill_query().where(f"id IN ({', '.join('?' * len(chunk))})", *chunk).build()
+    )
+    db.conn.execute(sql, params)
+
+
+def reassign_image_annotations(image_id: bytes, new_image_id: bytes):
+  with SqliteDatabase(app_settings.ANNOTATION_DB, spatial=True) as db:
+    for geometry_type in ("POINT", "POLYGON"):
+      sql, params = (
+        UpdateQuery()
+        .table(equipment_annotation_models(geometry_type).annotation.table_name())
+        .set("image", new_image_id)
+        .where("image = ?", image_id)
+        .build()
+      )
+      db.conn.execute(sql, params)
+
+  invalidate_tiles(ANNOTATION_TILE_LAYER)
+
+
 class AnnotationUpdate(TypedDict):
   type: Literal["activity", "equipment"]
   data: dict[str, Union[int, str, None]]
@@ -96,7 +177,7 @@ def update_annotations(payloads: list[AnnotationUpdate]):
     r"^(?:SRID=\d+;)?(POINT|POLYGON|MULTIPOLYGON)", re.IGNORECASE
   )
 
-  upsert_models: dict[str, list[type[Table]]] = {"equipment": [], "activity": []}
+  upsert_batches: dict[type[Table], RowBatch] = {}
   list_writes: list[tuple[AnnotationModels, uuid.UUID, dict[str, list[uuid.UUID]]]] = []
 
   update_query = UpdateQuery().set_excluded(
@@ -112,7 +193,7 @@ def update_annotations(payloads: list[AnnotationUpdate]):
   for payload in payloads:
     annotation_type = payload.get("type")
 
-    if annotation_type not in upsert_models:
+    if annotation_type not in ANNOTATION_TYPES:
       raise ValueError(f"Invalid annotation type: {annotation_type}")
 
     data = payload.get("data")
@@ -126,7 +207,10 @@ def update_annotations(payloads: list[AnnotationUpdate]):
 
     geometry = match.group(1)
     models = equipment_annotation_models(geometry)
-    upsert_models[annotation_type].append(models.annotation.from_dict(data, True))
+    table = models.annotation
+    if table not in upsert_batches:
+      upsert_batches[table] = RowBatch(table)
+    upsert_batches[table].append(table.from_dict(data, True))
 
     parent_id = uuid.UUID(data["id"])
     field_ids = {
@@ -135,17 +219,20 @@ def update_annotations(payloads: list[AnnotationUpdate]):
     }
     list_writes.append((models, parent_id, field_ids))
 
-  with SqliteDatabase(app_settings.ANNOTATION_DB, spatial=True) as db:
-    for models_list in upsert_models.values():
-      if not models_list:
-        continue
-
-      db.insert_models(models_list, "id", update_query)
+  with SqliteDatabase(
+    app_settings.ANNOTATION_DB, spatial=True, attach=ANNOTATION_ATTACHMENTS
+  ) as db:
+    # Point and polygon annotations live in separate tables
+    for table, batch in upsert_batches.items():
+      db.insert_models(batch, "id", update_query)
+      fill_image_datetimes(db, table, batch.column("id"))
 
     for models, parent_id, field_ids in list_writes:
       for field, ids in field_ids.items():
         db.set_uuid_list(models.junctions[field], parent_id, ids)
 
+  invalidate_tiles(ANNOTATION_TILE_LAYER)
+
 
 def delete_annotations(payload: dict[str, list[str]]):
   supported_keys = {"equipment": {"point", "polygon"}, "activity": {"multipolygon"}}
@@ -165,9 +252,9 @@ def delete_annotations(payload: dict[str, list[str]]):
 
     return annotation_type, geometry
 
-  def resolve_model(annotation_type: str, geometry: str):
+  def resolve_models(annotation_type: str, geometry: str) -> AnnotationModels:
     if annotation_type == "equipment":
-      return equipment_annotation_models(geometry).annotation
+      return equipment_annotation_models(geometry.upper())
 
     if annotation_type == "activity":
       raise NotImplementedError("Annotation deletion not implemented for activity")
@@ -177,9 +264,11 @@ def delete_annotations(payload: dict[str, list[str]]):
   with SqliteDatabase(app_settings.ANNOTATION_DB, spatial=True) as db:
     for key, ids in payload.items():
       annotation_type, geometry = parse_key(key)
-      model = resolve_model(annotation_type, geometry)
+      models = resolve_models(annotation_type, geometry)
       uuids = [uuid.UUID(u) for u in ids]
-      db.delete_by_ids(model, uuids)
+      db.delete_by_ids(models.annotation, uuids, tuple(models.junctions.values()))
+
+  invalidate_tiles(ANNOTATION_TILE_LAYER)
 
 
 def build_junction_array_sql(
@@ -271,29 +360,16 @@ def get_annotations_by_image(image_id: bytes):
 
     return query.where("ea.image = ?", image_id)
 
-  attach_statements = (
-    ("ed", f"ATTACH DATABASE '{app_settings.EQUIPMENT_DB}' AS ed"),
-    ("a", f"ATTACH DATABASE '{app_settings.ATTRIBUTE_DB}' AS a"),
-  )
-
   geometries = ["POINT", "POLYGON"]
   subqueries = [build_subquery(g) for g in geometries]
   select_sql, params = UnionQuery(*subqueries).build()
 
-  with SqliteDatabase(app_settings.ANNOTATION_DB, spatial=True) as db:
+  with SqliteDatabase(
+    app_settings.ANNOTATION_DB, spatial=True, attach=ANNOTATION_ATTACHMENTS
+  ) as db:
     db.conn.row_factory = Row
     cursor = db.conn.cursor()
-
-    attached: list[str] = []
-    try:
-      for alias, statement in attach_statements:
-        cursor.execute(statement)
-        attached.append(alias)
-
-      return [map_row(r) for r in cursor.execute(select_sql, params)]
-    finally:
-      for alias in reversed(attached):
-        cursor.execute(f"DETACH DATABASE {alias}")
+    return [map_row(r) for r in cursor.execute(select_sql, params)]
 
 
 class GhostSearch(TypedDict):
@@ -357,7 +433,7 @@ def get_annotation_ghosts_by_geometry(
     select_fields = [
       "uuid_blob_to_str(ea.id) AS id",
       "ea.image AS image",
-      "i.images.datetime_collected AS datetime",
+      "ea.image_datetime AS datetime",
       "AsGeoJSON(ea.geometry) AS geometry",
       "ed.equipment.display_name || '\n' || a.equipment_confidence.name  AS label",
       "uuid_blob_to_str(ea.equipment) AS equipment_id",
@@ -381,7 +457,6 @@ def get_annotation_ghosts_by_geometry(
       .select(*select_fields)
       .from_(f"{table} ea")
       .cross_join("poly")
-      .inner_join("i.images", "i.images.id = ea.image")
       .inner_join("ed.equipment", "ed.equipment.id = ea.equipment")
     )
 
@@ -390,21 +465,21 @@ def get_annotation_ghosts_by_geometry(
         f"a.equipment_{field}", f"a.equipment_{field}.id = ea.{field}"
       )
 
-    query = query.where(f"i.images.datetime_collected {date_op} ?", datetime).where(
-      "ST_Intersects(ea.geometry, poly.geom)"
+    annotation_table = equipment_annotation_models(geometry).annotation
+    query = (
+      query.where(f"ea.image_datetime {date_op} ?", datetime)
+      .where(
+        annotation_table.spatial_filter_sql(
+          "geometry", "(SELECT geom FROM poly)", alias="ea"
+        )
+      )
+      .where("ST_Intersects(ea.geometry, poly.geom)")
     )
 
     return query
 
   date_op = ">" if future else "<"
 
-  attach_sql = (
-    f"ATTACH DATABASE '{app_settings.INDEX_DB}' AS i",
-    f"ATTACH DATABASE '{app_settings.EQUIPMENT_DB}' AS ed",
-    f"ATTACH DATABASE '{app_settings.ATTRIBUTE_DB}' AS a",
-  )
-  detach_sql = ("DETACH i", "DETACH DATABASE ed", "DETACH DATABASE a")
-
   polygon_cte = (
     SelectQuery()
     .select("geom", "ST_Area(geom) AS area")
@@ -415,22 +490,16 @@ def get_annotation_ghosts_by_geometry(
   subqueries = [build_subquery(g) for g in geometries]
   select_sql, params = UnionQuery(*subqueries, cte=polygon_cte, cte_name="poly").build()
 
-  with SqliteDatabase(app_settings.ANNOTATION_DB, spatial=True) as db:
+  with SqliteDatabase(
+    app_settings.ANNOTATION_DB, spatial=True, attach=ANNOTATION_ATTACHMENTS
+  ) as db:
     db.conn.row_factory = Row
     cursor = db.conn.cursor()
 
-    for statement in attach_sql:
-      cursor.execute(statement)
+    for r in cursor.execute(select_sql, params):
+      map_row(r)
 
-    try:
-      for r in cursor.execute(select_sql, params):
-        map_row(r)
-
-      return sorted(ghost_data.values(), key=lambda d: d["datetime"])
-
-    finally:
-      for statement in detach_sql:
-        cursor.execute(statement)
+    return sorted(ghost_data.values(), key=lambda d: d["datetime"])
 
 
 class AnnotationConvert(TypedDict):
@@ -469,6 +538,7 @@ def convert_annotation(payload: AnnotationConvertBatch):
     INSERT INTO equipment_polygon(
       id,
       image,
+      image_datetime,
       equipment,
       confidence,
       status,
@@ -486,6 +556,7 @@ def convert_annotation(payload: AnnotationConvertBatch):
     SELECT
       id,
       image,
+      image_datetime,
       equipment,
       confidence,
       status,
@@ -522,3 +593,5 @@ def convert_annotation(payload: AnnotationConvertBatch):
         )
         delete_sql, delete_params = delete_query.build()
         cursor.execute(delete_sql, delete_params)
+
+  invalidate_tiles(ANNOTATION_TILE_LAYER)
@@ -0,0 +1,67 @@
+import os
+import shutil
+import threading
+import uuid
+from pathlib import Path
+from typing import Optional
+
+from src.bootstrap import get_settings
+
+app_settings = get_settings()
+
+AREA_TILE_LAYER = "areas"
+ANNOTATION_TILE_LAYER = "annotations"
+
+
+class TileCache:
+  # Encoded tiles are stored as {root}/{layer}/{variant}/{z}/{x}/{y}.mvt.
+  # Every edit of a layer bumps its generation and removes its directory; a
+  # tile rendered under an older generation is discarded instead of stored.
+  def __init__(self, root: Path):
+    self.root = root
+    self._lock = threading.Lock()
+    self._generations: dict[str, int] = {}
+
+  def tile_path(self, layer: str, variant: str, z: int, x: int, y: int) -> Path:
+    return self.root / layer / variant / str(z) / str(x) / f"{y}.mvt"
+
+  def generation(self, layer: str) -> int:
+    return self._generations.get(layer, 0)
+
+  def get(self, path: Path) -> Optional[bytes]:
+    try:
+      return path.read_bytes()
+    except FileNotFoundError:
+      return None
+
+  def put(self, layer: str, path: Path, data: bytes, generation: int):
+    tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+      path.parent.mkdir(parents=True, exist_ok=True)
+      tmp_path.write_bytes(data)
+    except FileNotFoundError:
+      # The layer was invalidated while the tile was being written
+      return
+
+    with self._lock:
+      if generation == self.generation(layer):
+        os.replace(tmp_path, path)
+        return
+
+    tmp_path.unlink(missing_ok=True)
+
+  def invalidate(self, layer: str):
+    with self._lock:
+      self._generations[layer] = self.generation(layer) + 1
+      shutil.rmtree(self.root / layer, ignore_errors=True)
+
+
+_tile_cache = TileCache(app_settings.TILE_CACHE_DIR)
+
+
+def get_tile_cache() -> TileCache:
+  return _tile_cache
+
+
+def invalidate_tiles(layer: str):
+  _tile_cache.invalidate(layer)
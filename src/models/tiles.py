@@ -0,0 +1,207 @@
+import json
+import math
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, NamedTuple, Optional
+
+from src.bootstrap import get_settings
+from src.geometry import Bounds
+from src.hashing import encode_sha256_to_b64
+from src.models.areas import AreasTable
+from src.models.equipment_annotation import equipment_annotation_models
+from src.models.tile_cache import (
+  ANNOTATION_TILE_LAYER,
+  AREA_TILE_LAYER,
+  get_tile_cache,
+)
+from src.mvt import (
+  DEFAULT_EXTENT,
+  MvtFeature,
+  MvtLayer,
+  PropertyValue,
+  TilePoint,
+  encode_tile,
+)
+from src.sqlite.connect import SqliteDatabase
+from src.sqlite.query_builder import SelectQuery
+from src.sqlite.table import Table
+
+app_settings = get_settings()
+
+MAX_ZOOM = 24
+MAX_LATITUDE = 85.0511287798066
+
+# Polygons are clipped to the tile plus this margin (in tile units) so that
+# outlines continue across tile edges without seams
+TILE_BUFFER = 64
+
+# Polygons are simplified to this tolerance in tile units before encoding
+SIMPLIFY_UNITS = 1.0
+
+
+class TileSource(NamedTuple):
+  table: type[Table]
+  properties: tuple[str, ...]
+  polygonal: bool
+
+
+class TileLayer(NamedTuple):
+  db_path: Path
+  sources: tuple[TileSource, ...]
+  image_filter: bool
+
+
+def _annotation_source(geometry_type: str) -> TileSource:
+  return TileSource(
+    equipment_annotation_models(geometry_type).annotation,
+    (
+      "uuid_blob_to_str(id) AS id",
+      "image",
+      "uuid_blob_to_str(equipment) AS equipment",
+    ),
+    geometry_type == "POLYGON",
+  )
+
+
+TILE_LAYERS: dict[str, TileLayer] = {
+  AREA_TILE_LAYER: TileLayer(
+    app_settings.LOCATION_DB,
+    (TileSource(AreasTable, ("uuid_blob_to_str(id) AS id", "name"), True),),
+    False,
+  ),
+  ANNOTATION_TILE_LAYER: TileLayer(
+    app_settings.ANNOTATION_DB,
+    (_annotation_source("POINT"), _annotation_source("POLYGON")),
+    True,
+  ),
+}
+
+
+def validate_tile(z: int, x: int, y: int):
+  if not 0 <= z <= MAX_ZOOM:
+    raise ValueError(f"Zoom level must be between 0 and {MAX_ZOOM}")
+
+  n = 1 << z
+  if not (0 <= x < n and 0 <= y < n):
+    raise ValueError(f"Tile {z}/{x}/{y} is outside the tile grid")
+
+
+def _tile_latitude(row: float, n: int) -> float:
+  return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+
+def tile_bounds(z: int, x: int, y: int, buffer: int = TILE_BUFFER) -> Bounds:
+  n = 1 << z
+  margin = buffer / DEFAULT_EXTENT
+
+  west = (x - margin) / n * 360 - 180
+  east = (x + 1 + margin) / n * 360 - 180
+  return west, _tile_latitude(y + 1 + margin, n), east, _tile_latitude(y - margin, n)
+
+
+def project_point(lon: float, lat: float, z: int, x: int, y: int) -> TilePoint:
+  n = 1 << z
+  lat = max(min(lat, MAX_LATITUDE), -MAX_LATITUDE)
+  sin_lat = math.sin(math.radians(lat))
+
+  px = (lon + 180) / 360 * n - x
+  py = (0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)) * n - y
+  return round(px * DEFAULT_EXTENT), round(py * DEFAULT_EXTENT)
+
+
+def _project_coordinates(
+  coordinates: list, project: Callable[[float, float], TilePoint]
+) -> Any:
+  if not coordinates:
+    return coordinates
+
+  if isinstance(coordinates[0], (int, float)):
+    return project(coordinates[0], coordinates[1])
+
+  return [_project_coordinates(c, project) for c in coordinates]
+
+
+def _source_query(
+  source: TileSource, z: int, bounds: Bounds, image_id: Optional[bytes]
+) -> SelectQuery:
+  # The tile frame is computed here, so it is inlined rather than bound once
+  # per reference
+  frame = "BuildMbr({!r}, {!r}, {!r}, {!r}, 4326)".format(*bounds)
+
+  geometry = "geometry"
+  if source.polygonal:
+    tolerance = 360 / (1 << z) / DEFAULT_EXTENT * SIMPLIFY_UNITS
+    geometry = (
+      "CollectionExtract(ST_Intersection("
+      f"SimplifyPreserveTopology(geometry, {tolerance!r}), {frame}), 3)"
+    )
+
+  query = (
+    SelectQuery()
+    .select(*source.properties, f"AsGeoJSON({geometry}) AS geometry")
+    .from_(source.table.table_name())
+    .where(source.table.spatial_filter_sql("geometry", frame))
+    .where(f"ST_Intersects(geometry, {frame})")
+  )
+
+  if image_id is not None:
+    query.where("image = ?", image_id)
+
+  return query
+
+
+def _feature_properties(record: dict[str, Any]) -> dict[str, PropertyValue]:
+  # Blob properties are image hashes, which clients address in base64
+  return {
+    key: encode_sha256_to_b64(value) if isinstance(value, bytes) else value
+    for key, value in record.items()
+  }
+
+
+def render_tile(
+  layer_name: str, z: int, x: int, y: int, image_id: Optional[bytes] = None
+) -> bytes:
+  layer = TILE_LAYERS[layer_name]
+  bounds = tile_bounds(z, x, y)
+  project = partial(project_point, z=z, x=x, y=y)
+
+  features: list[MvtFeature] = []
+  with SqliteDatabase(layer.db_path, spatial=True) as db:
+    for source in layer.sources:
+      query = _source_query(source, z, bounds, image_id)
+      for record in db.select_records(query):
+        geometry = record.pop("geometry")
+        if geometry is None:
+          continue
+
+        geometry = json.loads(geometry)
+        geometry["coordinates"] = _project_coordinates(geometry["coordinates"], project)
+        features.append(MvtFeature(geometry, _feature_properties(record)))
+
+  return encode_tile([MvtLayer(layer_name, features)])
+
+
+def get_tile(
+  layer_name: str, z: int, x: int, y: int, image_id: Optional[bytes] = None
+) -> bytes:
+  layer = TILE_LAYERS.get(layer_name)
+  if layer is None:
+    raise ValueError(f"Unknown tile layer: {layer_name}")
+
+  if image_id is not None and not layer.image_filter:
+    raise ValueError(f"Tile layer {layer_name} can not be filtered by image")
+
+  validate_tile(z, x, y)
+
+  cache = get_tile_cache()
+  variant = image_id.hex() if image_id is not None else "all"
+  path = cache.tile_path(layer_name, variant, z, x, y)
+
+  tile = cache.get(path)
+  if tile is not None:
+    return tile
+
+  generation = cache.generation(layer_name)
+  tile = render_tile(layer_name, z, x, y, image_id)
+  cache.put(layer_name, path, tile, generation)
+  return tile
@@ -1,243 +1,477 @@
 import struct
-from typing import Any, Literal
+from datetime import datetime
+from typing import Any, Callable, Iterator, Literal, NamedTuple, Union
+from uuid import UUID
+
+from src.timeutils import TimeUnit, datetime_to_unix, unix_to_datetime
+
+EXT_TIMESTAMP = -1
+EXT_UUID = 1
+FIXEXT_CODES = {1: 0xD4, 2: 0xD5, 4: 0xD6, 8: 0xD7, 16: 0xD8}
+
+STREAM_CHUNK_SIZE = 64 * 1024
+DEFAULT_MAX_BUFFER_SIZE = 256 * 1024 * 1024
+
+_uint8 = struct.Struct(">BB")
+_uint16 = struct.Struct(">BH")
+_uint32 = struct.Struct(">BI")
+_uint64 = struct.Struct(">BQ")
+_int8 = struct.Struct(">Bb")
+_int16 = struct.Struct(">Bh")
+_int32 = struct.Struct(">Bi")
+_int64 = struct.Struct(">Bq")
+_float32 = struct.Struct(">Bf")
+_float64 = struct.Struct(">Bd")
+_fixext = struct.Struct(">Bb")
+_ext8 = struct.Struct(">BBb")
+_ext16 = struct.Struct(">BHb")
+_ext32 = struct.Struct(">BIb")
+_timestamp32 = struct.Struct(">I")
+_timestamp64 = struct.Struct(">Q")
+_timestamp96 = struct.Struct(">Iq")
+
+
+class ExtType(NamedTuple):
+  code: int
+  data: bytes
 
 
 def pack_int(n: int) -> bytes:
-  if 0 <= n <= 127:
-    return bytes([n])
+  if 0 <= n <= 0x7F:
+    return bytes((n,))
   if -32 <= n < 0:
-    return struct.pack("b", n)
-  if -32768 <= n <= 32767:
-    return b"\xd1" + struct.pack(">h", n)
-  if -2147483648 <= n <= 2147483647:
-    return b"\xd2" + struct.pack(">i", n)
-  return b"\xd3" + struct.pack(">q", n)
+    return bytes((n & 0xFF,))
+  if n > 0:
+    if n <= 0xFF:
+      return _uint8.pack(0xCC, n)
+    if n <= 0xFFFF:
+      return _uint16.pack(0xCD, n)
+    if n <= 0xFFFFFFFF:
+      return _uint32.pack(0xCE, n)
+    if n <= 0xFFFFFFFFFFFFFFFF:
+      return _uint64.pack(0xCF, n)
+  else:
+    if n >= -0x80:
+      return _int8.pack(0xD0, n)
+    if n >= -0x8000:
+      return _int16.pack(0xD1, n)
+    if n >= -0x80000000:
+      return _int32.pack(0xD2, n)
+    if n >= -0x8000000000000000:
+      return _int64.pack(0xD3, n)
+
+  raise OverflowError(f"Integer out of msgpack range: {n}")
 
 
 def pack_float32(x: float) -> bytes:
-  return b"\xca" + struct.pack(">f", x)
+  return _float32.pack(0xCA, x)
 
 
 def pack_float64(x: float) -> bytes:
-  return b"\xcb" + struct.pack(">d", x)
-
-
-def pack_str(s: str) -> bytes:
-  b = s.encode()
-  l = len(b)
-  if l < 32:
-    return bytes([0xA0 | l]) + b
+  return _float64.pack(0xCB, x)
+
+
+def _pack_length(out: bytearray, length: int, fix: int, fix_max: int, codes: bytes):
+  if length <= fix_max:
+    out.append(fix | length)
+  elif codes[0] and length <= 0xFF:
+    out += _uint8.pack(codes[0], length)
+  elif length <= 0xFFFF:
+    out += _uint16.pack(codes[1], length)
+  elif length <= 0xFFFFFFFF:
+    out += _uint32.pack(codes[2], length)
+  else:
+    raise ValueError(f"Length out of msgpack range: {length}")
 
-  if l < 256:
-    return b"\xd9" + struct.pack("B", l) + b
 
-  return b"\xda" + struct.pack(">H", l) + b
+def pack_str_into(out: bytearray, b: bytes):
+  _pack_length(out, len(b), 0xA0, 31, b"\xd9\xda\xdb")
+  out += b
 
 
-def pack_bin(b: bytes) -> bytes:
-  l = len(b)
-  if l < 256:
-    return b"\xc4" + struct.pack("B", l) + b
-  return b"\xc5" + struct.pack(">H", l) + b
+def pack_bin_into(out: bytearray, b: bytes):
+  _pack_length(out, len(b), 0, -1, b"\xc4\xc5\xc6")
+  out += b
 
 
-def pack_array(arr: list) -> bytes:
-  out: list[bytes] = []
-  l = len(arr)
-  if l < 16:
-    out.append(bytes([0x90 | l]))
+def pack_ext_into(out: bytearray, ext_type: int, data: bytes):
+  length = len(data)
+  fixext = FIXEXT_CODES.get(length)
+  if fixext is not None:
+    out += _fixext.pack(fixext, ext_type)
+  elif length <= 0xFF:
+    out += _ext8.pack(0xC7, length, ext_type)
+  elif length <= 0xFFFF:
+    out += _ext16.pack(0xC8, length, ext_type)
+  elif length <= 0xFFFFFFFF:
+    out += _ext32.pack(0xC9, length, ext_type)
   else:
-    out.append(b"\xdc" + struct.pack(">H", l))
+    raise ValueError(f"Length out of msgpack range: {length}")
+  out += data
 
-  for item in arr:
-    out.append(encode_msgpack(item))
 
-  return b"".join(out)
+def pack_timestamp(dt: datetime) -> bytes:
+  seconds, nanoseconds = divmod(datetime_to_unix(dt, TimeUnit.NANOSECONDS), 10**9)
 
+  if seconds >> 34 == 0:
+    value = (nanoseconds << 34) | seconds
+    if value <= 0xFFFFFFFF:
+      return _timestamp32.pack(value)
+    return _timestamp64.pack(value)
 
-def pack_map(m: dict) -> bytes:
-  out = []
-  l = len(m)
-  if l < 16:
-    out.append(bytes([0x80 | l]))
-  else:
-    out.append(b"\xde" + struct.pack(">H", l))
-
-  for k, v in m.items():
-    out.append(encode_msgpack(k))
-    out.append(encode_msgpack(v))
-
-  return b"".join(out)
+  return _timestamp96.pack(nanoseconds, seconds)
 
 
 def encode_msgpack(x: Any, float_precision: Literal["32", "64"] = "64") -> bytes:
-  float_packer = pack_float32 if float_precision == "32" else pack_float64
-
-  if x is None:
-    return b"\xc0"
-  if isinstance(x, int):
-    return pack_int(x)
-  if isinstance(x, float):
-    return float_packer(x)
-  if isinstance(x, str):
-    return pack_str(x)
-  if isinstance(x, bytes):
-    return pack_bin(x)
-  if isinstance(x, list):
-    return pack_array(x)
-  if isinstance(x, dict):
-    return pack_map(x)
-  raise TypeError(f"Unsupported type: {type(x).__name__}")
-
-
-def unpack_int8(data: bytes, offset: int) -> tuple[int, int]:
-  return struct.unpack_from("b", data, offset)[0], offset + 1
-
-
-def unpack_uint8(data: bytes, offset: int) -> tuple[int, int]:
-  return struct.unpack_from("B", data, offset)[0], offset + 1
-
-
-def unpack_int16(data: bytes, offset: int) -> tuple[int, int]:
-  return struct.unpack_from(">h", data, offset)[0], offset + 1
-
-
-def unpack_uint16(data: bytes, offset: int) -> tuple[int, int]:
-  return struct.unpack_from(">H", data, offset)[0], offset + 2
-
+  float_struct, float_code = (
+    (_float32, 0xCA) if float_precision == "32" else (_float64, 0xCB)
+  )
+
+  out = bytearray()
+  stack = [x]
+  pop = stack.pop
+  push = stack.extend
+
+  while stack:
+    x = pop()
+    t = type(x)
+
+    if t is str:
+      b = x.encode()
+      if len(b) < 32:
+        out.append(0xA0 | len(b))
+        out += b
+      else:
+        pack_str_into(out, b)
+    elif t is int:
+      if 0 <= x <= 0x7F:
+        out.append(x)
+      else:
+        out += pack_int(x)
+    elif t is float:
+      out += float_struct.pack(float_code, x)
+    elif x is None:
+      out.append(0xC0)
+    elif t is bool:
+      out.append(0xC3 if x else 0xC2)
+    elif t is bytes:
+      pack_bin_into(out, x)
+    elif t is ExtType:
+      pack_ext_into(out, x.code, x.data)
+    elif t is dict or isinstance(x, dict):
+      _pack_length(out, len(x), 0x80, 15, b"\x00\xde\xdf")
+      items = [item for pair in x.items() for item in pair]
+      items.reverse()
+      push(items)
+    elif t is list or t is tuple or isinstance(x, (list, tuple)):
+      _pack_length(out, len(x), 0x90, 15, b"\x00\xdc\xdd")
+      push(reversed(x))
+    elif isinstance(x, bool):
+      out.append(0xC3 if x else 0xC2)
+    elif isinstance(x, int):
+      out += pack_int(x)
+    elif isinstance(x, float):
+      out += float_struct.pack(float_code, x)
+    elif isinstance(x, str):
+      pack_str_into(out, x.encode())
+    elif isinstance(x, (bytes, bytearray, memoryview)):
+      pack_bin_into(out, bytes(x))
+    elif isinstance(x, datetime):
+      pack_ext_into(out, EXT_TIMESTAMP, pack_timestamp(x))
+    elif isinstance(x, UUID):
+      pack_ext_into(out, EXT_UUID, x.bytes)
+    else:
+      raise TypeError(f"Unsupported type: {type(x).__name__}")
+
+  return bytes(out)
+
+
+class OutOfData(ValueError):
+  def __init__(self, message: str, offset: int = 0):
+    super().__init__(message)
+    self.offset = offset
+
+
+_MISSING = object()
+
+
+class _Frame:
+  __slots__ = ("container", "remaining", "key")
+
+  def __init__(self, container: Union[list, dict], remaining: int):
+    self.container = container
+    self.remaining = remaining
+    self.key = _MISSING
+
+
+_u8 = struct.Struct(">B")
+_u16 = struct.Struct(">H")
+_u32 = struct.Struct(">I")
+_u64 = struct.Struct(">Q")
+_i8 = struct.Struct(">b")
+_i16 = struct.Struct(">h")
+_i32 = struct.Struct(">i")
+_i64 = struct.Struct(">q")
+_f32 = struct.Struct(">f")
+_f64 = struct.Struct(">d")
+
+# Header byte -> (length struct, kind) for the sized formats
+_SIZED_FORMATS: dict[int, tuple[struct.Struct, str]] = {
+  0xC4: (_u8, "bin"),
+  0xC5: (_u16, "bin"),
+  0xC6: (_u32, "bin"),
+  0xC7: (_u8, "ext"),
+  0xC8: (_u16, "ext"),
+  0xC9: (_u32, "ext"),
+  0xD9: (_u8, "str"),
+  0xDA: (_u16, "str"),
+  0xDB: (_u32, "str"),
+  0xDC: (_u16, "array"),
+  0xDD: (_u32, "array"),
+  0xDE: (_u16, "map"),
+  0xDF: (_u32, "map"),
+}
+
+_FIXED_FORMATS: dict[int, struct.Struct] = {
+  0xCA: _f32,
+  0xCB: _f64,
+  0xCC: _u8,
+  0xCD: _u16,
+  0xCE: _u32,
+  0xCF: _u64,
+  0xD0: _i8,
+  0xD1: _i16,
+  0xD2: _i32,
+  0xD3: _i64,
+}
+
+_FIXEXT_LENGTHS = {code: length for length, code in FIXEXT_CODES.items()}
+
+
+def unpack_timestamp(data: bytes) -> datetime:
+  if len(data) == 4:
+    seconds, nanoseconds = _u32.unpack(data)[0], 0
+  elif len(data) == 8:
+    value = _u64.unpack(data)[0]
+    seconds, nanoseconds = value & 0x3FFFFFFFF, value >> 34
+  elif len(data) == 12:
+    nanoseconds, seconds = _timestamp96.unpack(data)
+  else:
+    raise ValueError(f"Invalid timestamp length: {len(data)}")
 
-def unpack_int32(data: bytes, offset: int) -> tuple[int, int]:
-  return struct.unpack_from(">i", data, offset)[0], offset + 1
+  return unix_to_datetime(seconds * 10**9 + nanoseconds, TimeUnit.NANOSECONDS)
 
 
-def unpack_uint32(data: bytes, offset: int) -> tuple[int, int]:
-  return struct.unpack_from(">I", data, offset)[0], offset + 4
+def unpack_ext(code: int, data: bytes) -> Any:
+  if code == EXT_TIMESTAMP:
+    return unpack_timestamp(data)
+  if code == EXT_UUID:
+    return UUID(bytes=data)
+  return ExtType(code, data)
 
 
-def unpack_int64(data: bytes, offset: int) -> tuple[int, int]:
-  return struct.unpack_from(">q", data, offset)[0], offset + 1
+def _read(mv: memoryview, offset: int) -> tuple[Any, int]:
+  end = len(mv)
+  if offset >= end:
+    raise OutOfData("Unexpected end of msgpack data")
 
+  b = mv[offset]
+  offset += 1
 
-def unpack_uint64(data: bytes, offset: int) -> tuple[int, int]:
-  return struct.unpack_from(">Q", data, offset)[0], offset + 8
+  if b <= 0x7F:  # positive fixint
+    return b, offset
+  if b >= 0xE0:  # negative fixint
+    return b - 256, offset
+  if b <= 0x8F:  # fixmap
+    return _Frame({}, b & 0x0F), offset
+  if b <= 0x9F:  # fixarray
+    return _Frame([], b & 0x0F), offset
+  if b <= 0xBF:  # fixstr
+    length = b & 0x1F
+    if offset + length > end:
+      raise OutOfData("Unexpected end of msgpack data")
+    return str(mv[offset : offset + length], "utf-8"), offset + length
+
+  if b == 0xC0:
+    return None, offset
+  if b == 0xC2:
+    return False, offset
+  if b == 0xC3:
+    return True, offset
+
+  fixed = _FIXED_FORMATS.get(b)
+  if fixed is not None:
+    if offset + fixed.size > end:
+      raise OutOfData("Unexpected end of msgpack data")
+    return fixed.unpack_from(mv, offset)[0], offset + fixed.size
+
+  fixext_length = _FIXEXT_LENGTHS.get(b)
+  if fixext_length is not None:
+    if offset + 1 + fixext_length > end:
+      raise OutOfData("Unexpected end of msgpack data")
+    code = _i8.unpack_from(mv, offset)[0]
+    data = bytes(mv[offset + 1 : offset + 1 + fixext_length])
+    return unpack_ext(code, data), offset + 1 + fixext_length
+
+  sized = _SIZED_FORMATS.get(b)
+  if sized is None:
+    raise ValueError(f"Unsupported msgpack byte: 0x{b:02x}")
+
+  length_struct, kind = sized
+  if offset + length_struct.size > end:
+    raise OutOfData("Unexpected end of msgpack data")
+
+  (length,) = length_struct.unpack_from(mv, offset)
+  start = offset + length_struct.size
+
+  if kind == "array":
+    return _Frame([], length), start
+  if kind == "map":
+    return _Frame({}, length), start
+
+  if kind == "ext":
+    if start + 1 + length > end:
+      raise OutOfData("Unexpected end of msgpack data")
+    code = _i8.unpack_from(mv, start)[0]
+    data = bytes(mv[start + 1 : start + 1 + length])
+    return unpack_ext(code, data), start + 1 + length
+
+  if start + length > end:
+    raise OutOfData("Unexpected end of msgpack data")
+
+  if kind == "str":
+    return str(mv[start : start + length], "utf-8"), start + length
+
+  return bytes(mv[start : start + length]), start + length
+
+
+def _unpack_from(mv: memoryview, offset: int, stack: list[_Frame]) -> tuple[Any, int]:
+  # Tokens are consumed atomically, so on OutOfData the stack and the last
+  # returned offset still describe a consistent partial parse
+  end = len(mv)
+  f64_unpack = _f64.unpack_from
+
+  while True:
+    # Inline the most common tokens before falling back to _read
+    b = mv[offset] if offset < end else -1
+    if 0 <= b <= 0x7F:
+      value = b
+      offset += 1
+    elif b == 0xCB and offset + 9 <= end:
+      value = f64_unpack(mv, offset + 1)[0]
+      offset += 9
+    elif 0xA0 <= b <= 0xBF and offset + 1 + (b & 0x1F) <= end:
+      start = offset + 1
+      offset = start + (b & 0x1F)
+      value = str(mv[start:offset], "utf-8")
+    else:
+      try:
+        value, offset = _read(mv, offset)
+      except OutOfData as e:
+        e.offset = offset
+        raise
+
+    if type(value) is _Frame:
+      if value.remaining:
+        stack.append(value)
+        continue
+      value = value.container
+
+    while stack:
+      frame = stack[-1]
+      container = frame.container
+
+      if type(container) is dict:
+        if frame.key is _MISSING:
+          frame.key = value
+          break
+        container[frame.key] = value
+        frame.key = _MISSING
+      else:
+        container.append(value)
+
+      frame.remaining -= 1
+      if frame.remaining:
+        break
+
+      stack.pop()
+      value = container
+    else:
+      return value, offset
+
+
+def unpack(
+  data: Union[bytes, bytearray, memoryview], offset: int = 0
+) -> tuple[Any, int]:
+  with memoryview(data) as mv:
+    return _unpack_from(mv, offset, [])
+
+
+def decode_msgpack(data: Union[bytes, bytearray, memoryview]) -> Any:
+  value, offset = unpack(data)
+  if offset != len(data):
+    raise ValueError("Extra data after msgpack value")
+  return value
 
 
-def unpack_float32(data: bytes, offset: int) -> tuple[float, int]:
-  return struct.unpack_from(">f", data, offset)[0], offset + 1
+class Unpacker:
+  def __init__(self, max_buffer_size: int = DEFAULT_MAX_BUFFER_SIZE):
+    self.max_buffer_size = max_buffer_size
+    self._buffer = bytearray()
+    self._offset = 0
+    self._stack: list[_Frame] = []
 
+  def feed(self, data: Union[bytes, bytearray, memoryview]):
+    if len(self._buffer) - self._offset + len(data) > self.max_buffer_size:
+      raise BufferError("msgpack token exceeds the maximum buffer size")
 
-def unpack_float64(data: bytes, offset: int) -> tuple[float, int]:
-  return struct.unpack_from(">d", data, offset)[0], offset + 1
+    if self._offset and self._offset >= len(self._buffer) // 2:
+      del self._buffer[: self._offset]
+      self._offset = 0
 
+    self._buffer += data
 
-def unpack_str(data: bytes, offset: int, length: int) -> tuple[str, int]:
-  return data[offset : offset + length].decode(), offset + length
+  @property
+  def pending(self) -> bool:
+    return bool(self._stack) or self._offset < len(self._buffer)
 
+  def unpack(self) -> Any:
+    with memoryview(self._buffer) as mv:
+      try:
+        value, self._offset = _unpack_from(mv, self._offset, self._stack)
+      except OutOfData as e:
+        self._offset = e.offset
+        raise
 
-def unpack_bin(data: bytes, offset: int, length: int) -> tuple[bytes, int]:
-  return data[offset : offset + length], offset + length
+    return value
 
+  def __iter__(self) -> Iterator[Any]:
+    return self
 
-def unpack_array(data: bytes, offset: int, length: int) -> tuple[list, int]:
-  arr = []
-  for _ in range(length):
-    item, offset = unpack(data, offset)
-    arr.append(item)
-  return arr, offset
+  def __next__(self) -> Any:
+    try:
+      return self.unpack()
+    except OutOfData:
+      raise StopIteration
 
 
-def unpack_map(data: bytes, offset: int, length: int) -> tuple[dict, int]:
-  m = {}
-  for _ in range(length):
-    key, offset = unpack(data, offset)
-    val, offset = unpack(data, offset)
-    m[key] = val
-  return m, offset
+def decode_msgpack_stream(
+  read: Callable[[int], bytes], length: int, chunk_size: int = STREAM_CHUNK_SIZE
+) -> Any:
+  unpacker = Unpacker()
+  remaining = length
 
+  while remaining > 0:
+    chunk = read(min(chunk_size, remaining))
+    if not chunk:
+      raise ValueError("Request body ended before Content-Length")
 
-def unpack(data: bytes, offset: int = 0) -> tuple[Any, int]:
-  b = data[offset]
-  offset += 1
+    remaining -= len(chunk)
+    unpacker.feed(chunk)
 
-  if b <= 0x7F:  # positive fixint
-    return b, offset
-  if b <= 0x8F:  # fixmap
-    return unpack_map(data, offset, b & 0x0F)
-  if b <= 0x9F:  # fixarray
-    return unpack_array(data, offset, b & 0x0F)
-  if b <= 0xBF:  # fixstring
-    return unpack_str(data, offset, b & 0x1F)
-  if b >= 0xE0:  # negative fixint
-    return b - 256, offset
+    for value in unpacker:
+      if remaining or unpacker.pending:
+        raise ValueError("Extra data after msgpack value")
+      return value
 
-  match b:
-    case 0xC0:
-      return None, offset
-    case 0xC2:
-      return False, offset
-    case 0xC3:
-      return True, offset
-    # bin
-    case 0xC4:
-      (n,) = struct.unpack_from("B", data, offset)
-      return unpack_bin(data, offset + 1, n)
-    case 0xC5:
-      (n,) = struct.unpack_from(">H", data, offset)
-      return unpack_bin(data, offset + 2, n)
-    case 0xC6:
-      (n,) = struct.unpack_from(">I", data, offset)
-      return unpack_bin(data, offset + 4, n)
-    # float
-    case 0xCA:
-      return unpack_float32(data, offset)
-    case 0xCB:
-      return unpack_float64(data, offset)
-    # uint
-    case 0xCD:
-      return unpack_uint16(data, offset)
-    case 0xCE:
-      return unpack_uint32(data, offset)
-    case 0xCF:
-      return unpack_uint64(data, offset)
-    # int
-    case 0xCC:
-      return unpack_uint8(data, offset)
-    case 0xD0:
-      return unpack_int8(data, offset)
-    case 0xD1:
-      return unpack_int16(data, offset)
-    case 0xD2:
-      return unpack_int32(data, offset)
-    case 0xD3:
-      return unpack_int64(data, offset)
-    # str
-    case 0xD9:
-      (n,) = struct.unpack_from("B", data, offset)
-      return unpack_str(data, offset + 1, n)
-    case 0xDA:
-      (n,) = struct.unpack_from(">H", data, offset)
-      return unpack_str(data, offset + 2, n)
-    case 0xDB:
-      (n,) = struct.unpack_from(">I", data, offset)
-      return unpack_str(data, offset + 4, n)
-    # array
-    case 0xDC:
-      (n,) = struct.unpack_from(">H", data, offset)
-      return unpack_array(data, offset + 2, n)
-    case 0xDD:
-      (n,) = struct.unpack_from(">I", data, offset)
-      return unpack_array(data, offset + 4, n)
-    # map
-    case 0xDE:
-      (n,) = struct.unpack_from(">H", data, offset)
-      return unpack_map(data, offset + 2, n)
-    case 0xDF:
-      (n,) = struct.unpack_from(">I", data, offset)
-      return unpack_map(data, offset + 4, n)
-
-  raise ValueError(f"Unsupported msgpack byte: 0x{b:02x}")
-
-
-def decode_msgpack(data: bytes) -> Any:
-  value, _ = unpack(data)
-  return value
+  raise ValueError("Incomplete msgpack data")
@@ -0,0 +1,266 @@
+import struct
+from typing import Any, Mapping, NamedTuple, Optional, Sequence, Union
+
+# Mapbox Vector Tile specification 2.1
+MVT_VERSION = 2
+DEFAULT_EXTENT = 4096
+MVT_CONTENT_TYPE = "application/vnd.mapbox-vector-tile"
+
+WIRE_VARINT = 0
+WIRE_FIXED64 = 1
+WIRE_BYTES = 2
+
+CMD_MOVE_TO = 1
+CMD_LINE_TO = 2
+CMD_CLOSE_PATH = 7
+
+GEOM_POINT = 1
+GEOM_LINESTRING = 2
+GEOM_POLYGON = 3
+
+_double = struct.Struct("<d")
+
+TilePoint = tuple[int, int]
+PropertyValue = Union[str, int, float, bool]
+
+
+class MvtFeature(NamedTuple):
+  # GeoJSON geometry with coordinates already in tile space (0..extent, y down)
+  geometry: Mapping[str, Any]
+  properties: Mapping[str, Optional[PropertyValue]]
+  id: Optional[int] = None
+
+
+class MvtLayer(NamedTuple):
+  name: str
+  features: Sequence[MvtFeature]
+  extent: int = DEFAULT_EXTENT
+
+
+def _varint(value: int, out: bytearray):
+  while value > 0x7F:
+    out.append((value & 0x7F) | 0x80)
+    value >>= 7
+  out.append(value)
+
+
+def _zigzag(value: int) -> int:
+  return (value << 1) ^ (value >> 63)
+
+
+def _key(field: int, wire_type: int, out: bytearray):
+  _varint((field << 3) | wire_type, out)
+
+
+def _bytes_field(field: int, data: Union[bytes, bytearray], out: bytearray):
+  _key(field, WIRE_BYTES, out)
+  _varint(len(data), out)
+  out += data
+
+
+def _packed_field(field: int, values: Sequence[int], out: bytearray):
+  packed = bytearray()
+  for value in values:
+    _varint(value, packed)
+  _bytes_field(field, packed, out)
+
+
+def _encode_value(value: PropertyValue) -> bytearray:
+  out = bytearray()
+  if isinstance(value, bool):
+    _key(7, WIRE_VARINT, out)
+    _varint(int(value), out)
+  elif isinstance(value, int):
+    if value >= 0:
+      _key(5, WIRE_VARINT, out)
+      _varint(value, out)
+    else:
+      _key(6, WIRE_VARINT, out)
+      _varint(_zigzag(value), out)
+  elif isinstance(value, float):
+    _key(3, WIRE_FIXED64, out)
+    out += _double.pack(value)
+  elif isinstance(value, str):
+    _bytes_field(1, value.encode("utf-8"), out)
+  else:
+    raise TypeError(f"Unsupported vector tile property type: {type(value)}")
+
+  return out
+
+
+def ring_area(ring: Sequence[TilePoint]) -> int:
+  # Twice the signed area (surveyor's formula); positive is clockwise in tile
+  # space, where y points down
+  area = 0
+  for i in range(len(ring)):
+    x0, y0 = ring[i - 1]
+    x1, y1 = ring[i]
+    area += x0 * y1 - x1 * y0
+
+  return area
+
+
+def _dedupe(points: Sequence[TilePoint]) -> list[TilePoint]:
+  result: list[TilePoint] = []
+  for point in points:
+    if not result or point != result[-1]:
+      result.append(point)
+
+  return result
+
+
+class _GeometryWriter:
+  def __init__(self):
+    self.commands: list[int] = []
+    self._x = 0
+    self._y = 0
+
+  def _command(self, command: int, count: int):
+    self.commands.append((command & 0x7) | (count << 3))
+
+  def _points(self, points: Sequence[TilePoint]):
+    for x, y in points:
+      self.commands += (_zigzag(x - self._x), _zigzag(y - self._y))
+      self._x, self._y = x, y
+
+  def points(self, points: Sequence[TilePoint]):
+    if not points:
+      return
+
+    self._command(CMD_MOVE_TO, len(points))
+    self._points(points)
+
+  def line(self, points: Sequence[TilePoint]):
+    points = _dedupe(points)
+    if len(points) < 2:
+      return
+
+    self._command(CMD_MOVE_TO, 1)
+    self._points(points[:1])
+    self._command(CMD_LINE_TO, len(points) - 1)
+    self._points(points[1:])
+
+  def polygon(self, rings: Sequence[Sequence[TilePoint]]):
+    # Rings that collapse after quantization are dropped, and with the
+    # exterior ring go its holes
+    for i, ring in enumerate(rings):
+      points = _dedupe(ring)
+      if len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+
+      area = ring_area(points) if len(points) >= 3 else 0
+      if area == 0:
+        if i == 0:
+          return
+        continue
+
+      # Exterior rings wind clockwise in tile space, interior rings counter-
+      # clockwise
+      if (area > 0) != (i == 0):
+        points.reverse()
+
+      self._command(CMD_MOVE_TO, 1)
+      self._points(points[:1])
+      self._command(CMD_LINE_TO, len(points) - 1)
+      self._points(points[1:])
+      self._command(CMD_CLOSE_PATH, 1)
+
+
+def encode_geometry(geometry: Mapping[str, Any]) -> tuple[int, list[int]]:
+  geometry_type = geometry["type"]
+  coordinates = geometry["coordinates"]
+  writer = _GeometryWriter()
+
+  if geometry_type == "Point":
+    writer.points([tuple(coordinates)])
+    return GEOM_POINT, writer.commands
+
+  if geometry_type == "MultiPoint":
+    writer.points([tuple(p) for p in coordinates])
+    return GEOM_POINT, writer.commands
+
+  if geometry_type == "LineString":
+    writer.line([tuple(p) for p in coordinates])
+    return GEOM_LINESTRING, writer.commands
+
+  if geometry_type == "MultiLineString":
+    for line in coordinates:
+      writer.line([tuple(p) for p in line])
+    return GEOM_LINESTRING, writer.commands
+
+  if geometry_type == "Polygon":
+    writer.polygon([[tuple(p) for p in ring] for ring in coordinates])
+    return GEOM_POLYGON, writer.commands
+
+  if geometry_type == "MultiPolygon":
+    for polygon in coordinates:
+      writer.polygon([[tuple(p) for p in ring] for ring in polygon])
+    return GEOM_POLYGON, writer.commands
+
+  raise ValueError(f"Unsupported vector tile geometry: {geometry_type}")
+
+
+def encode_layer(layer: MvtLayer) -> Optional[bytearray]:
+  keys: dict[str, int] = {}
+  values: dict[tuple[type, PropertyValue], int] = {}
+  features = bytearray()
+  count = 0
+
+  for feature in layer.features:
+    geometry_type, commands = encode_geometry(feature.geometry)
+    if not commands:
+      continue
+
+    tags: list[int] = []
+    for key, value in feature.properties.items():
+      if value is None:
+        continue
+
+      tags.append(keys.setdefault(key, len(keys)))
+      tags.append(values.setdefault((type(value), value), len(values)))
+
+    encoded = bytearray()
+    if feature.id is not None:
+      _key(1, WIRE_VARINT, encoded)
+      _varint(feature.id, encoded)
+
+    if tags:
+      _packed_field(2, tags, encoded)
+
+    _key(3, WIRE_VARINT, encoded)
+    _varint(geometry_type, encoded)
+    _packed_field(4, commands, encoded)
+
+    _bytes_field(2, encoded, features)
+    count += 1
+
+  if count == 0:
+    return None
+
+  out = bytearray()
+  _key(15, WIRE_VARINT, out)
+  _varint(MVT_VERSION, out)
+  _bytes_field(1, layer.name.encode("utf-8"), out)
+  out += features
+
+  for key in keys:
+    _bytes_field(3, key.encode("utf-8"), out)
+
+  for _, value in values:
+    _bytes_field(4, _encode_value(value), out)
+
+  _key(5, WIRE_VARINT, out)
+  _varint(layer.extent, out)
+  return out
+
+
+def encode_tile(layers: Sequence[MvtLayer]) -> bytes:
+  # Layers without any renderable feature are left out, so a tile with no
+  # content encodes to zero bytes
+  out = bytearray()
+  for layer in layers:
+    encoded = encode_layer(layer)
+    if encoded is not None:
+      _bytes_field(3, encoded, out)
+
+  return bytes(out)
@@ -1,4 +1,7 @@
+from src.index.area_coverage import create_area_coverage_table
 from src.index.catalog import create_catalog_table
+from src.index.fingerprint import create_fingerprint_table
+from src.index.identity import create_identity_table
 from src.index.images import create_index_table
 from src.index.radiometric import create_radiometric_table
 from src.models.annotation_schema import create_schema_table
@@ -11,9 +14,12 @@ from src.models.equipment_list import create_equipment_table
 def create_db_tables():
   create_catalog_table()
   create_index_table()
+  create_fingerprint_table()
+  create_identity_table()
   create_radiometric_table()
   create_schema_table()
   create_annotation_tables()
   create_areas_tables()
+  create_area_coverage_table()
   create_attribute_tables()
   create_equipment_table()
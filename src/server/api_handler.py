@@ -1,14 +1,26 @@
 import json
 import logging
-import mimetypes
 import os
 import re
 from http.server import SimpleHTTPRequestHandler
 from io import BufferedReader
-from typing import Any, Callable, TypeVar
+from typing import Any, Callable, NamedTuple, Optional, TypeVar
 
 from src.bootstrap import get_settings
-from src.msgpack import decode_msgpack, encode_msgpack
+from src.msgpack import decode_msgpack_stream, encode_msgpack
+from src.server.static import (
+  STREAM_CHUNK_SIZE,
+  RangeNotSatisfiable,
+  Validators,
+  cache_headers,
+  file_validators,
+  guess_content_type,
+  if_range_matches,
+  is_not_modified,
+  multipart_ranges,
+  parse_ranges,
+  resolve_static_path,
+)
 
 P = TypeVar("P")
 R = TypeVar("R")
@@ -25,6 +37,20 @@ class ApiError(Exception):
     self.message = message
 
 
+class RawResponse(NamedTuple):
+  body: bytes
+  content_type: str
+  headers: tuple[tuple[str, str], ...] = ()
+
+
+def as_raw_response(obj: Any) -> RawResponse:
+  # Handlers return either a RawResponse or an object encoded as msgpack
+  if isinstance(obj, RawResponse):
+    return obj
+
+  return RawResponse(encode_msgpack(obj), "application/msgpack")
+
+
 PARAM_REGEX = re.compile(r"\{(\w+)\}")
 
 
@@ -76,86 +102,161 @@ class ApiRouterMeta(type):
     cls._pattern_routes = patterns
     return cls
 
+  def resolve_route(
+    cls, method: str, path: str
+  ) -> Optional[tuple[Callable, bool, dict[str, str]]]:
+    routes = cls._exact_routes.get(method)
+    if routes is None:
+      return None
 
-class ApiHandler(SimpleHTTPRequestHandler, metaclass=ApiRouterMeta):
-  def translate_path(self, path: str) -> str:
-    if path.startswith("/api"):
-      return path
+    hit = routes.get(path)
+    if hit:
+      fn, stream = hit
+      return fn, stream, {}
+
+    for regex, fn, stream in cls._pattern_routes[method]:
+      m = regex.match(path)
+      if m:
+        return fn, stream, m.groupdict()
+
+    return None
 
-    relative_path = path.lstrip("/")
-    full_path = app_settings.STATIC_DIR / relative_path
 
-    if full_path.is_dir():
-      index = full_path / "index.html"
-      if index.exists():
-        return str(index)
-      return str(app_settings.STATIC_DIR / "200.html")
+def cors_headers(origin: Optional[str]) -> list[tuple[str, str]]:
+  headers: list[tuple[str, str]] = []
+  if origin:
+    headers.append(("Access-Control-Allow-Origin", origin))
+    headers.append(("Vary", "Origin"))
+
+  headers += [
+    ("Access-Control-Allow-Methods", "GET, HEAD, OPTIONS"),
+    (
+      "Access-Control-Allow-Headers",
+      "Range, If-Range, If-None-Match, If-Modified-Since",
+    ),
+    (
+      "Access-Control-Expose-Headers",
+      "Content-Length, Content-Range, Accept-Ranges, Content-Encoding, "
+      "ETag, Last-Modified",
+    ),
+  ]
+  return headers
 
-    if full_path.exists():
-      return str(full_path)
 
-    return super().translate_path(path)
+class ApiHandler(SimpleHTTPRequestHandler, metaclass=ApiRouterMeta):
+  use_sendfile = hasattr(os, "sendfile")
 
-  def _serve_static(self):
-    path = self.translate_path(self.path)
-    if not os.path.exists(path):
+  def _serve_static(self, head_only: bool = False):
+    path = resolve_static_path(self.path)
+    if path is None:
       self.send_error(404, "File not found")
       return
 
-    file_size = os.path.getsize(path)
-    content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    stat = path.stat()
+    file_size = stat.st_size
+    content_type = guess_content_type(str(path))
+    validators = file_validators(stat)
+
+    if is_not_modified(
+      self.headers.get("If-None-Match"),
+      self.headers.get("If-Modified-Since"),
+      validators,
+    ):
+      self.send_response(304)
+      self._send_cors_headers()
+      self._send_cache_headers(validators)
+      self.end_headers()
+      return
 
     range_header = self.headers.get("Range")
+    if not if_range_matches(self.headers.get("If-Range"), validators):
+      range_header = None
+
+    try:
+      ranges = parse_ranges(range_header, file_size)
+    except RangeNotSatisfiable:
+      self.send_response(416)
+      self._send_cors_headers()
+      self.send_header("Content-Range", f"bytes */{file_size}")
+      self.send_header("Content-Length", "0")
+      self.end_headers()
+      return
+
+    if ranges is None:
+      self.send_response(200)
+      self.send_header("Content-Type", content_type)
+      self.send_header("Content-Length", str(file_size))
+      self.send_header("Accept-Ranges", "bytes")
+      self._send_cache_headers(validators)
+      self._send_cors_headers()
+      self.end_headers()
 
-    if range_header:
-      units, rng = range_header.strip().split("=")
-      start_str, end_str = rng.split("-")
+      if not head_only:
+        with open(path, "rb") as f:
+          self._send_file(f, 0, file_size)
+      return
 
-      start = int(start_str)
-      end = int(end_str) if end_str else file_size - 1
-      end = min(end, file_size - 1)
+    if len(ranges) == 1:
+      start, end = ranges[0]
 
       self.send_response(206)
       self._send_cors_headers()
       self.send_header("Content-Type", content_type)
       self.send_header("Accept-Ranges", "bytes")
+      self._send_cache_headers(validators)
       self.send_header("Content-Range", f"bytes {start}-{end}/{file_size}")
       self.send_header("Content-Length", str(end - start + 1))
       self.end_headers()
 
-      with open(path, "rb") as f:
-        f.seek(start)
-        self._stream_file(f, end - start + 1)
-    else:
-      self.send_response(200)
-      self.send_header("Content-Type", content_type)
-      self.send_header("Content-Length", str(file_size))
-      self.send_header("Accept-Ranges", "bytes")
-      self._send_cors_headers()
-      self.end_headers()
+      if not head_only:
+        with open(path, "rb") as f:
+          self._send_file(f, start, end - start + 1)
+      return
+
+    multipart = multipart_ranges(ranges, content_type, file_size)
 
-      with open(path, "rb") as f:
-        self._stream_file(f, file_size)
+    self.send_response(206)
+    self._send_cors_headers()
+    self.send_header("Content-Type", multipart.content_type)
+    self.send_header("Accept-Ranges", "bytes")
+    self._send_cache_headers(validators)
+    self.send_header("Content-Length", str(multipart.content_length))
+    self.end_headers()
+    if head_only:
+      return
+
+    with open(path, "rb") as f:
+      for part in multipart.parts:
+        self.wfile.write(part.head)
+        self._send_file(f, part.start, part.length)
+
+    self.wfile.write(multipart.closing)
 
   def _send_cors_headers(self):
-    origin = self.headers.get("Origin")
-    if origin:
-      self.send_header("Access-Control-Allow-Origin", origin)
-      self.send_header("Vary", "Origin")
-
-    self.send_header("Access-Control-Allow-Methods", "GET, HEAD, OPTIONS")
-    self.send_header("Access-Control-Allow-Headers", "Range")
-    self.send_header(
-      "Access-Control-Expose-Headers",
-      "Content-Length, Content-Range, Accept-Ranges, Content-Encoding",
-    )
+    for keyword, value in cors_headers(self.headers.get("Origin")):
+      self.send_header(keyword, value)
+
+  def _send_cache_headers(self, validators: Validators):
+    for keyword, value in cache_headers(self.path, validators):
+      self.send_header(keyword, value)
+
+  def _send_file(self, file: BufferedReader, offset: int, length: int):
+    if not self.use_sendfile:
+      file.seek(offset)
+      self._stream_file(file, length)
+      return
+
+    try:
+      self.wfile.flush()
+      self.connection.sendfile(file, offset, length)
+    except (BrokenPipeError, ConnectionResetError):
+      self.close_connection = True
 
   def _stream_file(self, file: BufferedReader, length: int):
-    chunk_size = 256 * 1024
     remaining = length
 
     while remaining > 0:
-      chunk = file.read(min(chunk_size, remaining))
+      chunk = file.read(min(STREAM_CHUNK_SIZE, remaining))
       if not chunk:
         break
 
@@ -168,19 +269,13 @@ class ApiHandler(SimpleHTTPRequestHandler, metaclass=ApiRouterMeta):
   def _dispatch(self, method: str) -> bool:
     path = self.path.split("?", 1)[0]
 
-    hit = self._exact_routes[method].get(path)
-    if hit:
-      fn, stream = hit
-      self._invoke(fn, stream, {})
-      return True
-
-    for regex, fn, stream in self._pattern_routes[method]:
-      m = regex.match(path)
-      if m:
-        self._invoke(fn, stream, m.groupdict())
-        return True
+    route = type(self).resolve_route(method, path)
+    if route is None:
+      return False
 
-    return False
+    fn, stream, path_params = route
+    self._invoke(fn, stream, path_params)
+    return True
 
   def _invoke(self, fn: Callable, stream: bool, path_params: dict[str, str]):
     if stream:
@@ -203,8 +298,7 @@ class ApiHandler(SimpleHTTPRequestHandler, metaclass=ApiRouterMeta):
   def _invoke_post(self, fn: Callable, path_params: dict[str, str]):
     try:
       content_length = int(self.headers.get("Content-Length", 0))
-      body = self.rfile.read(content_length)
-      payload = decode_msgpack(body)
+      payload = decode_msgpack_stream(self.rfile.read, content_length)
     except Exception as e:
       self._error_response(400, f"Bad request: {e}")
       return
@@ -221,8 +315,7 @@ class ApiHandler(SimpleHTTPRequestHandler, metaclass=ApiRouterMeta):
   def _invoke_stream(self, fn: Callable, path_params: dict[str, str]):
     try:
       content_length = int(self.headers.get("Content-Length", 0))
-      body = self.rfile.read(content_length)
-      payload = decode_msgpack(body)
+      payload = decode_msgpack_stream(self.rfile.read, content_length)
     except Exception as e:
       self._error_response(400, f"Bad request: {e}")
       return
@@ -246,12 +339,14 @@ class ApiHandler(SimpleHTTPRequestHandler, metaclass=ApiRouterMeta):
       send_event("error", {"message": str(e)})
 
   def _api_response(self, obj: Any):
-    payload = encode_msgpack(obj)
+    response = as_raw_response(obj)
     self.send_response(200)
-    self.send_header("Content-Type", "application/msgpack")
-    self.send_header("Content-Length", str(len(payload)))
+    self.send_header("Content-Type", response.content_type)
+    self.send_header("Content-Length", str(len(response.body)))
+    for keyword, value in response.headers:
+      self.send_header(keyword, value)
     self.end_headers()
-    self.wfile.write(payload)
+    self.wfile.write(response.body)
 
   def _error_response(self, status: int, message: str):
     payload = encode_msgpack({"detail": message})
@@ -271,6 +366,15 @@ class ApiHandler(SimpleHTTPRequestHandler, metaclass=ApiRouterMeta):
 
     self._serve_static()
 
+  def do_HEAD(self):
+    # SimpleHTTPRequestHandler would resolve the path against the working
+    # directory instead of STATIC_DIR
+    if self.path.startswith("/api"):
+      self.send_error(404, "Unknown HEAD endpoint")
+      return
+
+    self._serve_static(head_only=True)
+
   def do_POST(self):
     if self._dispatch("POST"):
       return
@@ -1,6 +1,7 @@
 import uuid
 from pathlib import Path
 from typing import Callable
+from urllib.parse import parse_qs, urlsplit
 
 from src.hashing import decode_sha256_from_b64
 from src.index.catalog import (
@@ -12,8 +13,10 @@ from src.index.catalog import (
   update_catalog,
   validate_catalog_dir,
 )
+from src.index.footprints import footprint_index_stats
 from src.index.images import ImageQuery, get_image_info, index_images, search_images
 from src.index.radiometric import get_radiometric_parameters
+from src.index.search_cache import search_cache_stats
 from src.models.annotation_schema import (
   SchemaInsert,
   SchemaUpdate,
@@ -69,8 +72,11 @@ from src.models.security import (
   insert_sequrity,
   update_security,
 )
+from src.models.tiles import TILE_LAYERS, get_tile
 from src.models.update import TableUpdate
-from src.server.api_handler import ApiError, ApiHandler, api
+from src.mvt import MVT_CONTENT_TYPE
+from src.server.api_handler import ApiError, ApiHandler, RawResponse, api
+from src.sqlite.pool import pool_stats
 
 
 class ApiRoutes(ApiHandler):
@@ -99,6 +105,32 @@ class ApiRoutes(ApiHandler):
     image_hash = decode_sha256_from_b64(image_id)
     return get_areas_by_image(image_hash)
 
+  @api("GET", "/api/tiles/{layer}/{z}/{x}/{y}.mvt")
+  def _get_tile(self, layer: str, z: str, x: str, y: str):
+    if layer not in TILE_LAYERS:
+      raise ApiError(404, "Invalid GET endpoint")
+
+    image = parse_qs(urlsplit(self.path).query).get("image")
+    try:
+      image_id = decode_sha256_from_b64(image[0]) if image else None
+      tile = get_tile(layer, int(z), int(x), int(y), image_id)
+    except ValueError as e:
+      raise ApiError(400, str(e))
+
+    return RawResponse(tile, MVT_CONTENT_TYPE, (("Cache-Control", "no-cache"),))
+
+  @api("GET", "/api/db-pool-stats")
+  def _get_db_pool_stats(self):
+    return {"pools": pool_stats()}
+
+  @api("GET", "/api/footprint-index-stats")
+  def _get_footprint_index_stats(self):
+    return footprint_index_stats()
+
+  @api("GET", "/api/search-cache-stats")
+  def _get_search_cache_stats(self):
+    return search_cache_stats()
+
   @api("GET", "/api/get-catalogs-index")
   def _get_catalogs_index(self):
     return {"catalogs": get_catalog_index_data()}
@@ -138,7 +170,10 @@ class ApiRoutes(ApiHandler):
 
   @api("POST", "/api/search-images")
   def _post_query_images(self, payload: ImageQuery):
-    return search_images(payload)
+    try:
+      return search_images(payload)
+    except ValueError as e:
+      raise ApiError(400, str(e))
 
   @api("POST", "/api/image-info")
   def _post_image_info(self, payload: dict):
@@ -262,7 +297,8 @@ class ApiRoutes(ApiHandler):
         },
       )
 
-    index_images(catalog_id, progress_callback=on_progress)
+    report = index_images(catalog_id, progress_callback=on_progress)
+    send_event("summary", dict(report))
 
   @api("POST", "/api/radiometric-params")
   def _post_parametric_params(self, payload: dict[str, str]):
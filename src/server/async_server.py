@@ -0,0 +1,428 @@
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from email.parser import BytesParser
+from email.utils import formatdate
+from functools import partial
+from http import HTTPStatus
+from http.client import HTTPMessage
+from typing import Any, BinaryIO, Callable, Optional
+
+from src.msgpack import decode_msgpack, encode_msgpack
+from src.server.api_handler import (
+  ApiError,
+  ApiHandler,
+  RawResponse,
+  as_raw_response,
+  cors_headers,
+)
+from src.server.static import (
+  RangeNotSatisfiable,
+  cache_headers,
+  file_validators,
+  guess_content_type,
+  if_range_matches,
+  is_not_modified,
+  multipart_ranges,
+  parse_ranges,
+  resolve_static_path,
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_HEADER_SIZE = 64 * 1024
+MAX_BODY_SIZE = 256 * 1024 * 1024
+KEEPALIVE_TIMEOUT = 15.0
+MAX_KEEPALIVE_REQUESTS = 1000
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+Headers = list[tuple[str, str]]
+
+
+class BadRequest(Exception):
+  def __init__(self, status: int, message: str):
+    super().__init__(message)
+    self.status = status
+    self.message = message
+
+
+class AsyncRequest:
+  def __init__(
+    self,
+    command: str,
+    path: str,
+    request_version: str,
+    headers: HTTPMessage,
+    client_address: Any,
+    body: bytes = b"",
+  ):
+    self.command = command
+    self.path = path
+    self.request_version = request_version
+    self.headers = headers
+    self.client_address = client_address
+    self.body = body
+
+  @property
+  def keep_alive(self) -> bool:
+    connection = (self.headers.get("Connection") or "").lower()
+    if self.request_version == "HTTP/1.1":
+      return "close" not in connection
+
+    return "keep-alive" in connection
+
+  def send_error(self, status: int, message: Optional[str] = None):
+    raise ApiError(status, message or HTTPStatus(status).phrase)
+
+
+def response_head(status: int, headers: Headers, keep_alive: bool) -> bytes:
+  lines = [
+    f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+    f"Date: {formatdate(usegmt=True)}",
+  ]
+  lines += [f"{keyword}: {value}" for keyword, value in headers]
+  lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+
+  return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+class AsyncApiServer:
+  def __init__(
+    self,
+    router: type[ApiHandler],
+    host: str,
+    port: int,
+    max_workers: int = DEFAULT_WORKERS,
+    max_pending: Optional[int] = None,
+    keepalive_timeout: float = KEEPALIVE_TIMEOUT,
+  ):
+    self.router = router
+    self.host = host
+    self.port = port
+    self.max_workers = max_workers
+    self.max_pending = max_pending or max_workers * 4
+    self.keepalive_timeout = keepalive_timeout
+    self.executor = ThreadPoolExecutor(
+      max_workers=max_workers, thread_name_prefix="api-worker"
+    )
+    self._pending: Optional[asyncio.Semaphore] = None
+
+  async def _run_blocking(self, fn: Callable, *args: Any) -> Any:
+    if self._pending is None:
+      raise RuntimeError("Server is not running")
+
+    async with self._pending:
+      loop = asyncio.get_running_loop()
+      return await loop.run_in_executor(self.executor, partial(fn, *args))
+
+  async def _read_request(
+    self, reader: asyncio.StreamReader, client_address: Any
+  ) -> Optional[AsyncRequest]:
+    try:
+      head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+      if e.partial.strip():
+        raise BadRequest(400, "Incomplete request head")
+      return None
+    except asyncio.LimitOverrunError:
+      raise BadRequest(431, "Request header fields too large")
+
+    head = head.lstrip(b"\r\n")
+    request_line, _, header_bytes = head.partition(b"\r\n")
+
+    parts = request_line.decode("latin-1").split()
+    if len(parts) != 3 or not parts[2].startswith("HTTP/"):
+      raise BadRequest(400, f"Bad request line: {request_line!r}")
+
+    command, path, version = parts
+    headers = BytesParser(_class=HTTPMessage).parsebytes(header_bytes)
+
+    if "chunked" in (headers.get("Transfer-Encoding") or "").lower():
+      raise BadRequest(411, "Chunked request bodies are not supported")
+
+    try:
+      content_length = int(headers.get("Content-Length", 0))
+    except ValueError:
+      raise BadRequest(400, "Invalid Content-Length")
+
+    if content_length < 0:
+      raise BadRequest(400, "Invalid Content-Length")
+
+    if content_length > MAX_BODY_SIZE:
+      raise BadRequest(413, "Request body too large")
+
+    body = await reader.readexactly(content_length) if content_length else b""
+    return AsyncRequest(command, path, version, headers, client_address, body)
+
+  async def handle_connection(
+    self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+  ):
+    client_address = writer.get_extra_info("peername")
+
+    try:
+      for _ in range(MAX_KEEPALIVE_REQUESTS):
+        try:
+          request = await asyncio.wait_for(
+            self._read_request(reader, client_address), self.keepalive_timeout
+          )
+        except BadRequest as e:
+          await self._send(writer, e.status, [], e.message.encode(), False)
+          break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+          break
+
+        if request is None:
+          break
+
+        if not await self._handle_request(request, writer):
+          break
+
+    except ConnectionError:
+      pass
+    except Exception:
+      logger.exception("Error handling connection from %s", client_address)
+    finally:
+      writer.close()
+      try:
+        await writer.wait_closed()
+      except ConnectionError:
+        pass
+
+  async def _send(
+    self,
+    writer: asyncio.StreamWriter,
+    status: int,
+    headers: Headers,
+    body: bytes = b"",
+    keep_alive: bool = True,
+  ):
+    has_length = any(k.lower() == "content-length" for k, _ in headers)
+    if status not in (204, 304) and not has_length:
+      headers = [*headers, ("Content-Length", str(len(body)))]
+
+    writer.write(response_head(status, headers, keep_alive))
+    if body:
+      writer.write(body)
+
+    await writer.drain()
+
+  async def _send_plain(
+    self, request: AsyncRequest, writer: asyncio.StreamWriter, status: int, message: str
+  ) -> bool:
+    headers = [("Content-Type", "text/plain; charset=utf-8")]
+    await self._send(writer, status, headers, message.encode(), request.keep_alive)
+    return request.keep_alive
+
+  async def _handle_request(
+    self, request: AsyncRequest, writer: asyncio.StreamWriter
+  ) -> bool:
+    path = request.path.split("?", 1)[0]
+    method = request.command
+
+    if method == "OPTIONS":
+      headers = cors_headers(request.headers.get("Origin"))
+      await self._send(writer, 204, headers, b"", request.keep_alive)
+      return request.keep_alive
+
+    if method in ("GET", "POST"):
+      route = self.router.resolve_route(method, path)
+      if route is not None:
+        fn, stream, path_params = route
+        if stream:
+          return await self._invoke_stream(request, writer, fn, path_params)
+
+        return await self._invoke(request, writer, fn, path_params)
+
+    if method == "POST":
+      return await self._send_plain(request, writer, 404, "Unknown POST endpoint")
+
+    if method not in ("GET", "HEAD"):
+      message = f"Unsupported method {method}"
+      return await self._send_plain(request, writer, 501, message)
+
+    if path.startswith("/api"):
+      return await self._send_plain(request, writer, 404, "Unknown GET endpoint")
+
+    return await self._serve_static(request, writer, method == "HEAD")
+
+  async def _invoke(
+    self,
+    request: AsyncRequest,
+    writer: asyncio.StreamWriter,
+    fn: Callable,
+    path_params: dict[str, str],
+  ) -> bool:
+    args: tuple = ()
+    if request.command == "POST":
+      try:
+        args = (await self._run_blocking(decode_msgpack, request.body),)
+      except Exception as e:
+        return await self._error_response(request, writer, 400, f"Bad request: {e}")
+
+    def call() -> RawResponse:
+      return as_raw_response(fn(request, *args, **path_params))
+
+    try:
+      response = await self._run_blocking(call)
+    except ApiError as e:
+      return await self._error_response(request, writer, e.status, e.message)
+    except Exception as e:
+      logger.exception("Error handling %s", request.path)
+      return await self._error_response(request, writer, 500, f"Server error: {e}")
+
+    headers = [("Content-Type", response.content_type), *response.headers]
+    await self._send(writer, 200, headers, response.body, request.keep_alive)
+    return request.keep_alive
+
+  async def _error_response(
+    self, request: AsyncRequest, writer: asyncio.StreamWriter, status: int, message: str
+  ) -> bool:
+    payload = encode_msgpack({"detail": message})
+    headers = [("Content-Type", "application/msgpack")]
+    await self._send(writer, status, headers, payload, request.keep_alive)
+    return request.keep_alive
+
+  async def _invoke_stream(
+    self,
+    request: AsyncRequest,
+    writer: asyncio.StreamWriter,
+    fn: Callable,
+    path_params: dict[str, str],
+  ) -> bool:
+    try:
+      payload = await self._run_blocking(decode_msgpack, request.body)
+    except Exception as e:
+      return await self._error_response(request, writer, 400, f"Bad request: {e}")
+
+    headers = [
+      ("Content-Type", "text/event-stream"),
+      ("Cache-Control", "no-cache"),
+      ("X-Accel-Buffering", "no"),
+    ]
+    writer.write(response_head(200, headers, False))
+    await writer.drain()
+
+    loop = asyncio.get_running_loop()
+
+    async def write_chunk(chunk: bytes):
+      writer.write(chunk)
+      await writer.drain()
+
+    def send_event(event: str, data: dict):
+      chunk = f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+      asyncio.run_coroutine_threadsafe(write_chunk(chunk), loop).result()
+
+    def call():
+      try:
+        fn(request, payload, send_event, **path_params)
+        send_event("done", {"message": "OK"})
+      except ConnectionError:
+        raise
+      except Exception as e:
+        logger.exception("Error in stream handler")
+        send_event("error", {"message": str(e)})
+
+    await self._run_blocking(call)
+    return False
+
+  async def _serve_static(
+    self, request: AsyncRequest, writer: asyncio.StreamWriter, head_only: bool
+  ) -> bool:
+    path = resolve_static_path(request.path)
+    if path is None:
+      return await self._send_plain(request, writer, 404, "File not found")
+
+    stat = path.stat()
+    file_size = stat.st_size
+    content_type = guess_content_type(str(path))
+    origin = request.headers.get("Origin")
+    validators = file_validators(stat)
+
+    if is_not_modified(
+      request.headers.get("If-None-Match"),
+      request.headers.get("If-Modified-Since"),
+      validators,
+    ):
+      headers = [*cors_headers(origin), *cache_headers(request.path, validators)]
+      await self._send(writer, 304, headers, b"", request.keep_alive)
+      return request.keep_alive
+
+    range_header = request.headers.get("Range")
+    if not if_range_matches(request.headers.get("If-Range"), validators):
+      range_header = None
+
+    try:
+      ranges = parse_ranges(range_header, file_size)
+    except RangeNotSatisfiable:
+      headers = [*cors_headers(origin), ("Content-Range", f"bytes */{file_size}")]
+      await self._send(writer, 416, headers, b"", request.keep_alive)
+      return request.keep_alive
+
+    headers = [
+      *cors_headers(origin),
+      *cache_headers(request.path, validators),
+      ("Accept-Ranges", "bytes"),
+    ]
+
+    if ranges is not None and len(ranges) > 1:
+      multipart = multipart_ranges(ranges, content_type, file_size)
+      headers += [
+        ("Content-Type", multipart.content_type),
+        ("Content-Length", str(multipart.content_length)),
+      ]
+      writer.write(response_head(206, headers, request.keep_alive))
+
+      if not head_only:
+        with open(path, "rb") as f:
+          for part in multipart.parts:
+            writer.write(part.head)
+            await self._send_file(writer, f, part.start, part.length)
+
+        writer.write(multipart.closing)
+
+      await writer.drain()
+      return request.keep_alive
+
+    if ranges is None:
+      status, start, length = 200, 0, file_size
+    else:
+      start, end = ranges[0]
+      status, length = 206, end - start + 1
+      headers.append(("Content-Range", f"bytes {start}-{end}/{file_size}"))
+
+    headers += [("Content-Type", content_type), ("Content-Length", str(length))]
+    writer.write(response_head(status, headers, request.keep_alive))
+
+    if not head_only:
+      with open(path, "rb") as f:
+        await self._send_file(writer, f, start, length)
+
+    await writer.drain()
+    return request.keep_alive
+
+  async def _send_file(
+    self, writer: asyncio.StreamWriter, file: BinaryIO, offset: int, length: int
+  ):
+    await writer.drain()
+
+    # Falls back to a buffered read/write loop where sendfile is unavailable
+    loop = asyncio.get_running_loop()
+    await loop.sendfile(writer.transport, file, offset, length)
+
+  async def serve(self):
+    self._pending = asyncio.Semaphore(self.max_pending)
+
+    server = await asyncio.start_server(
+      self.handle_connection, self.host, self.port, limit=MAX_HEADER_SIZE
+    )
+
+    async with server:
+      await server.serve_forever()
+
+  def serve_forever(self):
+    try:
+      asyncio.run(self.serve())
+    finally:
+      self.executor.shutdown(wait=False, cancel_futures=True)
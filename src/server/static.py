@@ -0,0 +1,228 @@
+import mimetypes
+import os
+import posixpath
+import secrets
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import NamedTuple, Optional
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from src.bootstrap import get_settings
+
+app_settings = get_settings()
+
+STREAM_CHUNK_SIZE = 256 * 1024
+MAX_RANGES = 64
+
+# SvelteKit emits content-hashed bundles under _app/immutable; other assets
+# can opt in by carrying a version query parameter (e.g. the image hash)
+IMMUTABLE_PREFIXES = ("/_app/immutable/",)
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# COGs and thumbnails are named after the source image, so they may be
+# replaced on re-index and have to be revalidated
+DERIVED_PREFIXES = ("/cog/", "/thumbnails/")
+DERIVED_CACHE_CONTROL = "public, max-age=3600"
+
+
+class RangeNotSatisfiable(Exception):
+  pass
+
+
+def resolve_static_path(url_path: str) -> Optional[Path]:
+  path = posixpath.normpath(unquote(urlsplit(url_path).path))
+  parts = [p for p in path.split("/") if p and p not in (".", "..")]
+
+  full_path = app_settings.STATIC_DIR.joinpath(*parts)
+
+  if full_path.is_dir():
+    index = full_path / "index.html"
+    if index.exists():
+      return index
+
+    fallback = app_settings.STATIC_DIR / "200.html"
+    return fallback if fallback.is_file() else None
+
+  if full_path.is_file():
+    return full_path
+
+  return None
+
+
+def guess_content_type(path: str) -> str:
+  return mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+
+class Validators(NamedTuple):
+  etag: str
+  last_modified: str
+  mtime: int
+
+
+def file_validators(stat: os.stat_result) -> Validators:
+  mtime = int(stat.st_mtime)
+  return Validators(
+    f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"', formatdate(mtime, usegmt=True), mtime
+  )
+
+
+def cache_control(url_path: str) -> str:
+  split = urlsplit(url_path)
+  if split.path.startswith(IMMUTABLE_PREFIXES) or "v" in parse_qs(split.query):
+    return IMMUTABLE_CACHE_CONTROL
+
+  if split.path.startswith(DERIVED_PREFIXES):
+    return DERIVED_CACHE_CONTROL
+
+  return "no-cache"
+
+
+def _parse_http_date(value: str) -> Optional[int]:
+  try:
+    return int(parsedate_to_datetime(value).timestamp())
+  except (TypeError, ValueError, IndexError):
+    return None
+
+
+def _etag_list(header: str) -> list[str]:
+  return [tag.strip().removeprefix("W/") for tag in header.split(",")]
+
+
+def is_not_modified(
+  if_none_match: Optional[str], if_modified_since: Optional[str], validators: Validators
+) -> bool:
+  if if_none_match is not None:
+    if if_none_match.strip() == "*":
+      return True
+    return validators.etag in _etag_list(if_none_match)
+
+  if if_modified_since is not None:
+    since = _parse_http_date(if_modified_since)
+    return since is not None and validators.mtime <= since
+
+  return False
+
+
+def if_range_matches(if_range: Optional[str], validators: Validators) -> bool:
+  if if_range is None:
+    return True
+
+  if_range = if_range.strip()
+  if if_range.startswith(("\"", "W/")):
+    return if_range == validators.etag
+
+  return _parse_http_date(if_range) == validators.mtime
+
+
+def cache_headers(url_path: str, validators: Validators) -> list[tuple[str, str]]:
+  return [
+    ("ETag", validators.etag),
+    ("Last-Modified", validators.last_modified),
+    ("Cache-Control", cache_control(url_path)),
+  ]
+
+
+def _parse_range_spec(spec: str, file_size: int) -> Optional[tuple[int, int]]:
+  start_str, sep, end_str = spec.strip().partition("-")
+  if not sep:
+    raise ValueError(spec)
+
+  if start_str:
+    start = int(start_str)
+    end = int(end_str) if end_str else file_size - 1
+    if end_str and start > end:
+      raise ValueError(spec)
+  else:
+    suffix = int(end_str)
+    if suffix == 0:
+      return None
+    start = max(file_size - suffix, 0)
+    end = file_size - 1
+
+  if start < 0:
+    raise ValueError(spec)
+
+  if start >= file_size:
+    return None
+
+  return start, min(end, file_size - 1)
+
+
+def parse_ranges(
+  header: Optional[str], file_size: int
+) -> Optional[list[tuple[int, int]]]:
+  if not header:
+    return None
+
+  units, _, specs = header.strip().partition("=")
+  if units.strip().lower() != "bytes":
+    return None
+
+  ranges: list[tuple[int, int]] = []
+  try:
+    for spec in specs.split(","):
+      if not spec.strip():
+        continue
+
+      byte_range = _parse_range_spec(spec, file_size)
+      if byte_range is not None:
+        ranges.append(byte_range)
+  except ValueError:
+    return None
+
+  if not ranges:
+    raise RangeNotSatisfiable(header)
+
+  ranges = coalesce_ranges(ranges)
+  if len(ranges) > MAX_RANGES:
+    return None
+
+  return ranges
+
+
+def coalesce_ranges(ranges: list[tuple[int, int]]) -> list[tuple[int, int]]:
+  merged: list[tuple[int, int]] = []
+  for start, end in sorted(ranges):
+    if merged and start <= merged[-1][1] + 1:
+      merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+    else:
+      merged.append((start, end))
+
+  return merged
+
+
+class MultipartPart(NamedTuple):
+  head: bytes
+  start: int
+  length: int
+
+
+class MultipartRanges(NamedTuple):
+  content_type: str
+  parts: list[MultipartPart]
+  closing: bytes
+  content_length: int
+
+
+def multipart_ranges(
+  ranges: list[tuple[int, int]], content_type: str, file_size: int
+) -> MultipartRanges:
+  boundary = secrets.token_hex(16)
+
+  parts: list[MultipartPart] = []
+  content_length = 0
+  for start, end in ranges:
+    head = (
+      f"\r\n--{boundary}\r\n"
+      f"Content-Type: {content_type}\r\n"
+      f"Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n"
+    ).encode("latin-1")
+    parts.append(MultipartPart(head, start, end - start + 1))
+    content_length += len(head) + end - start + 1
+
+  closing = f"\r\n--{boundary}--\r\n".encode("latin-1")
+  content_length += len(closing)
+
+  return MultipartRanges(
+    f"multipart/byteranges; boundary={boundary}", parts, closing, content_length
+  )
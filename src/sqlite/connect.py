@@ -4,20 +4,43 @@ import json
 import os
 import re
 import sqlite3
+from collections import defaultdict
 from contextlib import contextmanager
 from pathlib import Path
 from typing import (
   Any,
+  Hashable,
+  Iterable,
+  Iterator,
   Mapping,
   Optional,
   Sequence,
   Union,
+  cast,
 )
 
-from src.sqlite.query_builder import DeleteQuery, InsertQuery, SelectQuery, UpdateQuery
-from src.sqlite.table import Field, GeometryField, SqliteValue, Table
+from src.sqlite.insert_plan import (
+  UpdateClauses,
+  compile_insert_plan,
+  compile_row_encoder,
+  returning_key_columns,
+  statement_sizes,
+  variable_limit,
+)
+from src.sqlite.pool import ConnectionPool, get_pool
+from src.sqlite.query_builder import DeleteQuery, SelectQuery, UpdateQuery
+from src.sqlite.row_decoder import compile_row_decoder
+from src.sqlite.table import ColumnType, RowBatch, SqliteValue, Table
 from src.sqlite.utils import uuid_blob_to_str
 
+ALIAS_REGEX = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# Ids bound per DELETE statement by delete_by_ids
+DELETE_CHUNK_SIZE = 10_000
+
+# SELECT of one chunk of ids and its parameters
+IdSet = tuple[str, list[Any]]
+
 
 class SqliteDatabase:
   def __init__(
@@ -26,12 +49,61 @@ class SqliteDatabase:
     spatial: bool = False,
     wal: bool = True,
     foreign_keys: bool = True,
+    pooled: bool = True,
+    attach: Optional[Mapping[str, Path]] = None,
   ):
     self.db_path = db_path
     self.spatial = spatial
     self.wal = wal
     self.foreign_keys = foreign_keys
+    self.pooled = pooled
+    self.attach = dict(attach or {})
     self.conn = None
+    self._pool: Optional[ConnectionPool] = None
+
+    for alias in self.attach:
+      if ALIAS_REGEX.match(alias) is None or alias.lower() in {"main", "temp"}:
+        raise ValueError(f"Invalid database alias: {alias}")
+
+  def _pool_key(self) -> Hashable:
+    attachments = tuple(
+      sorted((alias, os.path.abspath(path)) for alias, path in self.attach.items())
+    )
+    return (
+      os.path.abspath(self.db_path),
+      self.spatial,
+      self.wal,
+      self.foreign_keys,
+      attachments,
+    )
+
+  def _connect(self) -> sqlite3.Connection:
+    conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=not self.pooled)
+
+    try:
+      conn.create_function("uuid_blob_to_str", 1, uuid_blob_to_str)
+
+      if self.foreign_keys:
+        conn.execute("PRAGMA foreign_keys = ON")
+
+      if self.wal:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+      else:
+        conn.execute("PRAGMA journal_mode=DELETE")
+
+      if self.spatial:
+        conn.enable_load_extension(True)
+        conn.load_extension(os.environ["SPATIALITE"])
+        self._ensure_spatial_metadata(conn)
+
+      for alias, path in self.attach.items():
+        conn.execute(f"ATTACH DATABASE ? AS {alias}", (str(path),))
+    except Exception:
+      conn.close()
+      raise
+
+    return conn
 
   def __enter__(self):
     if not self.db_path.parent.exists():
@@ -40,22 +112,11 @@ class SqliteDatabase:
     if self.db_path.suffix.lower() not in {".db", ".sqlite"}:
       raise ValueError(f"Invalid db path: {self.db_path}")
 
-    self.conn = sqlite3.connect(self.db_path, timeout=10)
-    self.conn.create_function("uuid_blob_to_str", 1, uuid_blob_to_str)
-
-    if self.foreign_keys:
-      self.conn.execute("PRAGMA foreign_keys = ON")
-
-    if self.wal:
-      self.conn.execute("PRAGMA journal_mode=WAL")
-      self.conn.execute("PRAGMA synchronous=NORMAL")
+    if self.pooled:
+      self._pool = get_pool(self._pool_key(), self._connect, self._is_healthy)
+      self.conn = self._pool.acquire()
     else:
-      self.conn.execute("PRAGMA journal_mode=DELETE")
-
-    if self.spatial:
-      self.conn.enable_load_extension(True)
-      self.conn.load_extension(os.environ["SPATIALITE"])
-      self._ensure_spatial_metadata()
+      self.conn = self._connect()
 
     return self
 
@@ -63,24 +124,38 @@ class SqliteDatabase:
     if not self.conn:
       return False
 
+    discard = False
     try:
       if exc_type is None:
         self.conn.commit()
       else:
         self.conn.rollback()
+    except sqlite3.Error:
+      discard = True
+      raise
     finally:
-      self.conn.close()
+      if self._pool is not None:
+        self._pool.release(self.conn, discard)
+      else:
+        self.conn.close()
+
       self.conn = None
+      self._pool = None
 
-  def _check_connection(self):
-    if self.conn is None:
-      raise RuntimeError("Database not connected")
+  def _is_healthy(self, conn: sqlite3.Connection) -> bool:
+    try:
+      rows = conn.execute("PRAGMA database_list").fetchall()
+    except sqlite3.Error:
+      return False
+
+    return set(self.attach).issubset(row[1] for row in rows)
 
-  def _ensure_spatial_metadata(self):
+  def _check_connection(self):
     if self.conn is None:
       raise RuntimeError("Database not connected")
 
-    cursor = self.conn.cursor()
+  def _ensure_spatial_metadata(self, conn: sqlite3.Connection):
+    cursor = conn.cursor()
     cursor.execute("""
       SELECT name FROM sqlite_master
       WHERE type='table' AND name='spatial_ref_sys'
@@ -88,7 +163,7 @@ class SqliteDatabase:
     exists = cursor.fetchone() is not None
     if not exists:
       cursor.execute("SELECT InitSpatialMetaData(1)")
-      self.conn.commit()
+      conn.commit()
 
   @contextmanager
   def transaction(self):
@@ -118,8 +193,26 @@ class SqliteDatabase:
     for sql in table.add_geometry_sql():
       cursor.execute(sql)
 
+    self.create_spatial_indexes(table)
     return True
 
+  def create_spatial_indexes(self, table: type[Table]) -> list[str]:
+    self._check_connection()
+
+    table_name = table.table_name()
+    created: list[str] = []
+
+    cursor = self.conn.cursor()
+    for name in table.geometry_names():
+      if table_exists(self.conn, table.spatial_index_name(name)):
+        continue
+
+      # Also populates the R*Tree from existing rows
+      cursor.execute("SELECT CreateSpatialIndex(?, ?)", (table_name, name))
+      created.append(name)
+
+    return created
+
   def create_fts_table(self, table: type[Table], columns: Sequence[str]):
     self._check_connection()
 
@@ -199,7 +292,7 @@ class SqliteDatabase:
 
   def insert_models(
     self,
-    models: Sequence[type[Table]],
+    models: Union[Sequence[Table], RowBatch],
     conflict_index: Optional[str] = None,
     update_query: Optional[UpdateQuery] = None,
     returning: Optional[str] = None,
@@ -209,61 +302,100 @@ class SqliteDatabase:
     if not models:
       return
 
-    table = type(models[0])
-    table_name = table.table_name()
-    geometry_fields = table.geometry_fields()
-
-    rows = []
-    for obj in models:
-      row = {}
-      for name, field in obj._fields.items():
-        value = getattr(obj, name, None)
-        if isinstance(field, GeometryField):
-          row[name] = field.to_wkt(value)
-        else:
-          row[name] = field.serialize_to_sql(value)
-
-      rows.append(row)
-
-    columns = list(rows[0].keys())
-    placeholders = [
-      f"GeomFromText(:{col}, {geometry_fields[col].srid})"
-      if col in geometry_fields
-      else f":{col}"
-      for col in columns
-    ]
-
-    query = (
-      InsertQuery()
-      .into(table_name)
-      .columns(*columns)
-      .values_placeholders(*placeholders)
-    )
+    if isinstance(models, RowBatch):
+      table = models.table
+      rows = models.sql_rows()
+    else:
+      table = type(models[0])
+      rows = None
 
-    if conflict_index is not None:
-      query.on_conflict(conflict_index)
+    update_clauses = None
+    update_params: tuple[Any, ...] = ()
+    if conflict_index is not None and update_query is not None:
+      update_clauses = update_query.clauses()
+      update_params = tuple(update_query.params())
 
-      if update_query is None:
-        query.do_nothing()
-      else:
-        query.do_update(update_query)
+    if rows is None:
+      rows = compile_row_encoder(table)(models)
 
     if returning is not None:
-      query.returning(returning)
+      return self._insert_returning(
+        table, rows, conflict_index, update_clauses, update_params, returning
+      )
+
+    if update_params:
+      rows = (row + update_params for row in rows)
 
-    sql, _ = query.build()
+    plan = compile_insert_plan(table, conflict_index, update_clauses, None)
+    self.conn.cursor().executemany(plan.sql, rows)
+    return
 
+  def _insert_returning(
+    self,
+    table: type[Table],
+    rows: Iterable[tuple[SqliteValue, ...]],
+    conflict_index: Optional[str],
+    update_clauses: Optional[UpdateClauses],
+    update_params: tuple[Any, ...],
+    returning: str,
+  ) -> list[Any]:
+    # Rows are inserted with multi-row VALUES statements and the RETURNING
+    # rows, which SQLite emits in no particular order, are matched back to
+    # their input by key. A row whose key SQLite could change on the way in
+    # (NULL for an assigned rowid, a value converted by the column affinity)
+    # gets a statement of its own. Rows skipped by DO NOTHING get None.
     cursor = self.conn.cursor()
+    rows = list(rows)
+    results: list[Any] = [None] * len(rows)
+
+    columns = list(table._fields)
+    key_columns = returning_key_columns(table, conflict_index)
+    key_indexes = [columns.index(c) for c in key_columns]
+    key_types = [cast(ColumnType, table._fields[c].sql_type).value for c in key_columns]
+    key_count = len(key_columns)
+    returning_sql = ", ".join((*key_columns, returning))
+
+    max_rows = (variable_limit(self.conn) - len(update_params)) // len(columns)
+    if max_rows < 1:
+      raise ValueError(f"Too many columns to insert into {table.table_name()}")
+
+    single_plan = compile_insert_plan(table, conflict_index, update_clauses, returning)
+    batch: dict[tuple, int] = {}
+
+    def insert_batch():
+      positions = list(batch.values())
+      start = 0
+      for size in statement_sizes(len(positions), max_rows):
+        plan = compile_insert_plan(
+          table, conflict_index, update_clauses, returning_sql, size
+        )
+        params = [value for i in positions[start : start + size] for value in rows[i]]
+        params.extend(update_params)
+        start += size
 
-    if returning is not None:
-      results = []
-      for row in rows:
-        cursor.execute(sql, row)
-        results.append(cursor.fetchone())
-      return results
+        for result in cursor.execute(plan.sql, params):
+          position = batch.get(tuple(result[:key_count]))
+          if position is not None:
+            results[position] = tuple(result[key_count:])
 
-    self.conn.cursor().executemany(sql, rows)
-    return
+      batch.clear()
+
+    for position, row in enumerate(rows):
+      key = tuple(row[i] for i in key_indexes)
+      if key_columns and all(type(v) is t for v, t in zip(key, key_types)):
+        # A key repeated within one statement could not be told apart
+        if key in batch:
+          insert_batch()
+
+        batch[key] = position
+        continue
+
+      insert_batch()
+      cursor.execute(single_plan.sql, row + update_params)
+      results[position] = cursor.fetchone()
+
+    insert_batch()
+    return results
 
   def select_records(self, query: SelectQuery) -> list[dict[str, SqliteValue]]:
     sql, params = query.build()
@@ -275,49 +407,21 @@ class SqliteDatabase:
   def select_model_records(
     self, table: type[Table], query: SelectQuery, to_json: bool = False
   ) -> list[dict[str, SqliteValue]]:
-    columns = query.columns
+    decode_rows = compile_row_decoder(table, tuple(query.columns), to_json)
     sql, params = query.build()
     cursor = self.conn.cursor()
-    rows = cursor.execute(sql, params).fetchall()
-    geo_regex = re.compile("^As(GeoJSON|Text)")
-
-    column_info: list[tuple[str, Union[Field, GeometryField, None], bool, str]] = []
-    for name, alias in columns:
-      col = alias or name
-      field = table._fields.get(col)
-      is_geo = isinstance(field, GeometryField)
-      geo_format = ""
-      if not is_geo:
-        column_info.append((col, field, is_geo, geo_format))
-        continue
-
-      regex_match = geo_regex.search(name)
-      if regex_match is not None:
-        geo_format = regex_match.group()
-
-      column_info.append((col, field, is_geo, geo_format))
-
-    result: list[dict[str, SqliteValue]] = []
-    for row in rows:
-      result_row = {}
-      for i, (col, field, is_geo, geo_format) in enumerate(column_info):
-        raw = row[i]
-        if field is None:
-          result_row[col] = raw
-          continue
-
-        if is_geo:
-          value = json.loads(raw) if geo_format == "AsGeoJSON" else raw
-        else:
-          value = field.deserialize_from_sql(raw)
-
-        result_row[col] = field.serialize_to_json(value) if to_json else value
-
-      result.append(result_row)
-
-    return result
+    return decode_rows(cursor.execute(sql, params).fetchall())
 
-  def delete_by_ids(self, table: type[Table], ids: list[Any]) -> int:
+  def delete_by_ids(
+    self,
+    table: type[Table],
+    ids: Sequence[Any],
+    cascade: Sequence[type[Table]] = (),
+  ) -> int:
+    # Every chunk of ids is bound as a single value: blob ids concatenated
+    # into one blob, other ids as a JSON array. Rows of the cascade tables
+    # that reference the deleted rows are removed first, set-wise, instead
+    # of by the per-row foreign key actions.
     self._check_connection()
 
     table_name = table.table_name()
@@ -334,33 +438,30 @@ class SqliteDatabase:
     if pk_field is None or pk_name is None:
       raise ValueError(f"{table.__name__} has no primary key field")
 
-    id_type = pk_field.sql_column_type()
-
-    cursor = self.conn.cursor()
-
-    cursor.execute(f"""
-      CREATE TEMPORARY TABLE IF NOT EXISTS temp_delete_ids (
-        id {id_type}
-      )
-    """)
+    targets = [(child, _foreign_key_column(child, table_name)) for child in cascade]
+    targets.append((table, pk_name))
 
-    cursor.execute("DELETE FROM temp_delete_ids")
-
-    serialized_ids = []
-    for i in ids:
-      serialized = pk_field.serialize_to_sql(i)
-      serialized_ids.append((serialized,))
-
-    cursor.executemany("INSERT INTO temp_delete_ids (id) VALUES (?)", serialized_ids)
+    serialized_ids = [pk_field.serialize_to_sql(i) for i in ids]
+    id_sets = (
+      _blob_id_sets(serialized_ids)
+      if pk_field.sql_type == ColumnType.BLOB
+      else _json_id_sets(serialized_ids)
+    )
 
-    cursor.execute(f"""
-      DELETE FROM {table_name}
-      WHERE {pk_name} IN (SELECT id FROM temp_delete_ids)
-    """)
+    cursor = self.conn.cursor()
+    rows_deleted = 0
+    for select_sql, params in id_sets:
+      for target, column in targets:
+        sql, _ = (
+          DeleteQuery()
+          .from_(target.table_name())
+          .where(f"{column} IN ({select_sql})")
+          .build()
+        )
+        cursor.execute(sql, params)
 
-    rows_deleted = cursor.rowcount
+      rows_deleted += cursor.rowcount
 
-    cursor.execute("DROP TABLE temp_delete_ids")
     return rows_deleted
 
   def convert_geometry(
@@ -539,3 +640,37 @@ def insert_records(
   sql = f"INSERT INTO {table} ({columns_sql}) VALUES ({placeholder_sql})"
 
   db.cursor().executemany(sql, rows)
+
+
+def _foreign_key_column(child: type[Table], parent_table: str) -> str:
+  for name, field in child._fields.items():
+    if field.foreign_key is not None and field.foreign_key.table == parent_table:
+      return name
+
+  raise ValueError(f"{child.__name__} has no foreign key to {parent_table}")
+
+
+def _blob_id_sets(ids: list[bytes]) -> Iterator[IdSet]:
+  # Ids of one width are concatenated and split again by a recursive CTE
+  by_width: dict[int, list[bytes]] = defaultdict(list)
+  for i in ids:
+    by_width[len(i)].append(i)
+
+  # The CTE stays inside the subquery: the sqlite3 module only reports a
+  # rowcount for statements that start with DELETE
+  select_sql = (
+    "WITH RECURSIVE delete_offsets(n) AS "
+    "(SELECT 0 UNION ALL SELECT n + 1 FROM delete_offsets WHERE n + 1 < ?) "
+    "SELECT substr(?, n * ? + 1, ?) FROM delete_offsets"
+  )
+
+  for width, group in by_width.items():
+    for start in range(0, len(group), DELETE_CHUNK_SIZE):
+      chunk = group[start : start + DELETE_CHUNK_SIZE]
+      yield select_sql, [len(chunk), b"".join(chunk), width, width]
+
+
+def _json_id_sets(ids: list[Any]) -> Iterator[IdSet]:
+  for start in range(0, len(ids), DELETE_CHUNK_SIZE):
+    chunk = ids[start : start + DELETE_CHUNK_SIZE]
+    yield "SELECT value FROM json_each(?)", [json.dumps(chunk)]
@@ -0,0 +1,152 @@
+import sqlite3
+from functools import lru_cache
+from operator import attrgetter
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Optional
+
+from src.sqlite.query_builder import InsertQuery, UpdateQuery, WhereOp
+from src.sqlite.table import GeometryField, SqliteValue, Table
+
+PLAN_CACHE_SIZE = 256
+
+# SQLITE_MAX_VARIABLE_NUMBER defaults to 32766 since SQLite 3.32 and to 999
+# before; Connection.getlimit() reports the actual limit from Python 3.11 on
+DEFAULT_VARIABLE_LIMIT = 32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999
+
+UpdateClauses = tuple[tuple[str, ...], tuple[tuple[str, WhereOp], ...]]
+RowEncoder = Callable[[Iterable[Table]], Iterator[tuple[SqliteValue, ...]]]
+
+
+class InsertPlan(NamedTuple):
+  sql: str
+  encode_rows: RowEncoder
+
+
+def _column_expression(
+  index: int, table: type[Table], name: str, namespace: dict[str, Any]
+) -> str:
+  field = table._fields[name]
+  raw = f"c{index}"
+
+  if isinstance(field, GeometryField):
+    namespace[f"_to_wkt{index}"] = field.to_wkt
+    return f"_to_wkt{index}({raw})"
+
+  expression = raw
+  if field.to_sql is not None:
+    namespace[f"_to_sql{index}"] = field.to_sql
+    expression = f"_to_sql{index}({raw})"
+
+  # The rowid alias may be None, SQLite assigns it
+  if not field.nullable and name != table.rowid_alias():
+    namespace[f"_not_null{index}"] = field.validate_nullability
+    return f"({expression} if {raw} is not None else _not_null{index}(None))"
+
+  if expression != raw:
+    return f"({expression} if {raw} is not None else None)"
+
+  return raw
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def compile_row_encoder(table: type[Table]) -> RowEncoder:
+  # Generates a generator function that reads every field of a model in one
+  # attrgetter call and yields the serialized values as a positional tuple
+  names = tuple(table._fields)
+  namespace: dict[str, Any] = {"_get": attrgetter(*names)}
+  items = [
+    _column_expression(i, table, name, namespace) for i, name in enumerate(names)
+  ]
+
+  targets = (
+    "c0" if len(names) == 1 else f"({', '.join(f'c{i}' for i in range(len(names)))})"
+  )
+  source = (
+    "def encode_rows(models):\n"
+    f"  for {targets} in map(_get, models):\n"
+    f"    yield ({''.join(f'{item}, ' for item in items)})\n"
+  )
+
+  exec(compile(source, f"<row encoder {table.table_name()}>", "exec"), namespace)
+  return namespace["encode_rows"]
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def compile_insert_plan(
+  table: type[Table],
+  conflict_index: Optional[str],
+  update_clauses: Optional[UpdateClauses],
+  returning: Optional[str],
+  rows: int = 1,
+) -> InsertPlan:
+  geometry_fields = table.geometry_fields()
+  columns = list(table._fields)
+  placeholders = [
+    f"GeomFromText(?, {geometry_fields[col].srid})" if col in geometry_fields else "?"
+    for col in columns
+  ]
+
+  query = InsertQuery().into(table.table_name()).columns(*columns)
+  for _ in range(rows):
+    query.values_placeholders(*placeholders)
+
+  if conflict_index is not None:
+    query.on_conflict(conflict_index)
+
+    if update_clauses is None:
+      query.do_nothing()
+    else:
+      # The update values are bound once, after the values of every row
+      assignments, conditions = update_clauses
+      update = UpdateQuery()
+      for assignment in assignments:
+        update.set_raw(assignment)
+      for condition, op in conditions:
+        update.where(condition, op=op)
+
+      query.do_update(update)
+
+  if returning is not None:
+    query.returning(returning)
+
+  sql, _ = query.build()
+  return InsertPlan(sql, compile_row_encoder(table))
+
+
+def variable_limit(conn: sqlite3.Connection) -> int:
+  getlimit = getattr(conn, "getlimit", None)
+  if getlimit is None:
+    return DEFAULT_VARIABLE_LIMIT
+
+  return getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+
+
+def statement_sizes(total: int, max_rows: int) -> Iterator[int]:
+  # Full statements of max_rows, then the remainder in descending powers of
+  # two, so that a table needs at most log2(max_rows) + 1 distinct statements
+  while total >= max_rows:
+    yield max_rows
+    total -= max_rows
+
+  size = 1 << (total.bit_length() - 1) if total else 0
+  while size:
+    if total & size:
+      yield size
+    size >>= 1
+
+
+def returning_key_columns(
+  table: type[Table], conflict_index: Optional[str]
+) -> tuple[str, ...]:
+  # Columns that identify an inserted or updated row, used to match RETURNING
+  # rows (which SQLite emits in no particular order) to their input rows
+  if conflict_index is not None:
+    columns = tuple(c.strip() for c in conflict_index.split(","))
+  else:
+    columns = table.primary_key_columns()
+
+  # Geometries are returned in SpatiaLite's blob format, not as inserted
+  fields = table._fields
+  if not all(c in fields and not isinstance(fields[c], GeometryField) for c in columns):
+    return ()
+
+  return columns
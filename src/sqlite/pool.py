@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Hashable, Optional, TypedDict
+
+DEFAULT_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "16"))
+DEFAULT_POOL_TIMEOUT = 10.0
+HEALTH_CHECK_IDLE_SECONDS = 30.0
+
+
+@dataclass
+class PoolCounters:
+  hits: int = 0
+  misses: int = 0
+  waits: int = 0
+  wait_time: float = 0.0
+  timeouts: int = 0
+  discarded: int = 0
+
+
+class PoolStats(TypedDict):
+  key: str
+  size: int
+  idle: int
+  max_size: int
+  hits: int
+  misses: int
+  waits: int
+  wait_time: float
+  timeouts: int
+  discarded: int
+
+
+class ConnectionPool:
+  def __init__(
+    self,
+    key: Hashable,
+    connect: Callable[[], sqlite3.Connection],
+    max_size: int = DEFAULT_POOL_SIZE,
+    timeout: float = DEFAULT_POOL_TIMEOUT,
+    health_check: Optional[Callable[[sqlite3.Connection], bool]] = None,
+  ):
+    if max_size < 1:
+      raise ValueError("max_size must be a positive integer")
+
+    self.key = key
+    self.max_size = max_size
+    self.timeout = timeout
+    self._connect = connect
+    self._health_check = health_check or ping
+    self._idle: list[tuple[sqlite3.Connection, float]] = []
+    self._size = 0
+    self._closed = False
+    self._cond = threading.Condition()
+    self._counters = PoolCounters()
+
+  def _is_healthy(self, conn: sqlite3.Connection, released_at: float) -> bool:
+    if time.monotonic() - released_at < HEALTH_CHECK_IDLE_SECONDS:
+      return True
+
+    return self._health_check(conn)
+
+  def _discard(self, conn: sqlite3.Connection):
+    self._size -= 1
+    self._counters.discarded += 1
+    close_quietly(conn)
+
+  def acquire(self) -> sqlite3.Connection:
+    start = time.perf_counter()
+    deadline = start + self.timeout
+    waited = False
+
+    with self._cond:
+      while True:
+        if self._closed:
+          raise RuntimeError(f"Connection pool {self.key!r} is closed")
+
+        while self._idle:
+          conn, released_at = self._idle.pop()
+          if self._is_healthy(conn, released_at):
+            self._counters.hits += 1
+            self._record_wait(waited, start)
+            return conn
+
+          self._discard(conn)
+
+        if self._size < self.max_size:
+          self._size += 1
+          self._counters.misses += 1
+          self._record_wait(waited, start)
+          break
+
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+          self._counters.timeouts += 1
+          raise TimeoutError(
+            f"Timed out waiting for a connection from pool {self.key!r}"
+          )
+
+        waited = True
+        self._cond.wait(remaining)
+
+    try:
+      return self._connect()
+    except Exception:
+      with self._cond:
+        self._size -= 1
+        self._cond.notify()
+      raise
+
+  def _record_wait(self, waited: bool, start: float):
+    if not waited:
+      return
+
+    self._counters.waits += 1
+    self._counters.wait_time += time.perf_counter() - start
+
+  def release(self, conn: sqlite3.Connection, discard: bool = False):
+    if not discard:
+      try:
+        if conn.in_transaction:
+          conn.rollback()
+        conn.row_factory = None
+      except sqlite3.Error:
+        discard = True
+
+    with self._cond:
+      if discard or self._closed:
+        self._discard(conn)
+      else:
+        self._idle.append((conn, time.monotonic()))
+
+      self._cond.notify()
+
+  def close(self):
+    with self._cond:
+      self._closed = True
+      while self._idle:
+        conn, _ = self._idle.pop()
+        self._discard(conn)
+
+      self._cond.notify_all()
+
+  def stats(self) -> PoolStats:
+    with self._cond:
+      return PoolStats(
+        key=repr(self.key),
+        size=self._size,
+        idle=len(self._idle),
+        max_size=self.max_size,
+        **asdict(self._counters),
+      )
+
+
+def ping(conn: sqlite3.Connection) -> bool:
+  try:
+    conn.execute("SELECT 1").fetchone()
+    return True
+  except sqlite3.Error:
+    return False
+
+
+def close_quietly(conn: sqlite3.Connection):
+  try:
+    conn.close()
+  except sqlite3.Error:
+    pass
+
+
+_pools: dict[Hashable, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(
+  key: Hashable,
+  connect: Callable[[], sqlite3.Connection],
+  health_check: Optional[Callable[[sqlite3.Connection], bool]] = None,
+) -> ConnectionPool:
+  pool = _pools.get(key)
+  if pool is not None:
+    return pool
+
+  with _pools_lock:
+    pool = _pools.get(key)
+    if pool is None:
+      pool = ConnectionPool(key, connect, health_check=health_check)
+      _pools[key] = pool
+
+    return pool
+
+
+def pool_stats() -> list[PoolStats]:
+  with _pools_lock:
+    pools = list(_pools.values())
+
+  return [pool.stats() for pool in pools]
+
+
+def close_pools():
+  with _pools_lock:
+    pools = list(_pools.values())
+    _pools.clear()
+
+  for pool in pools:
+    pool.close()
@@ -103,6 +103,14 @@ class UpdateQuery:
     self._returning.extend(cols)
     return self
 
+  def clauses(self) -> tuple[tuple[str, ...], tuple[tuple[str, WhereOp], ...]]:
+    # The assignment and condition SQL without values, e.g. to key cached
+    # statements; the values are returned by params()
+    return tuple(self._set), tuple(self._where)
+
+  def params(self) -> list[Any]:
+    return [*self._set_params, *self._where_params]
+
   def _build_set_clause(self) -> tuple[str, list[Any]]:
     if not self._set:
       raise ValueError("No columns to update")
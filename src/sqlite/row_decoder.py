@@ -0,0 +1,93 @@
+import json
+import re
+from functools import lru_cache
+from typing import Any, Callable, Optional
+
+from src.sqlite.table import Field, GeometryField, SqliteValue, Table
+
+GEO_FORMAT_REGEX = re.compile(r"^As(GeoJSON|Text)")
+
+DECODER_CACHE_SIZE = 512
+
+Column = tuple[str, Optional[str]]
+RowDecoder = Callable[[list[tuple]], list[dict[str, SqliteValue]]]
+
+
+def _null_error(column: str):
+  raise ValueError(f"Column {column} is non-nullable but received None")
+
+
+def _is_identity(field: Field) -> bool:
+  # TEXT and BLOB columns already return str and bytes, so python_type(raw)
+  # would only copy them. INTEGER and REAL columns may still return another
+  # storage class (e.g. text that did not convert), so they keep the cast.
+  if field.python_type not in (str, bytes) or field.sql_type is None:
+    return False
+
+  return field.python_type is field.sql_type.value
+
+
+def _column_expression(
+  index: int,
+  name: str,
+  key: str,
+  field: Optional[Field],
+  to_json: bool,
+  namespace: dict[str, Any],
+) -> str:
+  raw = f"c{index}"
+  if field is None:
+    return raw
+
+  conversions: list[str] = []
+  if isinstance(field, GeometryField):
+    geo_format = GEO_FORMAT_REGEX.search(name)
+    if geo_format is not None and geo_format.group() == "AsGeoJSON":
+      namespace["_loads"] = json.loads
+      conversions.append("_loads")
+  elif field.from_sql is not None:
+    namespace[f"_from_sql{index}"] = field.from_sql
+    conversions.append(f"_from_sql{index}")
+  elif not _is_identity(field):
+    namespace[f"_type{index}"] = field.python_type
+    conversions.append(f"_type{index}")
+
+  if to_json and field.to_json is not None:
+    namespace[f"_to_json{index}"] = field.to_json
+    conversions.append(f"_to_json{index}")
+
+  expression = raw
+  for conversion in conversions:
+    expression = f"{conversion}({expression})"
+
+  if to_json and not field.nullable:
+    return f"({expression} if {raw} is not None else _null_error({key!r}))"
+
+  if conversions:
+    return f"({expression} if {raw} is not None else None)"
+
+  return raw
+
+
+@lru_cache(maxsize=DECODER_CACHE_SIZE)
+def compile_row_decoder(
+  table: type[Table], columns: tuple[Column, ...], to_json: bool
+) -> RowDecoder:
+  # Generates a function that turns fetched rows into dicts in a single
+  # comprehension, with the conversions of every column inlined
+  namespace: dict[str, Any] = {"_null_error": _null_error}
+  items: list[str] = []
+  for i, (name, alias) in enumerate(columns):
+    key = alias or name
+    field = table._fields.get(key)
+    expression = _column_expression(i, name, key, field, to_json, namespace)
+    items.append(f"{key!r}: {expression}")
+
+  targets = "".join(f"c{i}, " for i in range(len(columns)))
+  source = (
+    "def decode_rows(rows):\n"
+    f"  return [{{{', '.join(items)}}} for ({targets}) in rows]\n"
+  )
+
+  exec(compile(source, f"<row decoder {table.table_name()}>", "exec"), namespace)
+  return namespace["decode_rows"]
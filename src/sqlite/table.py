@@ -10,6 +10,8 @@ from typing import (
   Any,
   Callable,
   Generic,
+  Iterable,
+  Iterator,
   Literal,
   Optional,
   TypeVar,
@@ -149,7 +151,8 @@ class GeometryField(Field):
   srid: int = 4326
 
   def __post_init__(self):
-    super().__post_init__()
+    # Zero-argument super() breaks on slotted dataclasses
+    Field.__post_init__(self)
     if self.geometry_type is None:
       raise ValueError("GeometryField requires a geomtry_type")
 
@@ -195,9 +198,31 @@ class TableMeta(type):
         del attributes[k]
 
     attributes["_fields"] = fields
+    attributes.setdefault("__slots__", tuple(fields))
+    if fields:
+      attributes["__init__"] = _make_init(name, fields)
+
     return super().__new__(cls, name, bases, attributes)
 
 
+def _make_init(
+  class_name: str, fields: dict[str, Union[Field, GeometryField]]
+) -> Callable[..., None]:
+  # Generates __init__(self, field_1=default_1, ...) assigning every field
+  # in declaration order, so rows can be built positionally
+  namespace: dict[str, Any] = {}
+  params: list[str] = []
+  body: list[str] = []
+  for i, name in enumerate(fields):
+    namespace[f"_default{i}"] = fields[name].default
+    params.append(f"{name}=_default{i}")
+    body.append(f"  self.{name} = {name}\n")
+
+  source = f"def __init__(self, {', '.join(params)}):\n{''.join(body)}"
+  exec(compile(source, f"<{class_name} __init__>", "exec"), namespace)
+  return namespace["__init__"]
+
+
 class Table(metaclass=TableMeta):
   _table_name: Optional[str] = None
   _fields: dict[str, Union[Field, GeometryField]] = {}
@@ -238,6 +263,16 @@ class Table(metaclass=TableMeta):
     primary_keys = cls.primary_key_columns()
     return primary_keys[0] if len(primary_keys) == 1 else None
 
+  @classmethod
+  def rowid_alias(cls) -> Union[str, None]:
+    # A single INTEGER PRIMARY KEY aliases the rowid, which SQLite assigns
+    # when the column is inserted as NULL
+    name = cls.rowid()
+    if name is None or cls._without_rowid:
+      return None
+
+    return name if cls._fields[name].sql_type == ColumnType.INTEGER else None
+
   @classmethod
   def create_table_sql(cls) -> str:
     table_name = cls.table_name()
@@ -298,6 +333,35 @@ class Table(metaclass=TableMeta):
 
     return sql
 
+  @classmethod
+  def spatial_index_name(cls, column: str) -> str:
+    return f"idx_{cls.table_name()}_{column}"
+
+  @classmethod
+  def spatial_filter_sql(
+    cls,
+    column: str,
+    search_frame: str,
+    alias: Optional[str] = None,
+    db_alias: Optional[str] = None,
+  ) -> str:
+    table_name = cls.table_name()
+    if db_alias is not None:
+      f_table_name = f"DB={db_alias}.{table_name}"
+      rowid = f"{alias or f'{db_alias}.{table_name}'}.rowid"
+    else:
+      f_table_name = table_name
+      rowid = f"{alias or table_name}.rowid"
+
+    # search_frame must not reference the outer row, otherwise SQLite
+    # re-evaluates the R*Tree lookup for every candidate row
+    return (
+      f"{rowid} IN (SELECT rowid FROM SpatialIndex "
+      f"WHERE f_table_name = '{f_table_name}' "
+      f"AND f_geometry_column = '{column}' "
+      f"AND search_frame = {search_frame})"
+    )
+
   @classmethod
   def column_names(cls, exclude_geometry_fields: bool = False) -> list[str]:
     return [
@@ -344,19 +408,15 @@ class Table(metaclass=TableMeta):
     if columns is None:
       columns = list(cls._fields.keys())
 
-    obj = cls.__new__(cls)
-
+    values: dict[str, Any] = {}
     for i, name in enumerate(columns):
-      field = cls._fields[name]
-      raw = row[i]
-      value = field.deserialize_from_sql(raw)
-      setattr(obj, name, value)
+      values[name] = cls._fields[name].deserialize_from_sql(row[i])
 
-    return obj
+    return cls(**values)
 
   @classmethod
   def from_dict(cls, data: dict[str, Any], json: bool = False):
-    obj = cls.__new__(cls)
+    values: dict[str, Any] = {}
 
     for name, field in cls._fields.items():
       if name in data:
@@ -368,9 +428,80 @@ class Table(metaclass=TableMeta):
       else:
         value = None
 
-      setattr(obj, name, value)
+      values[name] = value
+
+    return cls(**values)
 
-    return obj
+
+def _sql_column(
+  field: Union[Field, GeometryField], values: list[Any], assigned: bool = False
+) -> list[Any]:
+  if isinstance(field, GeometryField):
+    return [field.to_wkt(v) for v in values]
+
+  if not field.nullable and not assigned and None in values:
+    field.validate_nullability(None)
+
+  to_sql = field.to_sql
+  if to_sql is None:
+    return values
+
+  return [None if v is None else to_sql(v) for v in values]
+
+
+class RowBatch:
+  # Column-oriented rows of a single table: one list per field, in field order.
+  # insert_models serializes whole columns instead of reading every attribute
+  # of every model.
+  __slots__ = ("table", "columns")
+
+  def __init__(self, table: type[Table]):
+    self.table = table
+    self.columns: dict[str, list[Any]] = {name: [] for name in table._fields}
+
+  def __len__(self) -> int:
+    return len(next(iter(self.columns.values()), ()))
+
+  def append(self, model: Table):
+    if type(model) is not self.table:
+      raise ValueError(
+        f"Expected {self.table.__name__} row, got {type(model).__name__}"
+      )
+
+    for name, column in self.columns.items():
+      column.append(getattr(model, name, None))
+
+  def append_row(self, *values: Any):
+    if len(values) != len(self.columns):
+      raise ValueError(
+        f"{self.table.__name__} row expects {len(self.columns)} values, "
+        f"got {len(values)}"
+      )
+
+    for column, value in zip(self.columns.values(), values):
+      column.append(value)
+
+  def extend(self, models: Iterable[Table]):
+    for model in models:
+      self.append(model)
+
+  def column(self, name: str) -> list[Any]:
+    return self.columns[name]
+
+  def clear(self):
+    # Fresh lists, so columns handed out by column() stay intact
+    self.columns = {name: [] for name in self.columns}
+
+  def sql_rows(self) -> Iterator[tuple]:
+    # Columns are serialized up front, rows are only assembled when iterated
+    fields = self.table._fields
+    rowid_alias = self.table.rowid_alias()
+    return zip(
+      *(
+        _sql_column(fields[name], column, name == rowid_alias)
+        for name, column in self.columns.items()
+      )
+    )
 
 
 def hash_field(primary: bool):
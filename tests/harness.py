@@ -0,0 +1,183 @@
+import random
+import sys
+import tempfile
+import time
+import timeit
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+from src.sqlite.connect import SqliteDatabase
+from src.sqlite.table import RowBatch, Table
+
+INSERT_BATCH_SIZE = 10_000
+
+START_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+BAND_STATISTICS = [
+  {
+    "data_type": "UInt16",
+    "color_interpretation": "Gray",
+    "min": 0,
+    "max": 4095,
+    "mean": 512.5,
+    "stddev": 120.25,
+  }
+]
+
+
+class Checks:
+  # Prints one status line per check and exits non-zero if any failed
+  def __init__(self, subject: str):
+    self.subject = subject
+    self.failures: list[str] = []
+
+  def check(self, name: str, passed: bool, detail: str = "") -> bool:
+    self.record(name, passed)
+    print(f"{'ok' if passed else 'FAILED':>9}  {name}{detail}")
+    return passed
+
+  def record(self, name: str, passed: bool) -> bool:
+    if not passed and name not in self.failures:
+      self.failures.append(name)
+    return passed
+
+  def exit(self):
+    if self.failures:
+      print(f"{self.subject} failed: {', '.join(self.failures)}")
+      sys.exit(1)
+
+
+def timed(fn: Callable[..., Any], *args: Any) -> tuple[float, Any]:
+  start = time.perf_counter()
+  result = fn(*args)
+  return time.perf_counter() - start, result
+
+
+def best_time(fn: Callable[[], Any], repeat: int = 5) -> float:
+  # Seconds per call, the best of repeat runs of as many calls as fit 0.2 s
+  timer = timeit.Timer(fn)
+  number, _ = timer.autorange()
+  return min(timer.repeat(repeat, number)) / number
+
+
+@contextmanager
+def open_database(
+  path: Path,
+  *tables: type[Table],
+  spatial: bool = False,
+  attach: Optional[dict[str, Path]] = None,
+  indexes: bool = True,
+) -> Iterator[SqliteDatabase]:
+  # Spatial indexes are always created; indexes=False skips the others
+  with SqliteDatabase(path, spatial=spatial, pooled=False, attach=attach) as db:
+    for table in tables:
+      db.create_table(table)
+      if indexes and table._indexes:
+        db.create_table_indexes(table)
+      db.create_spatial_indexes(table)
+    yield db
+
+
+@contextmanager
+def temp_database(
+  *tables: type[Table], spatial: bool = False, indexes: bool = True
+) -> Iterator[SqliteDatabase]:
+  with tempfile.TemporaryDirectory() as tmp:
+    path = Path(tmp) / "test.db"
+    with open_database(path, *tables, spatial=spatial, indexes=indexes) as db:
+      yield db
+
+
+def fill_table(
+  db: SqliteDatabase, table: type[Table], rows: Iterable[tuple[Any, ...]]
+) -> float:
+  # Inserts in batches and commits, returning the elapsed seconds
+  start = time.perf_counter()
+  batch = RowBatch(table)
+  for row in rows:
+    batch.append_row(*row)
+
+    if len(batch) == INSERT_BATCH_SIZE:
+      db.insert_models(batch)
+      batch.clear()
+
+  if len(batch):
+    db.insert_models(batch)
+
+  db.conn.commit()
+  return time.perf_counter() - start
+
+
+def box_wkt(x: float, y: float, width: float, height: float) -> str:
+  return (
+    f"POLYGON (({x} {y}, {x + width} {y}, {x + width} {y + height}, "
+    f"{x} {y + height}, {x} {y}))"
+  )
+
+
+def random_box(rng: random.Random, size: float) -> str:
+  x = rng.uniform(-180, 180 - size)
+  y = rng.uniform(-85, 85 - size)
+  return box_wkt(x, y, rng.uniform(0.01, size), rng.uniform(0.01, size))
+
+
+def grid_box(i: int, size: float = 1.0) -> str:
+  return box_wkt(i % 360 - 180, (i // 360) % 170 - 85, size, size)
+
+
+def grid_point(i: int) -> str:
+  return f"POINT ({i % 360 - 180} {(i // 360) % 170 - 85})"
+
+
+def image_id(i: int) -> bytes:
+  return i.to_bytes(32, "big")
+
+
+def image_values(
+  i: int,
+  catalog: uuid.UUID,
+  footprint: str,
+  collected: Optional[datetime] = None,
+) -> tuple[Any, ...]:
+  # ImageIndexTable fields, in order
+  return (
+    image_id(i),
+    catalog,
+    Path(f"sar/{i // 1000}"),
+    f"image_{i}",
+    "tif",
+    "UNCLASSIFIED",
+    collected or START_TIME + timedelta(minutes=i),
+    "sensor",
+    None,
+    None,
+    footprint,
+    30.0,
+    float(i % 360),
+    0.5,
+    0.5,
+    float(i % 9),
+    BAND_STATISTICS,
+  )
+
+
+def annotation_values(
+  i: int, image: bytes, geometry: str, attributes: list[uuid.UUID]
+) -> tuple[Any, ...]:
+  # Equipment annotation fields, in order; image_datetime is left to
+  # fill_image_datetimes
+  return (
+    uuid.UUID(int=i + 1),
+    image,
+    None,
+    geometry,
+    *attributes,
+    float(i % 360),
+    2.5,
+    "user",
+    None,
+    START_TIME,
+    None,
+  )
@@ -0,0 +1,68 @@
+from typing import Any, Callable
+
+from src.sqlite.connect import SqliteDatabase
+from src.sqlite.query_builder import UpdateQuery
+from src.sqlite.table import Field, Table
+from tests.harness import Checks, temp_database
+
+
+class CounterTable(Table):
+  _table_name = "counter"
+  id = Field(int, primary_key=True)
+  name = Field(str, nullable=False)
+
+
+class CodeTable(Table):
+  _table_name = "code"
+  _without_rowid = True
+  code = Field(int, primary_key=True)
+  label = Field(str, nullable=False)
+
+
+def check_assigned_ids(db: SqliteDatabase) -> bool:
+  rows = [CounterTable(None, "a"), CounterTable(10, "b"), CounterTable(None, "c")]
+  result = db.insert_models(rows, returning="id, name")
+  return result == [(1, "a"), (10, "b"), (11, "c")]
+
+
+def check_converted_keys(db: SqliteDatabase) -> bool:
+  # The INTEGER affinity stores the text '5' as 5
+  rows = [CodeTable("5", "five"), CodeTable(6, "six")]
+  result = db.insert_models(rows, returning="code, label")
+  return result == [(5, "five"), (6, "six")]
+
+
+def check_skipped_rows(db: SqliteDatabase) -> bool:
+  update_query = UpdateQuery().set_excluded("label").where("code.code > ?", 5)
+  rows = [CodeTable(5, "skipped"), CodeTable(6, "updated"), CodeTable(7, "new")]
+  result = db.insert_models(rows, "code", update_query, "label")
+
+  rows = [CodeTable(7, "kept"), CodeTable(8, "added")]
+  ignored = db.insert_models(rows, "code", returning="label")
+  return result == [None, ("updated",), ("new",)] and ignored == [None, ("added",)]
+
+
+def check_many_rows(db: SqliteDatabase) -> bool:
+  # More rows than fit into one statement, in descending key order
+  count = 40_000
+  rows = [CodeTable(i, f"row {i}") for i in range(count + 100, 100, -1)]
+  result = db.insert_models(rows, "code", UpdateQuery().set_excluded("label"), "code")
+  return result == [(row.code,) for row in rows]
+
+
+CHECKS: dict[str, Callable[[SqliteDatabase], Any]] = {
+  "assigned rowids": check_assigned_ids,
+  "keys converted by affinity": check_converted_keys,
+  "rows skipped on conflict": check_skipped_rows,
+  "multiple statements": check_many_rows,
+}
+
+
+if __name__ == "__main__":
+  checks = Checks("insert_models RETURNING")
+
+  with temp_database(CounterTable, CodeTable) as db:
+    for name, check in CHECKS.items():
+      checks.check(name, check(db))
+
+  checks.exit()
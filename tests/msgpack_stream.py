@@ -0,0 +1,213 @@
+import io
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Iterator
+from uuid import UUID
+
+from src.msgpack import (
+  ExtType,
+  OutOfData,
+  Unpacker,
+  decode_msgpack,
+  decode_msgpack_stream,
+  encode_msgpack,
+)
+from tests.harness import Checks
+
+SEED = 20240501
+ROUNDS = 200
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# One value per timestamp format: 32-bit seconds, 64-bit with nanoseconds and
+# 96-bit for times before the epoch or beyond 2514
+TIMESTAMPS = [
+  EPOCH + timedelta(seconds=1_700_000_000),
+  EPOCH + timedelta(seconds=1_700_000_000, microseconds=123_456),
+  EPOCH - timedelta(days=365, microseconds=1),
+  EPOCH + timedelta(days=200_000),
+]
+
+# Lengths that need the 32-bit headers
+LARGE_VALUES = [
+  "€" * 70_000,
+  bytes(70_000),
+  list(range(70_000)),
+  ExtType(3, bytes(70_000)),
+]
+
+
+def random_scalar(rng: random.Random) -> Any:
+  kind = rng.randrange(11)
+  if kind == 0:
+    return rng.choice([None, True, False])
+  if kind == 1:
+    return rng.randrange(-32, 128)
+  if kind == 2:
+    bits = rng.choice([8, 16, 32, 63])
+    return rng.randrange(-(1 << bits), 1 << bits)
+  if kind == 3:
+    return rng.randrange(1 << 63, 1 << 64)
+  if kind == 4:
+    return rng.uniform(-1e9, 1e9)
+  if kind == 5:
+    length = rng.choice([0, 5, 31, 32, 255, 256])
+    return ("abcæøå€😀" * length)[rng.randrange(8) :][:length]
+  if kind == 6:
+    return rng.randbytes(rng.choice([0, 3, 255, 256]))
+  if kind == 7:
+    return rng.choice(TIMESTAMPS)
+  if kind == 8:
+    return UUID(bytes=rng.randbytes(16))
+  if kind == 9:
+    length = rng.choice([1, 2, 4, 8, 16, 3, 300])
+    return ExtType(rng.randrange(2, 128), rng.randbytes(length))
+  return rng.random()
+
+
+def random_value(rng: random.Random, depth: int = 0) -> Any:
+  if depth > 3 or rng.random() < 0.3:
+    return random_scalar(rng)
+
+  length = rng.choice([0, 1, 2, 15, 16])
+  if rng.random() < 0.5:
+    return [random_value(rng, depth + 1) for _ in range(length)]
+
+  return {f"key {i}": random_value(rng, depth + 1) for i in range(length)}
+
+
+def deep_value(depth: int) -> Any:
+  value: Any = TIMESTAMPS[1]
+  for i in range(depth):
+    value = {"level": i, "child": [value, ExtType(5, b"x")]}
+  return value
+
+
+def chunks(data: bytes, rng: random.Random) -> Iterator[bytes]:
+  offset = 0
+  while offset < len(data):
+    size = rng.choice([1, 2, 3, 7, 64, 1024, 65_536])
+    yield data[offset : offset + size]
+    offset += size
+
+
+def same_value(value: Any, data: bytes) -> bool:
+  # Re-encoding compares without recursing over deep values
+  return encode_msgpack(value) == data
+
+
+def check_unpacker_chunks(rng: random.Random) -> bool:
+  values = [random_value(rng) for _ in range(ROUNDS)] + LARGE_VALUES
+  encoded = [encode_msgpack(value) for value in values]
+
+  unpacker = Unpacker()
+  decoded: list[Any] = []
+  for chunk in chunks(b"".join(encoded), rng):
+    unpacker.feed(chunk)
+    decoded.extend(unpacker)
+
+  return (
+    not unpacker.pending
+    and len(decoded) == len(encoded)
+    and all(same_value(v, data) for v, data in zip(decoded, encoded))
+  )
+
+
+def check_stream_chunks(rng: random.Random) -> bool:
+  for _ in range(ROUNDS):
+    data = encode_msgpack(random_value(rng))
+    chunk_size = rng.choice([1, 5, 100, 64 * 1024])
+    value = decode_msgpack_stream(io.BytesIO(data).read, len(data), chunk_size)
+    if not same_value(value, data):
+      return False
+
+  return True
+
+
+def check_truncated(rng: random.Random) -> bool:
+  for _ in range(ROUNDS // 4):
+    data = encode_msgpack(random_value(rng))
+    for cut in {0, len(data) - 1, rng.randrange(len(data))}:
+      prefix = data[:cut]
+
+      try:
+        decode_msgpack(prefix)
+        return False
+      except OutOfData:
+        pass
+
+      try:
+        decode_msgpack_stream(io.BytesIO(prefix).read, len(data), 7)
+        return False
+      except ValueError as e:
+        if "before Content-Length" not in str(e):
+          return False
+
+      # Feeding the rest afterwards still yields the value
+      unpacker = Unpacker()
+      unpacker.feed(prefix)
+      if list(unpacker):
+        return False
+      unpacker.feed(data[cut:])
+      if not same_value(unpacker.unpack(), data) or unpacker.pending:
+        return False
+
+  return True
+
+
+def check_extra_data(rng: random.Random) -> bool:
+  data = encode_msgpack(random_value(rng)) + b"\xc0"
+  try:
+    decode_msgpack_stream(io.BytesIO(data).read, len(data))
+  except ValueError as e:
+    return "Extra data" in str(e)
+
+  return False
+
+
+def check_deep_nesting(rng: random.Random) -> bool:
+  depth = sys.getrecursionlimit() * 5
+  data = encode_msgpack(deep_value(depth))
+
+  unpacker = Unpacker()
+  decoded: list[Any] = []
+  for chunk in chunks(data, rng):
+    unpacker.feed(chunk)
+    decoded.extend(unpacker)
+
+  value = decode_msgpack_stream(io.BytesIO(data).read, len(data), 3)
+  return len(decoded) == 1 and same_value(decoded[0], data) and same_value(value, data)
+
+
+def check_ext_types(rng: random.Random) -> bool:
+  values = [*TIMESTAMPS, UUID(int=1), ExtType(42, b""), ExtType(-2, bytes(300))]
+  data = encode_msgpack(values)
+
+  unpacker = Unpacker()
+  decoded: list[Any] = []
+  for chunk in chunks(data, rng):
+    unpacker.feed(chunk)
+    decoded.extend(unpacker)
+
+  return decoded == [values]
+
+
+CHECKS: dict[str, Callable[[random.Random], bool]] = {
+  "unpacker at random chunk boundaries": check_unpacker_chunks,
+  "stream at random chunk sizes": check_stream_chunks,
+  "truncated input": check_truncated,
+  "extra data": check_extra_data,
+  "deep nesting": check_deep_nesting,
+  "ext and timestamp types": check_ext_types,
+}
+
+
+if __name__ == "__main__":
+  seed = int(sys.argv[1]) if len(sys.argv) > 1 else SEED
+  checks = Checks(f"msgpack stream round trip (seed {seed})")
+
+  for name, check in CHECKS.items():
+    checks.check(name, check(random.Random(seed)))
+
+  checks.exit()
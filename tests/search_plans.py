@@ -0,0 +1,99 @@
+from typing import Iterator
+
+from src.bootstrap import get_settings, load_env
+from src.index.images import (
+  ImageIndexTable,
+  ImageQuery,
+  SearchCursor,
+  build_image_query,
+  keyset_conditions,
+)
+from src.sqlite.connect import SqliteDatabase
+from src.sqlite.query_builder import SelectQuery
+from tests.harness import Checks
+
+SEARCH_POLYGON = "POLYGON ((10 59, 11 59, 11 60, 10 60, 10 59))"
+
+# Search shapes that must be answered through an index rather than a full
+# scan of the images table
+SEARCH_SHAPES: dict[str, tuple[ImageQuery, bool]] = {
+  "filename": ({"filename": "image"}, False),
+  "date range": ({"date_start": 0, "date_end": 1}, False),
+  "min iirs": ({"min_iirs": 5.0}, False),
+  "max gsd": ({"max_gsd": 0.5}, False),
+  "azimuth range": ({"azimuth_start": 10.0, "azimuth_end": 20.0}, False),
+  "look angle": ({"lookangle_min": 5.0, "lookangle_max": 25.0}, False),
+  "order by date": ({"order_by": "datetime_collected", "ordering": "desc"}, False),
+  "order by gsd": ({"order_by": "ground_sample_distance"}, False),
+  "order by iirs": ({"order_by": "interpretation_rating"}, False),
+  "polygon": ({}, True),
+  "polygon and date range": ({"date_start": 0, "date_end": 1}, True),
+  "saved area": ({"area_id": "00000000-0000-0000-0000-000000000000"}, False),
+  "saved area by coverage": (
+    {"area_id": "00000000-0000-0000-0000-000000000000", "order_by": "coverage"},
+    False,
+  ),
+}
+
+# Follow-up pages of the ordered shapes, resumed from a cursor on the order
+# value (None for rows without one) and id
+KEYSET_SHAPES: dict[str, tuple[ImageQuery, object]] = {
+  "page by id": ({"ordering": "asc"}, None),
+  "page by date": ({"order_by": "datetime_collected", "ordering": "desc"}, 0),
+  "page by gsd": ({"order_by": "ground_sample_distance"}, 0.5),
+  "page by iirs after nulls": ({"order_by": "interpretation_rating"}, None),
+  "page by iirs into nulls": (
+    {"order_by": "interpretation_rating", "ordering": "desc"},
+    5.0,
+  ),
+}
+
+
+def is_full_scan(detail: str, table_name: str) -> bool:
+  return detail.startswith(f"SCAN {table_name}") and "USING" not in detail
+
+
+def search_queries() -> Iterator[tuple[str, SelectQuery]]:
+  for name, (payload, with_polygon) in SEARCH_SHAPES.items():
+    polygon_wkt = SEARCH_POLYGON if with_polygon else None
+    candidates = [bytes(32), bytes([1] * 32)] if with_polygon else None
+
+    yield name, build_image_query(polygon_wkt, payload, candidates)
+
+  for name, (payload, value) in KEYSET_SHAPES.items():
+    order_by = payload.get("order_by")
+    ordering = payload.get("ordering") or "asc"
+    cursor = SearchCursor(order_by, ordering, value, bytes(32))
+
+    conditions = keyset_conditions(order_by, ordering, cursor)
+    for i, (condition, params) in enumerate(conditions):
+      query = build_image_query(None, payload, None).where(condition, *params)
+      if order_by is None:
+        query.order_by(f"{ImageIndexTable.table_name()}.id", ordering)
+
+      yield f"{name} ({i + 1}/{len(conditions)})", query.limit(100)
+
+
+def check_search_plans(db: SqliteDatabase, checks: Checks):
+  table_name = ImageIndexTable.table_name()
+  cursor = db.conn.cursor()
+
+  for name, query in search_queries():
+    sql, params = query.build()
+    cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+    details = [row[3] for row in cursor.fetchall()]
+
+    checks.check(name, not any(is_full_scan(d, table_name) for d in details))
+    for detail in details:
+      print(f"           {detail}")
+
+
+if __name__ == "__main__":
+  load_env()
+  app_settings = get_settings()
+  checks = Checks("Search without full table scans")
+
+  with SqliteDatabase(app_settings.INDEX_DB, spatial=True) as db:
+    check_search_plans(db, checks)
+
+  checks.exit()